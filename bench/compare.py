@@ -0,0 +1,134 @@
+"""
+Compares the results of two benchmark runs, matching the runs by scenario and parameters.
+
+    python bench/compare.py baseline.json candidate.json --threshold 10
+
+Throughput metrics (…_per_second) are better when higher. Latencies (…_ms) and the counts of
+queries, calls, requests and errors are better when lower. A metric that got worse by more
+than the threshold percentage is a regression, and the exit code is 1 if there are any.
+"""
+import sys
+import json
+import argparse
+from typing import Dict, Iterator, Optional, Tuple
+
+LOWER_IS_BETTER = ("_ms", "queries", "calls", "requests", "errors", "refused", "retry_afters")
+
+
+def _key(result: dict) -> Tuple[str, str]:
+    return result["scenario"], json.dumps(result["params"], sort_keys=True)
+
+
+def _flatten(metrics: dict, prefix: str = "") -> Iterator[Tuple[str, float]]:
+    for name, value in metrics.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{name}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{name}", value
+
+
+def direction(metric: str) -> int:
+    """1 if a higher value is better, -1 if a lower value is better, 0 if it's informational."""
+    name = metric.rsplit(".", 1)[-1]
+    if name.endswith("_per_second"):
+        return 1
+    if name == "count":
+        return 0
+    if any(part in name for part in LOWER_IS_BETTER):
+        return -1
+    return 0
+
+
+def change(baseline: float, candidate: float) -> Optional[float]:
+    """The percentage change from the baseline, None if the baseline is 0."""
+    if baseline == 0:
+        return None if candidate else 0.0
+    return (candidate - baseline) / abs(baseline) * 100
+
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> dict:
+    """
+    Compares every metric of the runs found in both documents.
+
+    Returns:
+        a dict with the rows of the comparison, the regressions and the unmatched runs
+    """
+    before: Dict[Tuple[str, str], dict] = {_key(r): r for r in baseline["results"]}
+    after: Dict[Tuple[str, str], dict] = {_key(r): r for r in candidate["results"]}
+    rows, regressions = [], []
+
+    for key in before.keys() & after.keys():
+        old, new = before[key], after[key]
+        if old["status"] != "ok" or new["status"] != "ok":
+            continue
+
+        new_metrics = dict(_flatten(new["metrics"]))
+        for metric, old_value in _flatten(old["metrics"]):
+            if metric not in new_metrics:
+                continue
+
+            new_value = new_metrics[metric]
+            percent = change(old_value, new_value)
+            row = {
+                "scenario": key[0],
+                "params": json.loads(key[1]),
+                "metric": metric,
+                "baseline": old_value,
+                "candidate": new_value,
+                "change_percent": None if percent is None else round(percent, 2),
+            }
+            rows.append(row)
+
+            worse = percent is not None and direction(metric) * percent < -threshold
+            if worse:
+                regressions.append(row)
+
+    return {
+        "rows": sorted(rows, key=lambda row: (row["scenario"], json.dumps(row["params"]))),
+        "regressions": regressions,
+        "only_in_baseline": len(before.keys() - after.keys()),
+        "only_in_candidate": len(after.keys() - before.keys()),
+    }
+
+
+def _swept(params: dict) -> str:
+    return " ".join(f"{name}={params[name]}" for name in ("handles", "watchers", "tweet_rate"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares two benchmark results.")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10, help="percent allowed to regress")
+    parser.add_argument("--json", action="store_true", help="print the comparison as JSON")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    result = compare(baseline, candidate, args.threshold)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        regressed = {id(row) for row in result["regressions"]}
+        for row in result["rows"]:
+            percent = row["change_percent"]
+            percent = "n/a" if percent is None else f"{percent:+.1f}%"
+            flag = "  REGRESSION" if id(row) in regressed else ""
+            print(
+                f"{row['scenario']:<9} {_swept(row['params']):<40} {row['metric']:<36} "
+                f"{row['baseline']:>12.3f} {row['candidate']:>12.3f} {percent:>9}{flag}"
+            )
+
+        unmatched = result["only_in_baseline"] + result["only_in_candidate"]
+        if unmatched:
+            print(f"{unmatched} runs were only found in one of the results", file=sys.stderr)
+
+    sys.exit(1 if result["regressions"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+"""
+Local stand-ins for the Twitter API, the Telegram Bot API and the db_api, used by the benchmarks.
+
+None of them make network requests, so a benchmark measures the bots rather than Twitter or
+Telegram. Each records the calls made to it so they can be reported alongside the timings.
+"""
+import re
+import time
+import random
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+
+# Tweet IDs are snowflakes, the milliseconds since this epoch shifted left by 22 bits
+TWITTER_EPOCH_MS = 1288834974657
+
+
+class FakeResponse:
+    """The parts of a tweepy response read by the rate limit manager."""
+
+    def __init__(self, status_code: int, headers: Optional[Dict[str, str]] = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeRateLimitError(Exception):
+    pass
+
+
+class FakeTweet:
+    """The parts of a tweepy Status read by the bots."""
+
+    def __init__(self, id: int, screen_name: str, created_at: datetime):
+        self.id = id
+        self.id_str = str(id)
+        self.created_at = created_at
+        self.user = FakeUser(screen_name)
+
+
+class FakeUser:
+    def __init__(self, screen_name: str):
+        self.screen_name = screen_name
+
+
+class FakeTwitterAPI:
+    """
+    A stand-in for tweepy.API's user_timeline and search_tweets.
+
+    Every handle tweets at tweet_rate tweets per simulated second. The simulated clock only
+    moves when advance is called, so the number of new tweets in a cycle doesn't depend on how
+    long the cycle took. Each handle starts with a history of tweets, so it can be seeded, the
+    newest of which was posted when the fake was created. Tweet IDs are snowflakes, so the time
+    a tweet was posted can be read from its ID as with the real API.
+
+    Like recent search, search_tweets only finds the tweets posted within search_window_seconds
+    of the simulated clock.
+
+    Each endpoint allows rate_limit requests per window_seconds of real time, reported in the
+    x-rate-limit-* headers of last_response like the real API. A request over the limit gets a
+    429 and raises FakeRateLimitError.
+    """
+
+    def __init__(
+        self,
+        tweet_rate: float = 0.01,
+        latency_seconds: float = 0.0,
+        rate_limit: Optional[int] = None,
+        window_seconds: float = 900,
+        history: int = 20,
+        search_window_seconds: float = 7 * 24 * 3600,
+    ):
+        """
+        Parameters:
+            tweet_rate (float): the tweets per simulated second from each handle
+            latency_seconds (float): how long each request takes
+            rate_limit (int | None): the requests allowed per window for each endpoint, or None
+            window_seconds (float): the length of a rate limit window
+            history (int): the number of tweets each handle has already posted
+            search_window_seconds (float): how far back search_tweets finds tweets
+        """
+        self.tweet_rate = tweet_rate
+        self.latency_seconds = latency_seconds
+        self.rate_limit = rate_limit
+        self.window_seconds = window_seconds
+        self.history = history
+        self.search_window_seconds = search_window_seconds
+
+        self.now = 0.0
+        self._started_ms = int(time.time() * 1000) - TWITTER_EPOCH_MS
+        self._interval_ms = max(1, int(1000 / max(tweet_rate, 1e-6)))
+        # Kept per thread, as the bots give each thread its own tweepy API
+        self._local = threading.local()
+        self.calls: Counter = Counter()
+        self.refused: Counter = Counter()
+
+        self._indexes: Dict[str, int] = {}
+        self._windows: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def last_response(self) -> Optional[FakeResponse]:
+        return getattr(self._local, "response", None)
+
+    @last_response.setter
+    def last_response(self, response: Optional[FakeResponse]) -> None:
+        self._local.response = response
+
+    def advance(self, seconds: float) -> None:
+        """Moves the simulated clock forward, new tweets are posted in the meantime."""
+        with self._lock:
+            self.now += seconds
+
+    def _index(self, handle: str) -> int:
+        """A stable number for the handle, the lock must be held."""
+        key = handle.lower()
+        if key not in self._indexes:
+            self._indexes[key] = len(self._indexes)
+        return self._indexes[key]
+
+    def tweet_id(self, handle: str, number: int) -> int:
+        """The ID of the handle's tweet with the given number, counting from 1."""
+        with self._lock:
+            return self._tweet_id(number, self._index(handle))
+
+    def _tweet_id(self, number: int, index: int) -> int:
+        posted_ms = self._started_ms + (number - self.history) * self._interval_ms
+        return (posted_ms << 22) | index
+
+    def _tweet_number(self, tweet_id: int) -> int:
+        return ((tweet_id >> 22) - self._started_ms) // self._interval_ms + self.history
+
+    def _tweets(
+        self, handle: str, since_id: Optional[int], max_id: Optional[int], count: int
+    ) -> List[FakeTweet]:
+        """The handle's tweets between the IDs, newest first, the lock must be held."""
+        index = self._index(handle)
+        # Each handle is offset by its own phase, so the handles don't all tweet at once
+        phase = (index * 0.618) % 1
+        posted = self.history + int(self.now * self.tweet_rate + phase)
+        newest = posted if max_id is None else min(posted, self._tweet_number(max_id))
+
+        tweets = []
+        for k in range(newest, 0, -1):
+            tweet_id = self._tweet_id(k, index)
+            if max_id is not None and tweet_id > max_id:
+                continue
+            if (since_id is not None and tweet_id <= since_id) or len(tweets) == count:
+                break
+            posted_at = datetime.fromtimestamp(
+                ((tweet_id >> 22) + TWITTER_EPOCH_MS) / 1000, timezone.utc
+            )
+            tweets.append(FakeTweet(tweet_id, handle, posted_at))
+
+        return tweets
+
+    def _request(self, endpoint: str) -> None:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+        with self._lock:
+            self.calls[endpoint] += 1
+
+            if self.rate_limit is None:
+                self.last_response = FakeResponse(200)
+                return
+
+            now = time.time()
+            window = self._windows.get(endpoint)
+            if window is None or window[0] <= now:
+                window = self._windows[endpoint] = [now + self.window_seconds, 0]
+
+            refused = window[1] >= self.rate_limit
+            if not refused:
+                window[1] += 1
+
+            headers = {
+                "x-rate-limit-limit": str(self.rate_limit),
+                "x-rate-limit-remaining": str(self.rate_limit - int(window[1])),
+                "x-rate-limit-reset": str(int(window[0])),
+            }
+            self.last_response = FakeResponse(429 if refused else 200, headers)
+
+            if refused:
+                self.refused[endpoint] += 1
+                raise FakeRateLimitError(f"Rate limit exceeded for {endpoint}")
+
+    def user_timeline(
+        self,
+        screen_name: Optional[str] = None,
+        id: Optional[str] = None,
+        count: int = 20,
+        since_id: Optional[int] = None,
+        max_id: Optional[int] = None,
+        **kwargs,
+    ) -> List[FakeTweet]:
+        self._request("/statuses/user_timeline")
+
+        with self._lock:
+            return self._tweets(screen_name or id, since_id, max_id, count)
+
+    def search_tweets(
+        self,
+        q: str,
+        count: int = 15,
+        since_id: Optional[int] = None,
+        max_id: Optional[int] = None,
+        **kwargs,
+    ) -> List[FakeTweet]:
+        self._request("/search/tweets")
+        handles = [term.strip()[len("from:"):] for term in q.split(" OR ")]
+
+        with self._lock:
+            tweets = [t for h in handles for t in self._tweets(h, since_id, max_id, count)]
+            searchable_ms = self._started_ms + int((self.now - self.search_window_seconds) * 1000)
+
+        tweets = [tweet for tweet in tweets if tweet.id >> 22 >= searchable_ms]
+        return sorted(tweets, key=lambda tweet: tweet.id, reverse=True)[:count]
+
+
+class FakeTelegramBot:
+    """
+    A stand-in for telegram.Bot's send_message, recording every message it is sent.
+
+    A fraction of the calls, retry_after_rate, are refused with RetryAfter as Telegram's flood
+    control does.
+    """
+
+    def __init__(
+        self,
+        latency_seconds: float = 0.0,
+        retry_after_rate: float = 0.0,
+        retry_after_seconds: int = 1,
+        seed: int = 0,
+    ):
+        """
+        Parameters:
+            latency_seconds (float): how long each call takes
+            retry_after_rate (float): the fraction of calls refused with RetryAfter
+            retry_after_seconds (int): the retry_after of the refusals
+            seed (int): seeds which calls are refused
+        """
+        self.latency_seconds = latency_seconds
+        self.retry_after_rate = retry_after_rate
+        self.retry_after_seconds = retry_after_seconds
+
+        self.messages: List[Tuple[float, str, str]] = []
+        self.retry_afters = 0
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def sent(self) -> int:
+        with self._lock:
+            return len(self.messages)
+
+    def send_message(self, chat_id: str, text: str, **kwargs) -> None:
+        from telegram.error import RetryAfter
+
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+        with self._lock:
+            if self._random.random() < self.retry_after_rate:
+                self.retry_afters += 1
+                raise RetryAfter(self.retry_after_seconds)
+
+            self.messages.append((time.monotonic(), str(chat_id), text))
+
+
+class FakeJsonResponse:
+    def __init__(self, status_code: int, body: dict):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self) -> dict:
+        return self._body
+
+
+def _ok(payload: Optional[dict] = None, status_code: int = 200) -> FakeJsonResponse:
+    body = {"success": True}
+    if payload is not None:
+        body["payload"] = payload
+    return FakeJsonResponse(status_code, body)
+
+
+def _error(message: str, status_code: int) -> FakeJsonResponse:
+    return FakeJsonResponse(status_code, {"success": False, "error": {"message": message}})
+
+
+class FakeDbApiClient:
+    """
+    An in-memory stand-in for the Telegram bot's DbApiClient, answering the watcher, digest
+    and latest tweet endpoints the bot uses as the db_api would.
+    """
+
+    def __init__(self, latency_seconds: float = 0.0):
+        """
+        Parameters:
+            latency_seconds (float): how long each request takes
+        """
+        self.latency_seconds = latency_seconds
+
+        self.calls: Counter = Counter()
+        self.watching: Dict[str, List[str]] = {}
+        self.digests: Dict[str, bool] = {}
+        self.latest: Dict[str, Tuple[int, str, float]] = {}
+
+        self._lock = threading.Lock()
+        self._routes = [
+            ("GET", r"/watcher/([^/]+)", self._get_watcher),
+            ("POST", r"/watcher/([^/]+)/watch", self._watch),
+            ("DELETE", r"/watcher/([^/]+)/unwatch", self._unwatch),
+            ("DELETE", r"/watcher/([^/]+)/watching", self._unwatch_all),
+            ("PUT", r"/watcher/([^/]+)/digest", self._set_digest),
+            ("GET", r"/handle/([^/]+)/latest", self._get_latest),
+            ("PUT", r"/latest", self._put_latest),
+        ]
+
+    def request(self, method: str, path: str, json: Optional[dict] = None, **kwargs):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+        for route_method, pattern, view in self._routes:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                with self._lock:
+                    self.calls[f"{method} {pattern}"] += 1
+                    return view(*match.groups(), body=json or {})
+
+        return _error(f"No route for {method} {path}", 404)
+
+    def get(self, path: str, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path: str, **kwargs):
+        return self.request("PUT", path, **kwargs)
+
+    def delete(self, path: str, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+    def _get_watcher(self, chat_id: str, body: dict):
+        if chat_id not in self.watching:
+            return _error(f"The watcher {chat_id} does not exist.", 200)
+
+        handles = [{"handle": handle} for handle in self.watching[chat_id]]
+        return _ok({"chatID": chat_id, "handles": handles})
+
+    def _watch(self, chat_id: str, body: dict):
+        watching = self.watching.setdefault(chat_id, [])
+        results = {}
+        for handle in body.get("handles", []):
+            results[handle] = 409 if handle in watching else 201
+            if handle not in watching:
+                watching.append(handle)
+        return _ok({"results": results})
+
+    def _unwatch(self, chat_id: str, body: dict):
+        if chat_id not in self.watching:
+            return _error(f"The watcher {chat_id} does not exist.", 404)
+
+        watching = self.watching[chat_id]
+        results = {}
+        for handle in body.get("handles", []):
+            results[handle] = 200 if handle in watching else 404
+            if handle in watching:
+                watching.remove(handle)
+        return _ok({"results": results})
+
+    def _unwatch_all(self, chat_id: str, body: dict):
+        if chat_id not in self.watching:
+            return _error(f"The watcher {chat_id} does not exist.", 404)
+
+        handles, self.watching[chat_id] = self.watching[chat_id], []
+        return _ok({"handles": handles})
+
+    def _set_digest(self, chat_id: str, body: dict):
+        self.watching.setdefault(chat_id, [])
+        self.digests[chat_id] = bool(body.get("digest"))
+        return _ok({"digest": self.digests[chat_id]})
+
+    def _get_latest(self, handle: str, body: dict):
+        if handle not in self.latest:
+            return _error(f"No tweets have been recorded for @{handle}.", 404)
+
+        tweet_id, url, recorded_at = self.latest[handle]
+        payload = {
+            "handle": handle,
+            "tweetID": tweet_id,
+            "url": url,
+            "ageSeconds": time.time() - recorded_at,
+        }
+        return _ok(payload)
+
+    def _put_latest(self, body: dict):
+        for tweet in body.get("tweets", []):
+            self.latest[tweet["handle"]] = (tweet["tweetID"], tweet["url"], time.time())
+        return _ok()
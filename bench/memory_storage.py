@@ -0,0 +1,142 @@
+"""
+An in-memory storage backend for the Twitter bot, standing in for the db_api and Postgres.
+
+It can only be imported with the twitter_bot directory on the path, see scenarios.py.
+"""
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from api.handle import Handle, Watcher
+from api.storage import StorageBackend
+from api.tweet import Tweet
+
+
+class InMemoryStorageBackend(StorageBackend):
+    """
+    Holds the subscriptions and latest tweets of a benchmark in memory. The outbox isn't
+    supported, so the messages have to be delivered inline.
+    """
+
+    def __init__(self, subscriptions: Dict[str, List[str]], digest: bool = False):
+        """
+        Parameters:
+            subscriptions (Dict[str, List[str]]): the chat IDs watching each handle
+            digest (bool): True if every watcher is in digest mode
+        """
+        self.subscriptions = subscriptions
+        self.digest = digest
+
+        self.latest: Dict[str, int] = {}
+        self.cursors: Dict[str, Dict[str, Any]] = {}
+        self.sent: Set[Tuple[int, str]] = set()
+        self._lock = threading.Lock()
+
+    def _handle(self, index: int, name: str) -> Handle:
+        now = datetime.utcnow()
+        handle = Handle(index, name, now, now)
+        for chat_id in self.subscriptions[name]:
+            handle.add_watcher(Watcher(hash(chat_id), chat_id, now, now, self.digest))
+        return handle
+
+    def get_all_handle_names(self) -> List[str]:
+        return list(self.subscriptions)
+
+    def get_subscriptions(self) -> List[Handle]:
+        return [
+            self._handle(index, name)
+            for index, (name, chat_ids) in enumerate(self.subscriptions.items())
+            if chat_ids
+        ]
+
+    def get_handle(self, handle: str) -> Handle:
+        return self._handle(list(self.subscriptions).index(handle), handle)
+
+    def get_watcher(self, chat_id: str) -> dict:
+        handles = [name for name, chat_ids in self.subscriptions.items() if chat_id in chat_ids]
+        return {"chatID": chat_id, "handles": [{"handle": name} for name in handles]}
+
+    def update_latest_tweets(self, tweets: List[Tweet]) -> None:
+        with self._lock:
+            for tweet in tweets:
+                self.latest[tweet.handle] = max(tweet.id, self.latest.get(tweet.handle, 0))
+
+    def heartbeat_poller_worker(self, worker_id: str) -> List[str]:
+        return [worker_id]
+
+    def remove_poller_worker(self, worker_id: str) -> None:
+        self.release_poller_cursors(worker_id, list(self.cursors))
+
+    def claim_poller_cursors(self, worker_id: str, handles: List[str]) -> Dict[str, Optional[int]]:
+        # Every worker is considered live, so only released cursors change hands
+        claimed = {}
+        with self._lock:
+            for handle in handles:
+                cursor = self.cursors.setdefault(
+                    handle.lower(), {"since_id": None, "worker_id": None}
+                )
+                if cursor["worker_id"] in (None, worker_id):
+                    cursor["worker_id"] = worker_id
+                    claimed[handle] = cursor["since_id"]
+        return claimed
+
+    def advance_poller_cursors(self, worker_id: str, cursors: Dict[str, int]) -> None:
+        with self._lock:
+            for handle, since_id in cursors.items():
+                cursor = self.cursors.get(handle.lower())
+                if cursor is not None and cursor["worker_id"] == worker_id:
+                    cursor["since_id"] = max(since_id, cursor["since_id"] or 0)
+
+    def release_poller_cursors(self, worker_id: str, handles: List[str]) -> None:
+        with self._lock:
+            for handle in handles:
+                cursor = self.cursors.get(handle.lower())
+                if cursor is not None and cursor["worker_id"] == worker_id:
+                    cursor["worker_id"] = None
+
+    def claim_sent_tweets(self, pairs: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+        claimed = []
+        with self._lock:
+            for pair in pairs:
+                if pair not in self.sent:
+                    self.sent.add(pair)
+                    claimed.append(pair)
+        return claimed
+
+    def find_unsent_tweets(self, pairs: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+        with self._lock:
+            return [pair for pair in pairs if pair not in self.sent]
+
+    def release_sent_tweets(self, pairs: List[Tuple[int, str]]) -> None:
+        with self._lock:
+            self.sent.difference_update(pairs)
+
+    def prune_sent_tweets(self, retention_hours: float) -> None:
+        pass
+
+
+class CountingBackend:
+    """Wraps a storage backend, counting the calls made to each of its methods."""
+
+    def __init__(self, backend: StorageBackend):
+        self.backend = backend
+        self.calls: Counter = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def total(self) -> int:
+        with self._lock:
+            return sum(self.calls.values())
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.backend, name)
+        if not callable(attr):
+            return attr
+
+        def counted(*args, **kwargs) -> Any:
+            with self._lock:
+                self.calls[name] += 1
+            return attr(*args, **kwargs)
+
+        return counted
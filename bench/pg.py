@@ -0,0 +1,44 @@
+"""Counts the queries run against Postgres by the db_api's db module."""
+import threading
+from types import ModuleType
+
+from psycopg2 import extensions
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def increment(self) -> None:
+        with self._lock:
+            self.count += 1
+
+
+queries = QueryCounter()
+
+
+class CountingCursor(extensions.cursor):
+    """A cursor counting every statement it executes, including the pool's health checks."""
+
+    def execute(self, query, vars=None):
+        queries.increment()
+        return super().execute(query, vars)
+
+
+def install_counting_pool(db: ModuleType) -> None:
+    """
+    Replaces the db module's connection pool with one whose cursors are counted by queries.
+
+    Parameters:
+        db (ModuleType): the db_api's db module
+    """
+    db._pool = db.ConnectionPool(
+        min_size=db.DB_POOL_MIN_SIZE,
+        max_size=db.DB_POOL_MAX_SIZE,
+        max_idle_seconds=db.DB_POOL_MAX_IDLE_SECONDS,
+        timeout_seconds=db.DB_POOL_TIMEOUT_SECONDS,
+        health_check_idle_seconds=db.DB_POOL_HEALTH_CHECK_IDLE_SECONDS,
+        cursor_factory=CountingCursor,
+        **db.DB_CREDENTIALS,
+    )
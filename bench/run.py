@@ -0,0 +1,195 @@
+"""
+Runs the benchmark scenarios over a sweep of parameters and writes the results as JSON.
+
+    python bench/run.py poller --handles 10,100,1000 --watchers 1,10 --tweet-rates 0.01,0.1
+    python bench/run.py commands --handles 100 --watchers 10,100 --output commands.json
+    python bench/run.py db_api --handles 100,1000 --watchers 1,10
+    python bench/run.py search --handles 10,100 --tweet-rates 0.01,0.1
+
+Every combination of the swept parameters is run in a fresh process, see scenarios.py. The
+results of two runs can be compared with compare.py.
+"""
+import sys
+import json
+import time
+import argparse
+import itertools
+import platform
+import subprocess
+import traceback
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from scenarios import REPO, SCENARIOS, SkipScenario
+
+# The parameters each scenario is swept over, the others have a single value per run
+SWEPT = {
+    "poller": ("handles", "watchers", "tweet_rate"),
+    "search": ("handles", "tweet_rate"),
+    "commands": ("handles", "watchers"),
+    "db_api": ("handles", "watchers"),
+}
+
+
+def _numbers(value: str, kind: type) -> List:
+    return [kind(item) for item in value.split(",") if item.strip()]
+
+
+def _env(values: List[str]) -> Dict[str, str]:
+    env = {}
+    for value in values:
+        name, _, setting = value.partition("=")
+        env[name] = setting
+    return env
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO, capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.strip()
+
+
+def build_runs(args: argparse.Namespace) -> List[dict]:
+    """Returns the parameters of every run in the sweep."""
+    fixed = {
+        "storage": args.storage,
+        "cycles": args.cycles,
+        "cycle_seconds": args.cycle_seconds,
+        "fetch_backend": args.fetch_backend,
+        "digest": args.digest,
+        "twitter_latency": args.twitter_latency,
+        "twitter_rate_limit": args.twitter_rate_limit,
+        "twitter_window": args.twitter_window,
+        "telegram_latency": args.telegram_latency,
+        "telegram_429_rate": args.telegram_429_rate,
+        "db_api_latency": args.db_api_latency,
+        "commands": args.commands,
+        "command_rate": args.command_rate,
+        "requests": args.requests,
+        "seed": args.seed,
+        "env": _env(args.env),
+    }
+    sweep = {
+        "handles": _numbers(args.handles, int),
+        "watchers": _numbers(args.watchers, int),
+        "tweet_rate": _numbers(args.tweet_rates, float),
+    }
+
+    runs = []
+    for scenario in args.scenarios:
+        swept = SWEPT[scenario]
+        for values in itertools.product(*(sweep[name] for name in swept)):
+            params = {**fixed, "tweet_rate": sweep["tweet_rate"][0], **dict(zip(swept, values))}
+            runs.append({"scenario": scenario, "params": params})
+
+    return runs
+
+
+def run_in_process(scenario: str, params: dict, timeout_seconds: float) -> dict:
+    """
+    Runs the scenario in a fresh Python process.
+
+    Returns:
+        the result, with a status of "ok", "skipped" or "error"
+    """
+    script = str(Path(__file__).resolve())
+    command = [sys.executable, script, "--worker", scenario, json.dumps(params)]
+    started = time.perf_counter()
+
+    try:
+        process = subprocess.run(command, capture_output=True, text=True, timeout=timeout_seconds)
+    except subprocess.TimeoutExpired:
+        result = {"status": "error", "error": f"Timed out after {timeout_seconds}s"}
+    else:
+        lines = process.stdout.strip().splitlines()
+        try:
+            result = json.loads(lines[-1])
+        except (IndexError, ValueError):
+            error = process.stderr.strip().splitlines()[-1:] or [f"exit code {process.returncode}"]
+            result = {"status": "error", "error": error[0]}
+
+    result["wall_seconds"] = round(time.perf_counter() - started, 3)
+    return {"scenario": scenario, "params": params, **result}
+
+
+def worker(scenario: str, params: str) -> None:
+    """Runs the scenario in this process, printing the result as the last line of stdout."""
+    try:
+        result = {"status": "ok", "metrics": SCENARIOS[scenario](json.loads(params))}
+    except SkipScenario as e:
+        result = {"status": "skipped", "error": str(e)}
+    except Exception as e:
+        traceback.print_exc()
+        result = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+
+    print(json.dumps(result, default=str), flush=True)
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == "--worker":
+        worker(sys.argv[2], sys.argv[3])
+        return
+
+    parser = argparse.ArgumentParser(description="Runs the TwitterSnoop benchmarks.")
+    parser.add_argument("scenarios", nargs="+", choices=sorted(SCENARIOS))
+    parser.add_argument("--handles", default="10,100", help="comma separated handle counts")
+    parser.add_argument("--watchers", default="1,10", help="comma separated watchers per handle")
+    parser.add_argument("--tweet-rates", default="0.01", help="tweets per second per handle")
+    parser.add_argument("--storage", default="memory", choices=["memory", "postgres"])
+    parser.add_argument("--cycles", type=int, default=5)
+    parser.add_argument("--cycle-seconds", type=float, default=60, help="simulated time per cycle")
+    parser.add_argument("--fetch-backend", default="timeline", choices=["timeline", "search"])
+    parser.add_argument("--digest", action="store_true", help="every watcher in digest mode")
+    parser.add_argument("--twitter-latency", type=float, default=0.02)
+    parser.add_argument("--twitter-rate-limit", type=int, default=None, help="per 15 minutes")
+    parser.add_argument("--twitter-window", type=float, default=900)
+    parser.add_argument("--telegram-latency", type=float, default=0.0)
+    parser.add_argument("--telegram-429-rate", type=float, default=0.0)
+    parser.add_argument("--db-api-latency", type=float, default=0.0)
+    parser.add_argument("--commands", type=int, default=200)
+    parser.add_argument("--command-rate", type=float, default=100, help="commands per second")
+    parser.add_argument("--requests", type=int, default=50, help="db_api requests per endpoint")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--env", action="append", default=[], help="NAME=VALUE for the service")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds allowed per run")
+    parser.add_argument("--label", default="", help="a note stored with the results")
+    parser.add_argument("--output", help="the file to write the results to, default stdout")
+    args = parser.parse_args()
+
+    if args.cycles < 1:
+        parser.error("--cycles must be at least 1")
+
+    document = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "label": args.label,
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "argv": sys.argv[1:],
+        },
+        "results": [],
+    }
+
+    for run in build_runs(args):
+        result = run_in_process(run["scenario"], run["params"], args.timeout)
+        document["results"].append(result)
+
+        swept = ", ".join(f"{name}={run['params'][name]}" for name in SWEPT[run["scenario"]])
+        detail = f": {result['error']}" if result.get("error") else ""
+        print(f"{run['scenario']} {swept} {result['status']}{detail}", file=sys.stderr)
+
+    output = json.dumps(document, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,574 @@
+"""
+The benchmark scenarios, each of which is run in a process of its own by run.py.
+
+The db_api and the two bots each import their modules by name from their own directory, e.g.
+constants, so a process can only load one of them. Their constants are read from the
+environment when they are first imported, so a scenario sets the environment before importing
+anything from the service it benchmarks.
+"""
+import os
+import sys
+import time
+import random
+import socket
+import logging
+import tempfile
+import subprocess
+import urllib.request
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+
+REPO = Path(__file__).resolve().parents[1]
+
+# Placeholder credentials, the fakes never check them
+PLACEHOLDER_ENV = {
+    "TELEGRAM_TOKEN": "123456:bench",
+    "TW_API_KEY": "bench",
+    "TW_API_KEY_SECRET": "bench",
+    "TW_ACCESS_TOKEN": "bench",
+    "TW_ACCESS_TOKEN_SECRET": "bench",
+    "TW_BEARER_TOKEN": "bench",
+}
+
+# Telegram's limits are lifted by default, so the poller benchmark measures the bot rather than
+# how long the dispatcher waits for its token buckets; pass them with --env to include them
+UNLIMITED_TELEGRAM_ENV = {
+    "TG_GLOBAL_RATE": "1000000",
+    "TG_CHAT_RATE": "1000000",
+    "TG_GROUP_RATE_PER_MINUTE": "60000000",
+}
+
+
+class SkipScenario(Exception):
+    """Raised when a scenario can't run here, e.g. because there is no Postgres to use."""
+
+
+class ErrorCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(level=logging.ERROR)
+        self.count = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.count += 1
+
+
+def _prepare(service: str, env: Dict[str, str]) -> None:
+    """Sets the environment and puts the service's directory first on the path."""
+    for name, value in PLACEHOLDER_ENV.items():
+        os.environ.setdefault(name, value)
+    for name, value in env.items():
+        os.environ[name] = str(value)
+
+    sys.path.insert(0, str(REPO / service))
+
+
+def _require_postgres() -> None:
+    if not os.getenv("DB_HOST") and not (REPO / "db_api" / ".env").exists():
+        raise SkipScenario("Postgres isn't configured, set DB_HOST, DB_NAME, DB_USER, DB_PASSWORD")
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """
+    Summarizes the durations, in seconds, as milliseconds.
+
+    Returns:
+        a dict with the count, p50_ms, p99_ms, mean_ms and max_ms of the samples
+    """
+    if not samples:
+        return {"count": 0}
+
+    ordered = sorted(samples)
+
+    def percentile(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "p50_ms": round(percentile(50) * 1000, 3),
+        "p99_ms": round(percentile(99) * 1000, 3),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def handle_names(count: int) -> List[str]:
+    return [f"bench{i:05d}" for i in range(count)]
+
+
+def build_subscriptions(handles: int, watchers: int) -> Dict[str, List[str]]:
+    """
+    Assigns watchers chats to each handle, from a pool of as many chats as there are handles,
+    so every chat watches about watchers handles too.
+
+    Returns:
+        the chat IDs watching each handle
+    """
+    chats = max(handles, watchers)
+    # Private chat IDs are positive, see dispatcher.is_group_chat
+    return {
+        name: [str(1_000_000 + (i + k) % chats) for k in range(watchers)]
+        for i, name in enumerate(handle_names(handles))
+    }
+
+
+def watched_by_chat(subscriptions: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    chats: Dict[str, List[str]] = {}
+    for name, chat_ids in subscriptions.items():
+        for chat_id in chat_ids:
+            chats.setdefault(chat_id, []).append(name)
+    return chats
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_db_api(timeout_seconds: float = 15) -> SimpleNamespace:
+    """
+    Starts the db_api in a subprocess on a free port.
+
+    Returns:
+        a namespace with the process and the url of the db_api
+    """
+    port = _free_port()
+    env = {**os.environ, "DB_API_HOST": "127.0.0.1", "DB_API_PORT": str(port)}
+    process = subprocess.Popen(
+        [sys.executable, "main.py"],
+        cwd=REPO / "db_api",
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+
+    deadline = time.monotonic() + timeout_seconds
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The db_api exited with {process.returncode}")
+        try:
+            urllib.request.urlopen(f"{url}/handles", timeout=1)
+            return SimpleNamespace(process=process, url=url)
+        except OSError:
+            time.sleep(0.1)
+
+    process.terminate()
+    raise RuntimeError("The db_api didn't start in time")
+
+
+def poller(params: dict) -> dict:
+    """
+    Runs process_tweets over every subscription for a number of cycles, as the Twitter bot's
+    main loop does, with the fake Twitter API and Telegram bot.
+
+    The first cycle seeds the cursors and isn't measured. Before each measured cycle the fake
+    Twitter clock is moved on by cycle_seconds, so every cycle finds the same number of tweets.
+    """
+    if params["cycles"] < 1:
+        raise ValueError(f"At least 1 measured cycle is needed, got {params['cycles']}.")
+
+    _prepare(
+        "twitter_bot",
+        {
+            **UNLIMITED_TELEGRAM_ENV,
+            "TW_FETCH_BACKEND": params["fetch_backend"],
+            "TW_INGESTION_MODE": "poll",
+            "TW_DELIVERY_MODE": "inline",
+            **params.get("env", {}),
+        },
+    )
+
+    from api import db as dbapi
+    from api import twitter_funcs
+    from bot import process_tweets
+    from dedup import SentTweets
+    from fetcher import Backfills
+    from dispatcher import DigestBuffer, MessageDispatcher
+    from properties import Properties
+    from fakes import FakeTelegramBot, FakeTwitterAPI
+    from memory_storage import CountingBackend, InMemoryStorageBackend
+
+    subscriptions = build_subscriptions(params["handles"], params["watchers"])
+    query_count: Optional[Callable[[], int]] = None
+    cleanup: Optional[Callable[[], None]] = None
+
+    if params["storage"] == "memory":
+        storage = InMemoryStorageBackend(subscriptions, params["digest"])
+    elif params["storage"] == "postgres":
+        _require_postgres()
+        from api.postgres_storage import PostgresStorageBackend
+        from pg import install_counting_pool, queries
+
+        storage = PostgresStorageBackend(REPO / "db_api")
+        install_counting_pool(storage.db)
+        cleanup = _seed_postgres(storage.db, subscriptions, params["digest"])
+        query_count = lambda: queries.count
+    else:
+        raise ValueError(f"Unknown storage {params['storage']}, expected memory or postgres.")
+
+    counted = CountingBackend(storage)
+    dbapi.backend = counted
+
+    twitter = FakeTwitterAPI(
+        tweet_rate=params["tweet_rate"],
+        latency_seconds=params["twitter_latency"],
+        rate_limit=params["twitter_rate_limit"],
+        window_seconds=params["twitter_window"],
+    )
+    twitter_funcs.api = twitter
+    telegram = FakeTelegramBot(
+        latency_seconds=params["telegram_latency"], retry_after_rate=params["telegram_429_rate"]
+    )
+
+    workdir = tempfile.TemporaryDirectory()
+    props = Properties(Path(workdir.name) / "properties.db")
+    sent = SentTweets(Path(workdir.name) / "sent_tweets.db")
+    dispatcher = MessageDispatcher(telegram)
+    digests = DigestBuffer(dispatcher, sent, window_seconds=0)
+    backfills = Backfills()
+
+    def cycle() -> None:
+        process_tweets(dispatcher, digests, props, sent, backfills, dbapi.get_subscriptions())
+        props.commit()
+        sent.commit()
+
+    def counters() -> List[int]:
+        db_queries = query_count() if query_count else 0
+        return [telegram.sent, counted.total, db_queries, sum(twitter.calls.values())]
+
+    cycle_times: List[float] = []
+    deltas: List[List[int]] = []
+
+    try:
+        cycle()
+
+        for _ in range(params["cycles"]):
+            twitter.advance(params["cycle_seconds"])
+            before = counters()
+            started = time.perf_counter()
+            cycle()
+            cycle_times.append(time.perf_counter() - started)
+            deltas.append([after - b for after, b in zip(counters(), before)])
+    finally:
+        dispatcher.stop()
+        props.close()
+        sent.close()
+        workdir.cleanup()
+        if cleanup is not None:
+            cleanup()
+
+    cycles = len(cycle_times)
+    messages, storage_calls, db_queries, twitter_requests = (
+        sum(column) for column in zip(*deltas)
+    )
+
+    return {
+        "cycle": summarize(cycle_times),
+        "messages_per_cycle": messages / cycles,
+        "messages_per_second": round(messages / sum(cycle_times), 3),
+        "storage_calls_per_cycle": storage_calls / cycles,
+        "db_queries_per_cycle": db_queries / cycles if query_count else None,
+        "twitter_requests_per_cycle": twitter_requests / cycles,
+        "twitter_requests_refused": sum(twitter.refused.values()),
+        "telegram_retry_afters": telegram.retry_afters,
+    }
+
+
+def search(params: dict) -> dict:
+    """
+    Checks that the search fetch backend finds exactly the tweets the timeline backend does,
+    with the fake Twitter API, and counts the requests each backend makes.
+
+    Every handle has 200 tweets, about 100 of which search can reach. Every fifth handle's
+    cursor is 150 tweets behind, beyond search's reach as after the bot has been stopped for a
+    while, and the other cursors are 5 tweets behind. The run fails if any handle's tweets
+    differ between the backends.
+    """
+    # The search window covers about 100 tweets whatever the tweet rate, and the bot treats
+    # cursors as too old for search a little before they actually are, as it does in production
+    window_seconds = 100 / params["tweet_rate"]
+    _prepare(
+        "twitter_bot",
+        {
+            "TW_SEARCH_MAX_CURSOR_AGE_HOURS": str(window_seconds * 0.75 / 3600),
+            **params.get("env", {}),
+        },
+    )
+
+    from api import twitter_funcs
+    from api.handle import handle_factory
+    from fetcher import fetch_recent_tweets
+    from fakes import FakeTwitterAPI
+
+    twitter = FakeTwitterAPI(
+        tweet_rate=params["tweet_rate"],
+        latency_seconds=params["twitter_latency"],
+        history=200,
+        search_window_seconds=window_seconds,
+    )
+    twitter_funcs.api = twitter
+
+    subscriptions = build_subscriptions(params["handles"], 1)
+    handles = [
+        handle_factory(
+            {
+                "id": i,
+                "handle": name,
+                "createdAt": None,
+                "updatedAt": None,
+                "watchers": [{"id": int(chat_id), "chatID": chat_id} for chat_id in chat_ids],
+            }
+        )
+        for i, (name, chat_ids) in enumerate(subscriptions.items())
+    ]
+    since_ids = {
+        handle.name: twitter.tweet_id(handle.name, 200 - (150 if i % 5 == 0 else 5))
+        for i, handle in enumerate(handles)
+    }
+
+    found: Dict[str, Dict[str, List[int]]] = {}
+    requests: Dict[str, int] = {}
+    for backend in ("timeline", "search"):
+        before = sum(twitter.calls.values())
+        found[backend] = {
+            handle.name: sorted(tweet.id for tweet in tweets)
+            for handle, tweets, _ in fetch_recent_tweets(handles, since_ids, backend=backend)
+        }
+        requests[backend] = sum(twitter.calls.values()) - before
+
+    expected, actual = found["timeline"], found["search"]
+    if len(expected) != len(handles):
+        raise RuntimeError(f"The timeline backend only fetched {len(expected)} handles")
+
+    mismatched = [name for name in expected if actual.get(name) != expected[name]]
+    if mismatched:
+        raise RuntimeError(
+            f"The search backend found different tweets for {len(mismatched)} handles, "
+            f"e.g. @{mismatched[0]}"
+        )
+
+    return {
+        "tweets_found": sum(len(ids) for ids in expected.values()),
+        "stale_cursors": len(handles[::5]),
+        "timeline_requests": requests["timeline"],
+        "search_requests": requests["search"],
+    }
+
+
+def _seed_postgres(db, subscriptions: Dict[str, List[str]], digest: bool) -> Callable[[], None]:
+    """Creates the subscriptions in Postgres, returning a function that removes them again."""
+    chats = watched_by_chat(subscriptions)
+
+    for chat_id, names in chats.items():
+        db.create_watch_relationships(names, chat_id)
+        if digest:
+            db.set_watcher_digest(chat_id, True)
+
+    def cleanup() -> None:
+        for chat_id in chats:
+            try:
+                db.delete_all_watch_relationships(chat_id)
+            except db.WatcherNotFoundError:
+                pass
+
+    return cleanup
+
+
+COMMAND_MIX = {"watch": 0.3, "latest": 0.3, "watching": 0.2, "unwatch": 0.1, "digest": 0.1}
+
+
+def commands(params: dict) -> dict:
+    """
+    Sends the Telegram bot's command handlers a mix of commands from watchers chats, at
+    command_rate commands per second, through the bot's ChatExecutor.
+
+    The latency of each command runs from it being received to its reply being sent, including
+    any time spent queued behind the chat's earlier commands.
+    """
+    _prepare(
+        "telegram_bot",
+        {"TG_LATENCY_SAMPLE_SIZE": str(params["commands"]), **params.get("env", {})},
+    )
+
+    import bot
+    import db_api
+    import twit
+    from fakes import FakeDbApiClient, FakeTelegramBot, FakeTwitterAPI
+
+    server = None
+    if params["storage"] == "memory":
+        db_api.client = FakeDbApiClient(latency_seconds=params["db_api_latency"])
+    elif params["storage"] == "postgres":
+        _require_postgres()
+        from db_api_client import DbApiClient
+
+        server = start_db_api()
+        db_api.client = DbApiClient(server.url)
+    else:
+        raise ValueError(f"Unknown storage {params['storage']}, expected memory or postgres.")
+
+    twitter = FakeTwitterAPI(
+        tweet_rate=params["tweet_rate"],
+        latency_seconds=params["twitter_latency"],
+        rate_limit=params["twitter_rate_limit"],
+        window_seconds=params["twitter_window"],
+    )
+    twit.api = twitter
+    telegram = FakeTelegramBot(
+        latency_seconds=params["telegram_latency"], retry_after_rate=params["telegram_429_rate"]
+    )
+
+    errors = ErrorCounter()
+    logging.getLogger().addHandler(errors)
+
+    names = handle_names(params["handles"])
+    handlers = {name: bot.command_executor.wrap(getattr(bot, name)) for name in COMMAND_MIX}
+    rng = random.Random(params["seed"])
+    issued: Dict[str, int] = {name: 0 for name in COMMAND_MIX}
+
+    def arguments(command: str) -> List[str]:
+        if command == "watch":
+            return [f"@{name}" for name in rng.sample(names, min(3, len(names)))]
+        if command in ("unwatch", "latest"):
+            return [f"@{rng.choice(names)}"]
+        if command == "digest":
+            return [rng.choice(["on", "off"])]
+        return []
+
+    interval = 1 / params["command_rate"]
+    started = time.perf_counter()
+
+    try:
+        for i in range(params["commands"]):
+            command = rng.choices(list(COMMAND_MIX), weights=list(COMMAND_MIX.values()))[0]
+            chat_id = 1_000_000 + rng.randrange(params["watchers"])
+            update = SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id))
+            context = SimpleNamespace(args=arguments(command), bot=telegram)
+
+            # The commands arrive at a steady rate, however long the earlier ones take
+            delay = started + i * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            handlers[command](update, context)
+            issued[command] += 1
+
+        bot.command_executor.shutdown()
+        elapsed = time.perf_counter() - started
+    finally:
+        if server is not None:
+            server.process.terminate()
+            server.process.wait()
+
+    latency = bot.command_executor.latency
+    calls = getattr(db_api.client, "calls", None)
+
+    return {
+        "commands": {
+            name: {
+                "count": count,
+                "p50_ms": round(latency.percentile(name, 50) * 1000, 3),
+                "p99_ms": round(latency.percentile(name, 99) * 1000, 3),
+            }
+            for name, count in issued.items()
+            if count
+        },
+        "commands_per_second": round(params["commands"] / elapsed, 3),
+        "replies": telegram.sent,
+        "errors": errors.count,
+        "db_api_requests": sum(calls.values()) if calls is not None else None,
+        "twitter_requests": sum(twitter.calls.values()),
+        "telegram_retry_afters": telegram.retry_afters,
+    }
+
+
+def db_api(params: dict) -> dict:
+    """
+    Sends the db_api's hottest endpoints requests through Flask's test client, against Postgres,
+    counting the queries each request runs.
+
+    The subscriptions are created through the batch watch endpoint first, and removed at the end.
+    """
+    _prepare("db_api", params.get("env", {}))
+    _require_postgres()
+
+    import db
+    import main
+    from pg import install_counting_pool, queries
+
+    install_counting_pool(db)
+    client = main.app.test_client()
+
+    subscriptions = build_subscriptions(params["handles"], params["watchers"])
+    chats = watched_by_chat(subscriptions)
+    names = list(subscriptions)
+    chat_ids = list(chats)
+    rng = random.Random(params["seed"])
+
+    samples: Dict[str, List[float]] = {}
+    query_counts: Dict[str, int] = {}
+    errors = 0
+
+    def timed(name: str, request: Callable):
+        nonlocal errors
+
+        before = queries.count
+        started = time.perf_counter()
+        response = request()
+        samples.setdefault(name, []).append(time.perf_counter() - started)
+        query_counts[name] = query_counts.get(name, 0) + queries.count - before
+
+        if response.status_code >= 400:
+            errors += 1
+        return response
+
+    try:
+        for chat_id, watched in chats.items():
+            body = {"handles": watched}
+            timed("watch", lambda: client.post(f"/watcher/{chat_id}/watch", json=body))
+
+        for i in range(params["requests"]):
+            response = timed("subscriptions", lambda: client.get("/subscriptions"))
+            etag = response.headers.get("ETag", "")
+            timed(
+                "subscriptions_not_modified",
+                lambda: client.get("/subscriptions", headers={"If-None-Match": etag}),
+            )
+
+            chat_id = rng.choice(chat_ids)
+            timed("watcher", lambda: client.get(f"/watcher/{chat_id}"))
+
+            name = rng.choice(names)
+            timed("handle", lambda: client.get(f"/handle/{name}"))
+
+            batch = rng.sample(names, min(100, len(names)))
+            tweets = [
+                {"handle": n, "tweetID": (i + 1) * 1_000_000, "url": f"https://twitter.com/{n}"}
+                for n in batch
+            ]
+            timed("latest_put", lambda: client.put("/latest", json={"tweets": tweets}))
+            timed("latest_get", lambda: client.get(f"/handle/{name}/latest"))
+    finally:
+        for chat_id in chats:
+            try:
+                db.delete_all_watch_relationships(chat_id)
+            except db.WatcherNotFoundError:
+                pass
+
+    return {
+        "requests": {
+            name: {**summarize(times), "queries_per_request": query_counts[name] / len(times)}
+            for name, times in samples.items()
+        },
+        "errors": errors,
+    }
+
+
+SCENARIOS: Dict[str, Callable[[dict], dict]] = {
+    "poller": poller,
+    "search": search,
+    "commands": commands,
+    "db_api": db_api,
+}
@@ -0,0 +1,50 @@
+"""
+Checks that the modules shared between the services are identical in each of them.
+
+Each service runs from its own directory and imports its modules by name, so a module used
+by several services is copied into each. After changing one copy, copy it over the others
+and run:
+
+    python check_shared.py
+
+The exit code is 1 if any copy differs from the first copy listed for its module.
+"""
+import sys
+import filecmp
+from pathlib import Path
+from typing import Dict, List
+
+ROOT = Path(__file__).resolve().parent
+
+SHARED: Dict[str, List[str]] = {
+    "metrics.py": ["db_api/metrics.py", "telegram_bot/metrics.py", "twitter_bot/metrics.py"],
+    "rate_limits.py": ["twitter_bot/api/rate_limits.py", "telegram_bot/rate_limits.py"],
+    "db_api_client.py": ["twitter_bot/api/db_api_client.py", "telegram_bot/db_api_client.py"],
+}
+
+
+def differing_copies() -> List[str]:
+    """Returns the copies that differ from the first copy of their module."""
+    differing = []
+
+    for copies in SHARED.values():
+        first, *others = [ROOT / copy for copy in copies]
+        differing.extend(
+            str(other.relative_to(ROOT))
+            for other in others
+            if not filecmp.cmp(first, other, shallow=False)
+        )
+
+    return differing
+
+
+def main() -> int:
+    differing = differing_copies()
+    for copy in differing:
+        print(f"{copy} differs from the other copies of {Path(copy).name}")
+
+    return 1 if differing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
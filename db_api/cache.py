@@ -0,0 +1,82 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class ReadCache:
+    """
+    A thread-safe least recently used cache whose entries expire after ttl_seconds.
+
+    Write paths invalidate the keys they affect. A value loaded while an invalidation happened
+    is returned but not cached, so a slow read can't put stale data back in the cache.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        """
+        Parameters:
+            max_size (int): the maximum number of entries, the least recently used are evicted
+            ttl_seconds (float): how long an entry is kept for
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        Returns the cached value for the key, calling loader and caching its result on a miss.
+
+        Exceptions raised by loader are not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+            self.misses += 1
+            generation = self._generation
+
+        value = loader()
+
+        with self._lock:
+            if generation == self._generation and self.max_size > 0:
+                self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+                self._entries.move_to_end(key)
+
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+
+        return value
+
+    def invalidate(self, *keys: Hashable) -> None:
+        """Removes the given keys from the cache."""
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Returns the hit and miss counters along with the size of the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "maxSize": self.max_size,
+                "ttlSeconds": self.ttl_seconds,
+            }
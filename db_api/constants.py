@@ -8,5 +8,18 @@ DB_NAME: str = os.getenv("DB_NAME")
 DB_USER: str = os.getenv("DB_USER")
 DB_PASSWORD: str = os.getenv("DB_PASSWORD")
 
+DB_POOL_MIN_SIZE: int = int(os.getenv("DB_POOL_MIN_SIZE") or 1)
+DB_POOL_MAX_SIZE: int = int(os.getenv("DB_POOL_MAX_SIZE") or 10)
+DB_POOL_MAX_IDLE_SECONDS: float = float(os.getenv("DB_POOL_MAX_IDLE_SECONDS") or 300)
+DB_POOL_TIMEOUT_SECONDS: float = float(os.getenv("DB_POOL_TIMEOUT_SECONDS") or 10)
+DB_POOL_HEALTH_CHECK_IDLE_SECONDS: float = float(os.getenv("DB_POOL_HEALTH_CHECK_IDLE_SECONDS") or 1)
+
+DB_CACHE_SIZE: int = int(os.getenv("DB_CACHE_SIZE") or 4096)
+DB_CACHE_TTL_SECONDS: float = float(os.getenv("DB_CACHE_TTL_SECONDS") or 30)
+
 DB_API_HOST: str = os.getenv("DB_API_HOST") or "127.0.0.1"
 DB_API_PORT: int = int(os.getenv("DB_API_PORT") or 5000)
+
+POLLER_HEARTBEAT_TTL_SECONDS: int = int(os.getenv("POLLER_HEARTBEAT_TTL_SECONDS") or 45)
+
+SUBSCRIPTION_CHANNEL: str = os.getenv("SUBSCRIPTION_CHANNEL") or "subscription_changes"
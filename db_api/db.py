@@ -1,15 +1,58 @@
-import psycopg2
-from typing import List
-
-from constants import DB_HOST, DB_NAME, DB_PASSWORD, DB_USER
+import time
+import threading
+from typing import Dict, List, Optional
+
+from constants import (
+    DB_HOST,
+    DB_NAME,
+    DB_PASSWORD,
+    DB_USER,
+    DB_POOL_MIN_SIZE,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_MAX_IDLE_SECONDS,
+    DB_POOL_TIMEOUT_SECONDS,
+    DB_POOL_HEALTH_CHECK_IDLE_SECONDS,
+    DB_CACHE_SIZE,
+    DB_CACHE_TTL_SECONDS,
+    POLLER_HEARTBEAT_TTL_SECONDS,
+    SUBSCRIPTION_CHANNEL,
+)
+from cache import ReadCache
+from metrics import registry
+from pool import ConnectionPool
 
 DB_CREDENTIALS = {
     "host": DB_HOST,
-    "name": DB_NAME,
+    "database": DB_NAME,
     "user": DB_USER,
     "password": DB_PASSWORD,
 }
 
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+# Handle and watcher lookups are cached, every write invalidates the entries it affects
+read_cache = ReadCache(DB_CACHE_SIZE, DB_CACHE_TTL_SECONDS)
+
+# Labelled by the function that opened the connection, e.g. fetch_subscriptions
+QUERY_SECONDS = registry.histogram(
+    "db_query_seconds", "Time a connection was checked out for, by db function.", ["query"]
+)
+QUERY_ERRORS = registry.counter(
+    "db_query_errors_total", "db functions that raised with a connection checked out.", ["query"]
+)
+POOL_WAIT_SECONDS = registry.histogram(
+    "db_pool_wait_seconds", "Time taken to check a connection out of the pool."
+)
+
+
+def _handle_key(handle: str) -> str:
+    return f"handle:{handle}"
+
+
+def _watcher_key(chat_id: str) -> str:
+    return f"watcher:{chat_id}"
+
 
 class WatcherNotFoundError(Exception):
     pass
@@ -27,6 +70,10 @@ class WatchRelationshipAlreadyExistsError(Exception):
     pass
 
 
+class LatestTweetNotFoundError(Exception):
+    pass
+
+
 def assert_handle_exists(handle: str) -> None:
     """Raises HandelNotFoundError if the handle does not exist."""
     if not handle_exists(handle):
@@ -39,35 +86,188 @@ def assert_watcher_exists(chat_id: str):
         raise WatcherNotFoundError(f"A watcher with chat_id {chat_id} could not be found.")
 
 
+def _bump_subscription_version(cur) -> None:
+    """
+    Increments the subscription version as part of the cursor's transaction, so the new
+    version only becomes visible along with the change. It must only be called once the
+    transaction has changed a handle, watcher or watch relationship.
+    """
+    cur.execute("UPDATE subscription_version SET version = version + 1;")
+
+
+def _notify_subscription_changes(
+    cur, event: str, handles: List[str], chat_id: Optional[str] = None
+) -> None:
+    """
+    Queues a NOTIFY on the subscription channel for each handle, as part of the cursor's
+    transaction, so listeners only hear about changes once they are committed.
+
+    Parameters:
+        event (str): one of handle_created, watch or unwatch
+        handles (List[str]): the handles that have changed
+        chat_id (str | None): the chat that started or stopped watching the handles
+    """
+    if not handles:
+        return
+
+    cur.execute(
+        """SELECT pg_notify(%s, json_build_object('event', %s, 'handle', h, 'chatID', %s)::text)
+           FROM unnest(%s::text[]) AS h;""",
+        (SUBSCRIPTION_CHANNEL, event, chat_id, list(handles)),
+    )
+
+
+def fetch_subscription_version() -> int:
+    """
+    Fetches the subscription version, which increases whenever a handle, watcher or watch
+    relationship changes. Read it within a Snapshot along with the subscriptions it tags.
+    """
+    with Postgres("fetch_subscription_version") as (_, cur):
+        cur.execute("SELECT version FROM subscription_version;")
+        return cur.fetchone()[0]
+
+
+def get_pool() -> ConnectionPool:
+    """Returns the connection pool shared by every request, creating it on first use."""
+    global _pool
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    max_idle_seconds=DB_POOL_MAX_IDLE_SECONDS,
+                    timeout_seconds=DB_POOL_TIMEOUT_SECONDS,
+                    health_check_idle_seconds=DB_POOL_HEALTH_CHECK_IDLE_SECONDS,
+                    **DB_CREDENTIALS,
+                )
+
+    return _pool
+
+
+# The connection of the Snapshot open on each thread, if any
+_snapshot = threading.local()
+
+
+class Snapshot:
+    """
+    Runs every query made by this thread within the with block in a single read-only
+    REPEATABLE READ transaction, so they all see the same committed state of the database.
+    """
+
+    def __init__(self, pool: Optional[ConnectionPool] = None):
+        self.pool = pool or get_pool()
+
+    def __enter__(self):
+        with POOL_WAIT_SECONDS.time():
+            self.conn = self.pool.getconn()
+
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY;")
+        except Exception:
+            self.pool.putconn(self.conn)
+            raise
+
+        _snapshot.conn = self.conn
+        return self
+
+    def __exit__(self, type, value, traceback):
+        _snapshot.conn = None
+        # The transaction is rolled back when the connection is returned
+        self.pool.putconn(self.conn)
+
+
+def in_snapshot() -> bool:
+    """Returns True if a Snapshot is open on this thread."""
+    return getattr(_snapshot, "conn", None) is not None
+
+
 class Postgres:
-    def __init__(self, host: str, name: str, user: str, password: str):
-        self.host = host
-        self.name = name
-        self.user = user
-        self.password = password
+    """
+    Checks a connection out of the shared pool for the duration of the with block, or uses
+    the connection of the Snapshot open on this thread.
+    """
+
+    def __init__(self, query: str, pool: Optional[ConnectionPool] = None):
+        """
+        Parameters:
+            query (str): the name the query's metrics are labelled with
+            pool (ConnectionPool | None): the pool to check the connection out of
+        """
+        self.pool = pool or get_pool()
+        self.query = query
 
     def __enter__(self):
-        self.conn = psycopg2.connect(
-            host=self.host, database=self.name, user=self.user, password=self.password
-        )
+        self.shared = getattr(_snapshot, "conn", None)
+        if self.shared is not None:
+            self.conn = self.shared
+        else:
+            with POOL_WAIT_SECONDS.time():
+                self.conn = self.pool.getconn()
+        self.started = time.perf_counter()
         self.cur = self.conn.cursor()
 
         return self.conn, self.cur
 
     def __exit__(self, type, value, traceback):
-        self.cur.close()
-        self.conn.close()
+        try:
+            self.cur.close()
+        finally:
+            # Any transaction that wasn't committed is rolled back when the connection is returned
+            if self.shared is None:
+                self.pool.putconn(self.conn)
+
+            QUERY_SECONDS.observe(time.perf_counter() - self.started, query=self.query)
+            if type is not None:
+                QUERY_ERRORS.inc(query=self.query)
 
 
 def fetch_all_handles() -> List[str]:
     """Fetches a list of Twitter handles."""
-    with Postgres(**DB_CREDENTIALS) as (_, cur):
+    with Postgres("fetch_all_handles") as (_, cur):
         cur.execute("SELECT handle FROM twitter_handles;")
         rows = cur.fetchall()
 
     return [handle[0] for handle in rows]
 
 
+def fetch_subscriptions() -> List[dict]:
+    """
+    Fetches every handle that has at least one watcher, along with the watchers of each handle.
+
+    Returns:
+        a list of dictionaries representing a Twitter handle and the IDs of it's watchers
+    """
+    query = """SELECT th._id, th.handle, th.created_at, th.updated_at,
+               array_agg(w._id ORDER BY w._id), array_agg(w.chat_id ORDER BY w._id),
+               array_agg(w.digest ORDER BY w._id)
+               FROM twitter_handles th
+               JOIN watcher_handle_join whj ON th._id = whj.handle_id
+               JOIN watchers w ON whj.watcher_id = w._id
+               GROUP BY th._id
+               ORDER BY th.handle;"""
+
+    with Postgres("fetch_subscriptions") as (_, cur):
+        cur.execute(query)
+        rows = cur.fetchall()
+
+    return [
+        {
+            "id": row[0],
+            "handle": row[1],
+            "createdAt": row[2],
+            "updatedAt": row[3],
+            "watchers": [
+                {"id": watcher_id, "chatID": chat_id, "digest": digest}
+                for watcher_id, chat_id, digest in zip(row[4], row[5], row[6])
+            ],
+        }
+        for row in rows
+    ]
+
+
 def fetch_handle(handle: str):
     """
     Fetches data relating to the given handle.
@@ -78,8 +278,15 @@ def fetch_handle(handle: str):
     Returns:
         a dictionary representing a Twitter handle and it's watchers
     """
-    assert_handle_exists(handle)
+    # Within a snapshot the cache is skipped, it may be older or newer than the snapshot
+    if in_snapshot():
+        return _query_handle(handle)
+
+    return read_cache.get_or_load(_handle_key(handle), lambda: _query_handle(handle))
+
 
+def _query_handle(handle: str) -> dict:
+    """Queries the handle and it's watchers, see fetch_handle."""
     query = """SELECT th._id, th.handle, th.created_at, th.updated_at,
                w._id, w.chat_id, w.created_at, w.updated_at
                FROM twitter_handles th
@@ -87,10 +294,13 @@ def fetch_handle(handle: str):
                LEFT JOIN watchers w ON whj.watcher_id = w._id
                WHERE th.handle = %s;"""
 
-    with Postgres(**DB_CREDENTIALS) as (_, cur):
+    with Postgres("_query_handle") as (_, cur):
         cur.execute(query, (handle,))
         rows = cur.fetchall()
 
+    if not rows:
+        raise HandleNotFoundError(f"The @{handle} Twitter handle could not be found.")
+
     handle = {
         "id": rows[0][0],
         "handle": rows[0][1],
@@ -123,24 +333,31 @@ def fetch_watcher(chat_id: str) -> dict:
     Returns:
         a dict representation of a watcher and the handles being watched
     """
-    assert_watcher_exists(chat_id)
+    return read_cache.get_or_load(_watcher_key(chat_id), lambda: _query_watcher(chat_id))
 
-    query = """SELECT th._id, th.handle, th.created_at, th.updated_at, 
-               w._id, w.chat_id, w.created_at, w.updated_at
+
+def _query_watcher(chat_id: str) -> dict:
+    """Queries the watcher and the handles it watches, see fetch_watcher."""
+    query = """SELECT th._id, th.handle, th.created_at, th.updated_at,
+               w._id, w.chat_id, w.created_at, w.updated_at, w.digest
                FROM watchers w
                LEFT JOIN watcher_handle_join whj ON w._id = whj.watcher_id
                LEFT JOIN twitter_handles th ON whj.handle_id = th._id
                WHERE w.chat_id = %s;"""
 
-    with Postgres(**DB_CREDENTIALS) as (_, cur):
+    with Postgres("_query_watcher") as (_, cur):
         cur.execute(query, (chat_id,))
         rows = cur.fetchall()
 
+    if not rows:
+        raise WatcherNotFoundError(f"A watcher with chat_id {chat_id} could not be found.")
+
     watcher = {
         "id": rows[0][4],
         "chatID": rows[0][5],
         "createdAt": rows[0][6],
         "updatedAt": rows[0][7],
+        "digest": rows[0][8],
         "handles": [],
     }
 
@@ -170,7 +387,7 @@ def handle_exists(handle: str) -> bool:
     """
     query = "SELECT handle FROM twitter_handles WHERE handle = %s LIMIT 1"
 
-    with Postgres(**DB_CREDENTIALS) as (_, cur):
+    with Postgres("handle_exists") as (_, cur):
         cur.execute(query, (handle,))
         result = cur.fetchone()
 
@@ -187,7 +404,7 @@ def watcher_exists(chat_id: str) -> bool:
     Returns:
         bool: True if the chat_id exists, otherwise False
     """
-    with Postgres(**DB_CREDENTIALS) as (_, cur):
+    with Postgres("watcher_exists") as (_, cur):
         cur.execute("SELECT chat_id FROM watchers WHERE chat_id = %s", (chat_id,))
         result = cur.fetchone()
 
@@ -204,14 +421,20 @@ def add_handle(handle: str) -> bool:
     Returns:
         a boolean representing success or failure
     """
-    if handle_exists(handle):
-        return True
+    query = """INSERT INTO twitter_handles (handle) VALUES (%s)
+               ON CONFLICT (handle) DO NOTHING
+               RETURNING _id;"""
 
-    with Postgres(**DB_CREDENTIALS) as (conn, cur):
-        cur.execute("INSERT INTO twitter_handles (handle) VALUES (%s)", (handle,))
+    with Postgres("add_handle") as (conn, cur):
+        cur.execute(query, (handle,))
+        if cur.fetchone() is not None:
+            _notify_subscription_changes(cur, "handle_created", [handle])
+            _bump_subscription_version(cur)
         conn.commit()
 
-    return handle_exists(handle)
+    read_cache.invalidate(_handle_key(handle))
+
+    return True
 
 
 def add_watcher(chat_id: str) -> bool:
@@ -224,14 +447,47 @@ def add_watcher(chat_id: str) -> bool:
     Returns:
         a boolean representing success or failure
     """
-    if watcher_exists(chat_id):
-        return True
+    query = """INSERT INTO watchers (chat_id) VALUES (%s) ON CONFLICT (chat_id) DO NOTHING
+               RETURNING _id;"""
 
-    with Postgres(**DB_CREDENTIALS) as (conn, cur):
-        cur.execute("INSERT INTO watchers (chat_id) VALUES (%s)", (chat_id,))
+    with Postgres("add_watcher") as (conn, cur):
+        cur.execute(query, (chat_id,))
+        if cur.fetchone() is not None:
+            _bump_subscription_version(cur)
         conn.commit()
 
-    return watcher_exists(chat_id)
+    read_cache.invalidate(_watcher_key(chat_id))
+
+    return True
+
+
+def set_watcher_digest(chat_id: str, digest: bool) -> None:
+    """
+    Turns digest mode on or off for the watcher, creating the watcher if it doesn't exist.
+    In digest mode the watcher's new tweets are grouped into as few messages as possible.
+
+    Parameters:
+        chat_id (str): the chat ID of the Telegram chat
+        digest (bool): True to receive digests, False to receive a message per tweet
+    """
+    query = """INSERT INTO watchers (chat_id, digest) VALUES (%s, %s)
+               ON CONFLICT (chat_id) DO UPDATE SET digest = EXCLUDED.digest, updated_at = now()
+               WHERE watchers.digest IS DISTINCT FROM EXCLUDED.digest
+               RETURNING _id;"""
+
+    with Postgres("set_watcher_digest") as (conn, cur):
+        cur.execute(query, (chat_id, digest))
+        if cur.fetchone() is not None:
+            cur.execute(
+                """SELECT pg_notify(%s, json_build_object(
+                       'event', 'digest', 'handle', NULL, 'chatID', %s, 'digest', %s
+                   )::text);""",
+                (SUBSCRIPTION_CHANNEL, chat_id, digest),
+            )
+            _bump_subscription_version(cur)
+        conn.commit()
+
+    read_cache.invalidate(_watcher_key(chat_id))
 
 
 def delete_watch_relationship(handle: str, chat_id: str):
@@ -245,23 +501,38 @@ def delete_watch_relationship(handle: str, chat_id: str):
     Returns:
         a boolean representing success or failure
     """
-    assert_handle_exists(handle)
-    assert_watcher_exists(chat_id)
+    # The lookups and the delete run as a single statement, the counts tell us what was missing
+    query = """WITH h AS (SELECT _id FROM twitter_handles WHERE handle = %s),
+               w AS (SELECT _id FROM watchers WHERE chat_id = %s),
+               deleted AS (
+                   DELETE FROM watcher_handle_join whj
+                   USING h, w
+                   WHERE whj.handle_id = h._id AND whj.watcher_id = w._id
+                   RETURNING whj._id
+               )
+               SELECT (SELECT count(*) FROM h),
+                      (SELECT count(*) FROM w),
+                      (SELECT count(*) FROM deleted);"""
+
+    with Postgres("delete_watch_relationship") as (conn, cur):
+        cur.execute(query, (handle, chat_id))
+        handle_count, watcher_count, deleted_count = cur.fetchone()
+        if deleted_count:
+            _notify_subscription_changes(cur, "unwatch", [handle], chat_id)
+            _bump_subscription_version(cur)
+        conn.commit()
+
+    read_cache.invalidate(_handle_key(handle), _watcher_key(chat_id))
 
-    watcher = fetch_watcher(chat_id)
-    watched_handles = [h["handle"] for h in watcher["handles"]]
-    if not handle in watched_handles:
+    if not handle_count:
+        raise HandleNotFoundError(f"The @{handle} Twitter handle could not be found.")
+    if not watcher_count:
+        raise WatcherNotFoundError(f"A watcher with chat_id {chat_id} could not be found.")
+    if not deleted_count:
         raise NoWatchRelationshipExistsError(
             f"The handle @{handle} is not being watched by {chat_id}."
         )
 
-    handle = fetch_handle(handle)
-
-    query = "DELETE FROM watcher_handle_join WHERE handle_id = %s AND watcher_id = %s;"
-    with Postgres(**DB_CREDENTIALS) as (conn, cur):
-        cur.execute(query, (handle["id"], watcher["id"]))
-        conn.commit()
-
 
 def create_watch_relationship(_handle: str, _chat_id: str) -> bool:
     """
@@ -275,22 +546,685 @@ def create_watch_relationship(_handle: str, _chat_id: str) -> bool:
     Returns:
         a boolean representing success or failure
     """
-    # Add the handle and watcher if they are not already in the database
-    add_handle(_handle)
-    add_watcher(_chat_id)
+    # Existing handles and watchers are left untouched, their IDs are selected instead of being
+    # returned by the insert, and the unique (watcher_id, handle_id) index then decides whether
+    # the relationship already exists
+    query = """WITH new_h AS (
+                   INSERT INTO twitter_handles (handle) VALUES (%(handle)s)
+                   ON CONFLICT (handle) DO NOTHING
+                   RETURNING _id
+               ),
+               h AS (
+                   SELECT _id, true AS inserted FROM new_h
+                   UNION ALL
+                   SELECT _id, false FROM twitter_handles WHERE handle = %(handle)s
+               ),
+               new_w AS (
+                   INSERT INTO watchers (chat_id) VALUES (%(chat_id)s)
+                   ON CONFLICT (chat_id) DO NOTHING
+                   RETURNING _id
+               ),
+               w AS (
+                   SELECT _id FROM new_w
+                   UNION ALL
+                   SELECT _id FROM watchers WHERE chat_id = %(chat_id)s
+               ),
+               created AS (
+                   INSERT INTO watcher_handle_join (handle_id, watcher_id)
+                   SELECT h._id, w._id FROM h, w
+                   ON CONFLICT (watcher_id, handle_id) DO NOTHING
+                   RETURNING _id
+               )
+               SELECT EXISTS (SELECT 1 FROM h) AND EXISTS (SELECT 1 FROM w),
+                      EXISTS (SELECT 1 FROM created),
+                      COALESCE((SELECT inserted FROM h), false);"""
+
+    with Postgres("create_watch_relationship") as (conn, cur):
+        # A handle or watcher committed by a concurrent transaction after the statement started
+        # is skipped by the insert but not seen by the select, so the statement is run again
+        found, created, handle_created = False, False, False
+        while not found:
+            cur.execute(query, {"handle": _handle, "chat_id": _chat_id})
+            found, created, inserted = cur.fetchone()
+            handle_created = handle_created or inserted
+
+        if handle_created:
+            _notify_subscription_changes(cur, "handle_created", [_handle])
+        if created:
+            _notify_subscription_changes(cur, "watch", [_handle], _chat_id)
+            _bump_subscription_version(cur)
+        conn.commit()
 
-    # Determine if the watcher is already watching the handle and exit if so
-    watcher = fetch_watcher(_chat_id)
-    watcher_watched_handles = [h["handle"] for h in watcher["handles"]]
-    if _handle in watcher_watched_handles:
+    read_cache.invalidate(_handle_key(_handle), _watcher_key(_chat_id))
+
+    if not created:
         raise WatchRelationshipAlreadyExistsError()
 
-    handle = fetch_handle(_handle)
+    return True
+
+
+def create_watch_relationships(handles: List[str], chat_id: str) -> Dict[str, bool]:
+    """
+    Create relationships between each of the Twitter handles and a Telegram chat ID.
+    If the handles or chat_id do not exist, they are created automatically.
+
+    Parameters:
+        handles (List[str]): the Twitter handles to be watched
+        chat_id (str): The chat ID of the Telegram chat doing the watching
+
+    Returns:
+        a dict keyed by handle, True if the relationship was created or False if it already existed
+    """
+    handles = list(dict.fromkeys(handles))
+    if not handles:
+        return {}
+
+    # As in create_watch_relationship, existing handles and the watcher are selected rather than
+    # updated so the insert doesn't rewrite their rows
+    query = """WITH new_w AS (
+                   INSERT INTO watchers (chat_id) VALUES (%(chat_id)s)
+                   ON CONFLICT (chat_id) DO NOTHING
+                   RETURNING _id
+               ),
+               w AS (
+                   SELECT _id FROM new_w
+                   UNION ALL
+                   SELECT _id FROM watchers WHERE chat_id = %(chat_id)s
+               ),
+               new_h AS (
+                   INSERT INTO twitter_handles (handle) SELECT unnest(%(handles)s::text[])
+                   ON CONFLICT (handle) DO NOTHING
+                   RETURNING _id, handle
+               ),
+               h AS (
+                   SELECT _id, handle, true AS inserted FROM new_h
+                   UNION ALL
+                   SELECT _id, handle, false FROM twitter_handles
+                   WHERE handle = ANY(%(handles)s::text[])
+               ),
+               created AS (
+                   INSERT INTO watcher_handle_join (handle_id, watcher_id)
+                   SELECT h._id, w._id FROM h, w
+                   ON CONFLICT (watcher_id, handle_id) DO NOTHING
+                   RETURNING handle_id
+               )
+               SELECT h.handle, h.inserted, created.handle_id IS NOT NULL,
+                      EXISTS (SELECT 1 FROM w)
+               FROM h LEFT JOIN created ON created.handle_id = h._id;"""
+
+    with Postgres("create_watch_relationships") as (conn, cur):
+        # Run again while a handle or the watcher was committed concurrently and not yet seen
+        created, handles_created = set(), set()
+        found = False
+        while not found:
+            cur.execute(query, {"chat_id": chat_id, "handles": handles})
+            rows = cur.fetchall()
+            found = len(rows) == len(handles) and all(row[3] for row in rows)
+            created.update(row[0] for row in rows if row[2])
+            handles_created.update(row[0] for row in rows if row[1])
+
+        _notify_subscription_changes(cur, "handle_created", sorted(handles_created))
+        _notify_subscription_changes(cur, "watch", sorted(created), chat_id)
+        if created:
+            _bump_subscription_version(cur)
+        conn.commit()
+
+    read_cache.invalidate(_watcher_key(chat_id), *[_handle_key(h) for h in handles])
+
+    return {handle: handle in created for handle in handles}
+
+
+def delete_watch_relationships(handles: List[str], chat_id: str) -> Dict[str, bool]:
+    """
+    Delete the relationships between each of the Twitter handles and a Telegram chat.
+
+    Parameters:
+        handles (List[str]): the Twitter handles to be unwatched
+        chat_id (str): The chat ID of the Telegram chat doing the watching
 
-    # Create the new relationship
-    query = "INSERT INTO watcher_handle_join (handle_id, watcher_id) VALUES (%s, %s);"
-    with Postgres(**DB_CREDENTIALS) as (conn, cur):
-        cur.execute(query, (handle["id"], watcher["id"]))
+    Returns:
+        a dict keyed by handle, True if the relationship was deleted or False if it didn't exist
+    """
+    handles = list(dict.fromkeys(handles))
+
+    query = """WITH w AS (SELECT _id FROM watchers WHERE chat_id = %s),
+               deleted AS (
+                   DELETE FROM watcher_handle_join whj
+                   USING w, twitter_handles th
+                   WHERE whj.watcher_id = w._id AND whj.handle_id = th._id AND th.handle = ANY(%s)
+                   RETURNING th.handle
+               )
+               SELECT (SELECT count(*) FROM w), ARRAY(SELECT handle FROM deleted);"""
+
+    with Postgres("delete_watch_relationships") as (conn, cur):
+        cur.execute(query, (chat_id, handles))
+        watcher_count, deleted = cur.fetchone()
+        _notify_subscription_changes(cur, "unwatch", deleted, chat_id)
+        if deleted:
+            _bump_subscription_version(cur)
         conn.commit()
 
-    return True
+    read_cache.invalidate(_watcher_key(chat_id), *[_handle_key(h) for h in deleted])
+
+    if not watcher_count:
+        raise WatcherNotFoundError(f"A watcher with chat_id {chat_id} could not be found.")
+
+    return {handle: handle in deleted for handle in handles}
+
+
+def delete_all_watch_relationships(chat_id: str) -> List[str]:
+    """
+    Delete every relationship between the Telegram chat and the Twitter handles it watches.
+
+    Parameters:
+        chat_id (str): The chat ID of the Telegram chat doing the watching
+
+    Returns:
+        the handles that are no longer being watched
+    """
+    query = """WITH w AS (SELECT _id FROM watchers WHERE chat_id = %s),
+               deleted AS (
+                   DELETE FROM watcher_handle_join whj
+                   USING w, twitter_handles th
+                   WHERE whj.watcher_id = w._id AND whj.handle_id = th._id
+                   RETURNING th.handle
+               )
+               SELECT (SELECT count(*) FROM w), ARRAY(SELECT handle FROM deleted ORDER BY handle);"""
+
+    with Postgres("delete_all_watch_relationships") as (conn, cur):
+        cur.execute(query, (chat_id,))
+        watcher_count, deleted = cur.fetchone()
+        _notify_subscription_changes(cur, "unwatch", deleted, chat_id)
+        if deleted:
+            _bump_subscription_version(cur)
+        conn.commit()
+
+    read_cache.invalidate(_watcher_key(chat_id), *[_handle_key(h) for h in deleted])
+
+    if not watcher_count:
+        raise WatcherNotFoundError(f"A watcher with chat_id {chat_id} could not be found.")
+
+    return list(deleted)
+
+
+def heartbeat_poller_worker(worker_id: str, ttl_seconds: int = POLLER_HEARTBEAT_TTL_SECONDS) -> List[str]:
+    """
+    Records a heartbeat for the poller worker and forgets workers that have stopped sending them.
+
+    Parameters:
+        worker_id (str): the unique ID of the poller worker
+        ttl_seconds (int): workers without a heartbeat for this long are considered dead
+
+    Returns:
+        the sorted IDs of every live poller worker, including the given worker
+    """
+    with Postgres("heartbeat_poller_worker") as (conn, cur):
+        cur.execute(
+            """INSERT INTO poller_workers (worker_id) VALUES (%s)
+               ON CONFLICT (worker_id) DO UPDATE SET heartbeat_at = CURRENT_TIMESTAMP;""",
+            (worker_id,),
+        )
+        cur.execute(
+            """DELETE FROM poller_workers
+               WHERE heartbeat_at < CURRENT_TIMESTAMP - make_interval(secs => %s);""",
+            (ttl_seconds,),
+        )
+        cur.execute("SELECT worker_id FROM poller_workers ORDER BY worker_id;")
+        rows = cur.fetchall()
+        conn.commit()
+
+    return [row[0] for row in rows]
+
+
+def remove_poller_worker(worker_id: str) -> None:
+    """
+    Removes the poller worker and releases its cursors, so its handles are taken over by the
+    remaining workers.
+
+    Parameters:
+        worker_id (str): the unique ID of the poller worker
+    """
+    with Postgres("remove_poller_worker") as (conn, cur):
+        cur.execute("DELETE FROM poller_workers WHERE worker_id = %s;", (worker_id,))
+        cur.execute(
+            "UPDATE poller_cursors SET worker_id = NULL WHERE worker_id = %s;", (worker_id,)
+        )
+        conn.commit()
+
+
+def claim_poller_cursors(
+    worker_id: str, handles: List[str], ttl_seconds: int = POLLER_HEARTBEAT_TTL_SECONDS
+) -> Dict[str, Optional[int]]:
+    """
+    Claims the cursors of the handles for the poller worker. A cursor held by another worker
+    is only claimed once that worker has released it or stopped sending heartbeats, so a
+    handle is never polled by two workers at once and its cursor moves with it.
+
+    Parameters:
+        worker_id (str): the unique ID of the poller worker
+        handles (List[str]): the handles about to be polled
+        ttl_seconds (int): workers without a heartbeat for this long are considered dead
+
+    Returns:
+        the newest tweet ID seen, or None, for each handle that was claimed, keyed by handle
+    """
+    if not handles:
+        return {}
+
+    query = """INSERT INTO poller_cursors AS c (handle, worker_id)
+               SELECT DISTINCT lower(h), %s FROM unnest(%s::text[]) AS h
+               ON CONFLICT (handle) DO UPDATE
+               SET worker_id = EXCLUDED.worker_id, updated_at = CURRENT_TIMESTAMP
+               WHERE c.worker_id IS NULL OR c.worker_id = EXCLUDED.worker_id OR NOT EXISTS (
+                   SELECT 1 FROM poller_workers w
+                   WHERE w.worker_id = c.worker_id
+                   AND w.heartbeat_at >= CURRENT_TIMESTAMP - make_interval(secs => %s)
+               )
+               RETURNING c.handle, c.since_id;"""
+
+    with Postgres("claim_poller_cursors") as (conn, cur):
+        cur.execute(query, (worker_id, list(handles), ttl_seconds))
+        rows = cur.fetchall()
+        conn.commit()
+
+    claimed = dict(rows)
+    return {handle: claimed[handle.lower()] for handle in handles if handle.lower() in claimed}
+
+
+def advance_poller_cursors(worker_id: str, cursors: List[dict]) -> None:
+    """
+    Moves the cursors held by the poller worker forward, cursors are never moved backwards
+    and cursors since claimed by another worker are left alone.
+
+    Parameters:
+        worker_id (str): the unique ID of the poller worker
+        cursors (List[dict]): dicts with the handle and sinceID of each cursor
+    """
+    if not cursors:
+        return
+
+    query = """UPDATE poller_cursors c
+               SET since_id = GREATEST(c.since_id, u.since_id), updated_at = CURRENT_TIMESTAMP
+               FROM unnest(%s::text[], %s::bigint[]) AS u(handle, since_id)
+               WHERE c.handle = lower(u.handle) AND c.worker_id = %s;"""
+
+    with Postgres("advance_poller_cursors") as (conn, cur):
+        cur.execute(
+            query,
+            ([c["handle"] for c in cursors], [c["sinceID"] for c in cursors], worker_id),
+        )
+        conn.commit()
+
+
+def release_poller_cursors(worker_id: str, handles: List[str]) -> None:
+    """
+    Releases the poller worker's cursors of the handles, so another worker can claim them.
+
+    Parameters:
+        worker_id (str): the unique ID of the poller worker
+        handles (List[str]): the handles the worker no longer polls
+    """
+    if not handles:
+        return
+
+    query = """UPDATE poller_cursors SET worker_id = NULL
+               WHERE handle = ANY(%s::text[]) AND worker_id = %s;"""
+
+    with Postgres("release_poller_cursors") as (conn, cur):
+        cur.execute(query, ([handle.lower() for handle in handles], worker_id))
+        conn.commit()
+
+
+def claim_sent_tweets(pairs: List[dict]) -> List[dict]:
+    """
+    Records the tweets as sent to the chats, in a single statement, unless they already have
+    been. Claiming a pair before its message is queued means it's only ever queued once.
+
+    Parameters:
+        pairs (List[dict]): dicts with the tweetID and chatID of each tweet about to be sent
+
+    Returns:
+        the pairs that hadn't been sent before and have now been claimed
+    """
+    if not pairs:
+        return []
+
+    query = """INSERT INTO sent_tweets (tweet_id, chat_id)
+               SELECT * FROM unnest(%s::bigint[], %s::text[])
+               ON CONFLICT DO NOTHING
+               RETURNING tweet_id, chat_id;"""
+
+    with Postgres("claim_sent_tweets") as (conn, cur):
+        cur.execute(query, ([p["tweetID"] for p in pairs], [str(p["chatID"]) for p in pairs]))
+        rows = cur.fetchall()
+        conn.commit()
+
+    claimed = set(rows)
+    return [p for p in pairs if (p["tweetID"], str(p["chatID"])) in claimed]
+
+
+def find_unsent_tweets(pairs: List[dict]) -> List[dict]:
+    """
+    Finds the tweets that haven't been sent to the chats, without claiming them.
+
+    Parameters:
+        pairs (List[dict]): dicts with the tweetID and chatID of each tweet
+
+    Returns:
+        the pairs that haven't been sent
+    """
+    if not pairs:
+        return []
+
+    query = """SELECT tweet_id, chat_id FROM sent_tweets
+               WHERE (tweet_id, chat_id) IN (SELECT * FROM unnest(%s::bigint[], %s::text[]));"""
+
+    with Postgres("find_unsent_tweets") as (conn, cur):
+        cur.execute(query, ([p["tweetID"] for p in pairs], [str(p["chatID"]) for p in pairs]))
+        sent = set(cur.fetchall())
+
+    return [p for p in pairs if (p["tweetID"], str(p["chatID"])) not in sent]
+
+
+def release_sent_tweets(pairs: List[dict]) -> None:
+    """
+    Forgets that the tweets were sent to the chats, for messages that couldn't be delivered.
+
+    Parameters:
+        pairs (List[dict]): dicts with the tweetID and chatID of each tweet
+    """
+    if not pairs:
+        return
+
+    query = """DELETE FROM sent_tweets s
+               USING unnest(%s::bigint[], %s::text[]) AS p(tweet_id, chat_id)
+               WHERE s.tweet_id = p.tweet_id AND s.chat_id = p.chat_id;"""
+
+    with Postgres("release_sent_tweets") as (conn, cur):
+        cur.execute(query, ([p["tweetID"] for p in pairs], [str(p["chatID"]) for p in pairs]))
+        conn.commit()
+
+
+def prune_sent_tweets(retention_hours: float) -> int:
+    """
+    Forgets the tweets sent longer ago than the retention period, by which time the cursors
+    will have long moved past them.
+
+    Parameters:
+        retention_hours (float): how long a sent tweet is remembered for
+
+    Returns:
+        the number of sent tweets forgotten
+    """
+    query = """DELETE FROM sent_tweets
+               WHERE sent_at < CURRENT_TIMESTAMP - make_interval(secs => %s);"""
+
+    with Postgres("prune_sent_tweets") as (conn, cur):
+        cur.execute(query, (retention_hours * 3600,))
+        pruned = cur.rowcount
+        conn.commit()
+
+    return pruned
+
+
+def fetch_latest_tweet(handle: str) -> dict:
+    """
+    Fetches the newest tweet recorded for the given handle.
+
+    Parameters:
+        handle (str): the Twitter handle
+
+    Returns:
+        a dict representing the tweet, including how many seconds ago it was recorded or, if
+        later, the handle was last polled by a sharded poller worker, as it was still the newest
+    """
+    # GREATEST ignores the NULL of a handle without a poller cursor
+    query = """SELECT lt.handle, lt.tweet_id, lt.url, lt.updated_at,
+               EXTRACT(EPOCH FROM CURRENT_TIMESTAMP - GREATEST(lt.updated_at, pc.updated_at))
+               FROM latest_tweets lt
+               LEFT JOIN poller_cursors pc ON pc.handle = lower(lt.handle)
+               WHERE lt.handle = %s;"""
+
+    with Postgres("fetch_latest_tweet") as (_, cur):
+        cur.execute(query, (handle,))
+        row = cur.fetchone()
+
+    if row is None:
+        raise LatestTweetNotFoundError(f"No tweets have been recorded for @{handle}.")
+
+    return {
+        "handle": row[0],
+        "tweetID": row[1],
+        "url": row[2],
+        "updatedAt": row[3],
+        "ageSeconds": float(row[4]),
+    }
+
+
+def upsert_latest_tweets(tweets: List[dict]) -> None:
+    """
+    Records the newest tweet for each handle. A row is only written when the tweet is newer
+    than the one recorded, so the same tweet recorded again costs no write.
+
+    Parameters:
+        tweets (List[dict]): dicts with the handle, tweetID and url of each tweet
+    """
+    if not tweets:
+        return
+
+    query = """INSERT INTO latest_tweets (handle, tweet_id, url)
+               SELECT * FROM unnest(%s::text[], %s::bigint[], %s::text[])
+               ON CONFLICT (handle) DO UPDATE
+               SET tweet_id = EXCLUDED.tweet_id, url = EXCLUDED.url, updated_at = CURRENT_TIMESTAMP
+               WHERE latest_tweets.tweet_id < EXCLUDED.tweet_id;"""
+
+    # A handle may only appear once in a single upsert, so keep the newest tweet for each
+    newest = {}
+    for tweet in tweets:
+        current = newest.get(tweet["handle"])
+        if current is None or current["tweetID"] < tweet["tweetID"]:
+            newest[tweet["handle"]] = tweet
+
+    with Postgres("upsert_latest_tweets") as (conn, cur):
+        cur.execute(
+            query,
+            (
+                [t["handle"] for t in newest.values()],
+                [t["tweetID"] for t in newest.values()],
+                [t["url"] for t in newest.values()],
+            ),
+        )
+        conn.commit()
+
+
+def enqueue_outbox_messages(messages: List[dict]) -> int:
+    """
+    Adds the messages to the outbox in a single statement.
+
+    Parameters:
+        messages (List[dict]): dicts with the chatID and text of each message
+
+    Returns:
+        the number of messages added
+    """
+    if not messages:
+        return 0
+
+    query = """INSERT INTO outbox (chat_id, text)
+               SELECT * FROM unnest(%s::text[], %s::text[]);"""
+
+    with Postgres("enqueue_outbox_messages") as (conn, cur):
+        cur.execute(
+            query,
+            ([str(m["chatID"]) for m in messages], [m["text"] for m in messages]),
+        )
+        conn.commit()
+
+    return len(messages)
+
+
+def claim_outbox_messages(worker_id: str, limit: int, lease_seconds: float) -> List[dict]:
+    """
+    Claims the oldest messages that are ready to be delivered for the length of a lease.
+
+    Rows locked by another worker's claim are skipped rather than waited for, so any number
+    of workers can claim at once. A message whose lease runs out before it is completed,
+    retried or failed can be claimed again.
+
+    Parameters:
+        worker_id (str): the unique ID of the delivery worker
+        limit (int): the maximum number of messages to claim
+        lease_seconds (float): how long the messages are claimed for
+
+    Returns:
+        a list of dicts with the id, chatID, text and attempts of each message, oldest first
+    """
+    # Claiming a message pushes its available_at back to the end of the lease
+    query = """UPDATE outbox o
+               SET claimed_by = %s,
+                   attempts = o.attempts + 1,
+                   available_at = CURRENT_TIMESTAMP + make_interval(secs => %s)
+               FROM (
+                   SELECT _id FROM outbox
+                   WHERE failed_at IS NULL AND available_at <= CURRENT_TIMESTAMP
+                   ORDER BY available_at, _id
+                   LIMIT %s
+                   FOR UPDATE SKIP LOCKED
+               ) ready
+               WHERE o._id = ready._id
+               RETURNING o._id, o.chat_id, o.text, o.attempts;"""
+
+    with Postgres("claim_outbox_messages") as (conn, cur):
+        cur.execute(query, (worker_id, lease_seconds, limit))
+        rows = cur.fetchall()
+        conn.commit()
+
+    return [
+        {"id": row[0], "chatID": row[1], "text": row[2], "attempts": row[3]}
+        for row in sorted(rows)
+    ]
+
+
+def extend_outbox_leases(worker_id: str, ids: List[int], lease_seconds: float) -> List[int]:
+    """
+    Extends the lease of the claimed messages that are still being delivered.
+
+    Parameters:
+        worker_id (str): the unique ID of the delivery worker holding the claims
+        ids (List[int]): the IDs of the messages still being delivered
+        lease_seconds (float): how long the messages are held for from now
+
+    Returns:
+        the IDs of the messages whose lease was extended, a message claimed since by another
+        worker, after this worker's lease ran out, is left alone
+    """
+    if not ids:
+        return []
+
+    query = """UPDATE outbox
+               SET available_at = CURRENT_TIMESTAMP + make_interval(secs => %s)
+               WHERE _id = ANY(%s::bigint[]) AND claimed_by = %s AND failed_at IS NULL
+               RETURNING _id;"""
+
+    with Postgres("extend_outbox_leases") as (conn, cur):
+        cur.execute(query, (lease_seconds, list(ids), worker_id))
+        rows = cur.fetchall()
+        conn.commit()
+
+    return [row[0] for row in rows]
+
+
+def complete_outbox_messages(ids: List[int]) -> None:
+    """
+    Removes the delivered messages from the outbox.
+
+    Parameters:
+        ids (List[int]): the IDs of the delivered messages
+    """
+    if not ids:
+        return
+
+    with Postgres("complete_outbox_messages") as (conn, cur):
+        cur.execute("DELETE FROM outbox WHERE _id = ANY(%s::bigint[]);", (list(ids),))
+        conn.commit()
+
+
+def retry_outbox_messages(worker_id: str, retries: List[dict]) -> None:
+    """
+    Releases the claimed messages to be delivered again after a delay.
+
+    Parameters:
+        worker_id (str): the unique ID of the delivery worker holding the claims
+        retries (List[dict]): dicts with the id and delaySeconds of each message
+    """
+    if not retries:
+        return
+
+    # Messages claimed since by another worker, after this worker's lease ran out, are left alone
+    query = """UPDATE outbox o
+               SET claimed_by = NULL,
+                   available_at = CURRENT_TIMESTAMP + make_interval(secs => r.delay)
+               FROM unnest(%s::bigint[], %s::float8[]) AS r(_id, delay)
+               WHERE o._id = r._id AND o.claimed_by = %s;"""
+
+    with Postgres("retry_outbox_messages") as (conn, cur):
+        cur.execute(
+            query,
+            (
+                [r["id"] for r in retries],
+                [float(r["delaySeconds"]) for r in retries],
+                worker_id,
+            ),
+        )
+        conn.commit()
+
+
+def fail_outbox_messages(worker_id: str, ids: List[int]) -> None:
+    """
+    Marks the claimed messages as failed, they are kept for inspection but never retried.
+
+    Parameters:
+        worker_id (str): the unique ID of the delivery worker holding the claims
+        ids (List[int]): the IDs of the failed messages
+    """
+    if not ids:
+        return
+
+    query = """UPDATE outbox SET failed_at = CURRENT_TIMESTAMP, claimed_by = NULL
+               WHERE _id = ANY(%s::bigint[]) AND claimed_by = %s;"""
+
+    with Postgres("fail_outbox_messages") as (conn, cur):
+        cur.execute(query, (list(ids), worker_id))
+        conn.commit()
+
+
+def fetch_outbox_stats() -> dict:
+    """
+    Fetches the depth of the outbox and the age of its oldest message.
+
+    Returns:
+        a dict with the depth, ready, claimed and failed message counts and oldestAgeSeconds
+    """
+    query = """SELECT
+                   count(*) FILTER (WHERE failed_at IS NULL),
+                   count(*) FILTER (WHERE failed_at IS NULL AND available_at <= CURRENT_TIMESTAMP),
+                   count(*) FILTER (
+                       WHERE failed_at IS NULL AND claimed_by IS NOT NULL
+                       AND available_at > CURRENT_TIMESTAMP
+                   ),
+                   count(*) FILTER (WHERE failed_at IS NOT NULL),
+                   EXTRACT(EPOCH FROM CURRENT_TIMESTAMP
+                       - min(created_at) FILTER (WHERE failed_at IS NULL))
+               FROM outbox;"""
+
+    with Postgres("fetch_outbox_stats") as (_, cur):
+        cur.execute(query)
+        depth, ready, claimed, failed, oldest_age = cur.fetchone()
+
+    return {
+        "depth": depth,
+        "ready": ready,
+        "claimed": claimed,
+        "failed": failed,
+        "oldestAgeSeconds": float(oldest_age) if oldest_age is not None else None,
+    }
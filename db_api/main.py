@@ -2,11 +2,23 @@ from flask import Flask
 from flask_restful import Api
 
 from constants import DB_API_HOST, DB_API_PORT
+from routes.cache_routes import cache_routes
 from routes.handle_routes import handle_routes
+from routes.latest_tweet_routes import latest_tweet_routes
+from routes.metrics_routes import metrics_routes
+from routes.outbox_routes import outbox_routes
+from routes.poller_routes import poller_routes
+from routes.subscription_routes import subscription_routes
 from routes.watcher_routes import watcher_routes
 
 app = Flask("TwitterSnoop_DB_Api")
+app.register_blueprint(cache_routes)
 app.register_blueprint(handle_routes)
+app.register_blueprint(latest_tweet_routes)
+app.register_blueprint(metrics_routes)
+app.register_blueprint(outbox_routes)
+app.register_blueprint(poller_routes)
+app.register_blueprint(subscription_routes)
 app.register_blueprint(watcher_routes)
 api = Api(app)
 
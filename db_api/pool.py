@@ -0,0 +1,194 @@
+import time
+import threading
+from typing import List, Optional, Tuple
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolExhaustedError(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of Postgres connections.
+
+    min_size connections are opened when the pool is created. Connections that have sat idle
+    for longer than health_check_idle_seconds are health checked when they are checked out and
+    connections which have sat idle for longer than max_idle_seconds are closed, down to a floor
+    of min_size connections.
+    """
+
+    def __init__(
+        self,
+        min_size: int,
+        max_size: int,
+        max_idle_seconds: float,
+        timeout_seconds: float,
+        health_check_idle_seconds: float = 1.0,
+        **connect_kwargs,
+    ):
+        """
+        Parameters:
+            min_size (int): the number of connections to open up front and keep open when idle
+            max_size (int): the maximum number of connections open at any one time
+            max_idle_seconds (float): idle connections older than this are closed
+            timeout_seconds (float): how long to wait for a connection when the pool is exhausted
+            health_check_idle_seconds (float): connections idle for longer than this are health
+                checked on checkout, those returned more recently are trusted to still work
+            connect_kwargs: keyword arguments passed to psycopg2.connect
+        """
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("The pool size must satisfy 0 <= min_size <= max_size and max_size >= 1.")
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_idle_seconds = max_idle_seconds
+        self.timeout_seconds = timeout_seconds
+        self.health_check_idle_seconds = health_check_idle_seconds
+        self.connect_kwargs = connect_kwargs
+
+        self._lock = threading.Condition()
+        self._idle: List[Tuple[extensions.connection, float]] = []
+        self._size = 0
+        self._closed = False
+
+        try:
+            for _ in range(min_size):
+                self._idle.append((self._connect(), time.monotonic()))
+                self._size += 1
+        except Exception:
+            self.closeall()
+            raise
+
+    def _connect(self) -> extensions.connection:
+        return psycopg2.connect(**self.connect_kwargs)
+
+    @staticmethod
+    def _is_healthy(conn: extensions.connection) -> bool:
+        """Returns True if the connection is open and able to run a trivial query."""
+        if conn.closed:
+            return False
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+
+        return True
+
+    def _discard(self, conn: extensions.connection) -> None:
+        """Closes a connection and releases its slot in the pool; the lock must be held."""
+        self._size -= 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _evict_idle(self) -> None:
+        """Closes connections that have been idle for too long; the lock must be held."""
+        cutoff = time.monotonic() - self.max_idle_seconds
+        keep = []
+
+        # The idle list is ordered oldest first, so the freshest connections are retained
+        for conn, released_at in self._idle:
+            if released_at < cutoff and self._size > self.min_size:
+                self._discard(conn)
+            else:
+                keep.append((conn, released_at))
+
+        self._idle = keep
+
+    def _wait_for_slot(self, deadline: float) -> Optional[Tuple[extensions.connection, float]]:
+        """
+        Pops the most recently returned idle connection, or reserves a slot for a new connection
+        if there are none and the pool has capacity; the lock must be held.
+
+        Returns:
+            the idle connection and when it was returned, or None if a slot was reserved
+        """
+        while True:
+            if self._closed:
+                raise PoolExhaustedError("The connection pool has been closed.")
+
+            self._evict_idle()
+
+            if self._idle:
+                return self._idle.pop()
+
+            if self._size < self.max_size:
+                self._size += 1
+                return None
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise PoolExhaustedError(
+                    f"No database connection became available within {self.timeout_seconds}s."
+                )
+            self._lock.wait(remaining)
+
+    def getconn(self) -> extensions.connection:
+        """
+        Checks a healthy connection out of the pool, opening a new one if there is capacity.
+        Connections that fail their health check are closed and the next is tried.
+
+        Raises PoolExhaustedError if no connection becomes available within timeout_seconds.
+        """
+        deadline = time.monotonic() + self.timeout_seconds
+
+        while True:
+            with self._lock:
+                idle = self._wait_for_slot(deadline)
+            if idle is None:
+                break
+
+            # Health checks are run outside of the lock so one connection's round trips don't
+            # hold up every other checkout
+            conn, released_at = idle
+            recent = time.monotonic() - released_at < self.health_check_idle_seconds
+            if (recent and not conn.closed) or self._is_healthy(conn):
+                return conn
+
+            with self._lock:
+                self._discard(conn)
+                self._lock.notify()
+
+        # Connect outside of the lock so a slow server doesn't block other checkouts
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._size -= 1
+                self._lock.notify()
+            raise
+
+    def putconn(self, conn: extensions.connection) -> None:
+        """Returns a connection to the pool, rolling back any transaction left open."""
+        with self._lock:
+            if self._closed or conn.closed:
+                self._discard(conn)
+                self._lock.notify()
+                return
+
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                self._discard(conn)
+                self._lock.notify()
+                return
+
+            self._idle.append((conn, time.monotonic()))
+            self._lock.notify()
+
+    def closeall(self) -> None:
+        """Closes every idle connection and prevents further checkouts."""
+        with self._lock:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._discard(conn)
+            self._idle = []
+            self._lock.notify_all()
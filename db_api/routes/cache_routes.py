@@ -0,0 +1,12 @@
+from flask import Blueprint
+
+import db
+from routes.format_response import format_response
+
+cache_routes = Blueprint("cache_routes", __name__)
+
+
+@cache_routes.route("/cache/stats")
+def get_cache_stats():
+    """Retrieve the hit and miss counters of the handle and watcher read cache."""
+    return format_response(db.read_cache.stats())
@@ -0,0 +1,28 @@
+from typing import Callable
+from flask import make_response, request
+
+import db
+from routes.format_response import format_response
+
+
+def versioned_response(build_payload: Callable[[], dict]):
+    """
+    Responds with the payload tagged with the subscription version as its ETag.
+
+    If the request's If-None-Match header matches the current version a 304 Not Modified is
+    returned without building the payload. The version and the payload are read in the same
+    snapshot, so a payload is never tagged with a version it doesn't match.
+
+    Parameters:
+        build_payload (Callable): returns the payload to be sent if it has changed
+    """
+    with db.Snapshot():
+        version = str(db.fetch_subscription_version())
+
+        if request.if_none_match.contains(version):
+            response = make_response("", 304)
+        else:
+            response = make_response(format_response(build_payload()))
+
+    response.set_etag(version)
+    return response
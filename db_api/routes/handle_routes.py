@@ -2,6 +2,7 @@ from flask import Blueprint
 
 import db
 from db import HandleNotFoundError
+from routes.conditional import versioned_response
 from routes.format_response import format_response
 
 handle_routes = Blueprint("handle_routes", __name__)
@@ -10,16 +11,14 @@ handle_routes = Blueprint("handle_routes", __name__)
 @handle_routes.route("/handles")
 def get_all_handles():
     """Retrieve a list of Twitter handles."""
-    handles = db.fetch_all_handles()
-    return format_response({"handles": handles})
+    return versioned_response(lambda: {"handles": db.fetch_all_handles()})
 
 
 @handle_routes.route("/handle/<handle>")
 def get_handle(handle: str):
     """Retrieve data relating to the given Twitter handle."""
     try:
-        handle = db.fetch_handle(handle)
-        response = format_response(handle)
+        response = versioned_response(lambda: db.fetch_handle(handle))
     except HandleNotFoundError as e:
         response = format_response(error={"message": f"{e}"})
 
@@ -0,0 +1,32 @@
+from flask import Blueprint, request
+
+import db
+from db import LatestTweetNotFoundError
+from routes.format_response import format_response
+
+latest_tweet_routes = Blueprint("latest_tweet_routes", __name__)
+
+
+@latest_tweet_routes.route("/handle/<handle>/latest")
+def get_latest_tweet(handle: str):
+    """Retrieve the newest tweet recorded for the given Twitter handle."""
+    try:
+        tweet = db.fetch_latest_tweet(handle)
+    except LatestTweetNotFoundError as e:
+        return format_response(error={"message": f"{e}"}), 404
+
+    return format_response(tweet)
+
+
+@latest_tweet_routes.route("/latest", methods=["PUT"])
+def update_latest_tweets():
+    """Record the newest tweet for each of the given Twitter handles."""
+    body = request.get_json(silent=True) or {}
+    tweets = body.get("tweets")
+
+    if not isinstance(tweets, list):
+        err = {"message": "The request body must contain a list of tweets."}
+        return format_response(error=err), 400
+
+    db.upsert_latest_tweets(tweets)
+    return format_response()
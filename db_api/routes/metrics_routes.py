@@ -0,0 +1,43 @@
+import time
+
+from flask import Blueprint, Response, g, request
+
+from metrics import CONTENT_TYPE, registry
+
+metrics_routes = Blueprint("metrics_routes", __name__)
+
+REQUEST_SECONDS = registry.histogram(
+    "db_api_request_seconds", "Time taken to handle a request, by route.", ["endpoint"]
+)
+REQUESTS = registry.counter(
+    "db_api_requests_total",
+    "Requests handled, by method, route and status code.",
+    ["method", "endpoint", "status"],
+)
+
+
+def _endpoint() -> str:
+    # The route's rule, e.g. /watchers/<chat_id>, rather than the path, to keep the labels few
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+@metrics_routes.before_app_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+
+@metrics_routes.after_app_request
+def record_request(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        endpoint = _endpoint()
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+        REQUESTS.inc(method=request.method, endpoint=endpoint, status=response.status_code)
+
+    return response
+
+
+@metrics_routes.route("/metrics")
+def get_metrics():
+    """Retrieve the metrics of the db_api in the Prometheus text format."""
+    return Response(registry.render(), content_type=CONTENT_TYPE)
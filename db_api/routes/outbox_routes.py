@@ -0,0 +1,82 @@
+from flask import Blueprint, request
+
+import db
+from routes.format_response import format_response
+
+outbox_routes = Blueprint("outbox_routes", __name__)
+
+
+@outbox_routes.route("/outbox", methods=["POST"])
+def enqueue_messages():
+    """Adds the messages to the outbox to be delivered by the delivery workers."""
+    body = request.get_json(silent=True) or {}
+    messages = body.get("messages")
+
+    if not isinstance(messages, list):
+        err = {"message": "The request body must contain a list of messages."}
+        return format_response(error=err), 400
+
+    queued = db.enqueue_outbox_messages(messages)
+    return format_response({"queued": queued}), 201
+
+
+@outbox_routes.route("/outbox/claim", methods=["POST"])
+def claim_messages():
+    """Claims the oldest messages that are ready to be delivered."""
+    body = request.get_json(silent=True) or {}
+    worker_id = body.get("workerID")
+
+    if not isinstance(worker_id, str):
+        err = {"message": "The request body must contain a workerID."}
+        return format_response(error=err), 400
+
+    messages = db.claim_outbox_messages(
+        worker_id, int(body.get("limit") or 100), float(body.get("leaseSeconds") or 120)
+    )
+    return format_response({"messages": messages})
+
+
+@outbox_routes.route("/outbox/extend", methods=["POST"])
+def extend_leases():
+    """Extends the lease of the claimed messages that are still being delivered."""
+    body = request.get_json(silent=True) or {}
+    worker_id = body.get("workerID")
+
+    if not isinstance(worker_id, str):
+        err = {"message": "The request body must contain a workerID."}
+        return format_response(error=err), 400
+
+    extended = db.extend_outbox_leases(
+        worker_id, body.get("ids") or [], float(body.get("leaseSeconds") or 120)
+    )
+    return format_response({"ids": extended})
+
+
+@outbox_routes.route("/outbox/complete", methods=["POST"])
+def complete_messages():
+    """Removes the delivered messages from the outbox."""
+    body = request.get_json(silent=True) or {}
+    db.complete_outbox_messages(body.get("ids") or [])
+    return format_response()
+
+
+@outbox_routes.route("/outbox/retry", methods=["POST"])
+def retry_messages():
+    """Releases the claimed messages to be delivered again after a delay."""
+    body = request.get_json(silent=True) or {}
+    db.retry_outbox_messages(body.get("workerID"), body.get("retries") or [])
+    return format_response()
+
+
+@outbox_routes.route("/outbox/fail", methods=["POST"])
+def fail_messages():
+    """Marks the claimed messages as failed so they are never retried."""
+    body = request.get_json(silent=True) or {}
+    db.fail_outbox_messages(body.get("workerID"), body.get("ids") or [])
+    return format_response()
+
+
+@outbox_routes.route("/outbox/stats")
+def get_stats():
+    """Retrieve the depth of the outbox and the age of its oldest message."""
+    return format_response(db.fetch_outbox_stats())
@@ -0,0 +1,99 @@
+from flask import Blueprint, request
+
+import db
+from routes.format_response import format_response
+
+poller_routes = Blueprint("poller_routes", __name__)
+
+
+@poller_routes.route("/pollers/<worker_id>/heartbeat", methods=["POST"])
+def heartbeat(worker_id: str):
+    """Registers a heartbeat for the poller worker and lists the live workers."""
+    workers = db.heartbeat_poller_worker(worker_id)
+    return format_response({"workers": workers})
+
+
+@poller_routes.route("/pollers/<worker_id>", methods=["DELETE"])
+def remove_worker(worker_id: str):
+    """Removes the poller worker from the registry."""
+    db.remove_poller_worker(worker_id)
+    return format_response()
+
+
+@poller_routes.route("/pollers/<worker_id>/cursors/claim", methods=["POST"])
+def claim_cursors(worker_id: str):
+    """Claims the cursors of the handles for the poller worker."""
+    body = request.get_json(silent=True) or {}
+    handles = body.get("handles")
+
+    if not isinstance(handles, list):
+        err = {"message": "The request body must contain a list of handles."}
+        return format_response(error=err), 400
+
+    cursors = db.claim_poller_cursors(worker_id, handles)
+    return format_response(
+        {"cursors": [{"handle": h, "sinceID": since_id} for h, since_id in cursors.items()]}
+    )
+
+
+@poller_routes.route("/pollers/<worker_id>/cursors", methods=["PUT"])
+def advance_cursors(worker_id: str):
+    """Moves the cursors held by the poller worker forward."""
+    body = request.get_json(silent=True) or {}
+    cursors = body.get("cursors")
+
+    if not isinstance(cursors, list):
+        err = {"message": "The request body must contain a list of cursors."}
+        return format_response(error=err), 400
+
+    db.advance_poller_cursors(worker_id, cursors)
+    return format_response()
+
+
+@poller_routes.route("/pollers/<worker_id>/cursors/release", methods=["POST"])
+def release_cursors(worker_id: str):
+    """Releases the poller worker's cursors of the handles."""
+    body = request.get_json(silent=True) or {}
+    db.release_poller_cursors(worker_id, body.get("handles") or [])
+    return format_response()
+
+
+@poller_routes.route("/sent-tweets/claim", methods=["POST"])
+def claim_sent_tweets():
+    """Records the tweets as sent to the chats, unless they already have been."""
+    body = request.get_json(silent=True) or {}
+    pairs = body.get("pairs")
+
+    if not isinstance(pairs, list):
+        err = {"message": "The request body must contain a list of pairs."}
+        return format_response(error=err), 400
+
+    return format_response({"pairs": db.claim_sent_tweets(pairs)})
+
+
+@poller_routes.route("/sent-tweets/unsent", methods=["POST"])
+def find_unsent_tweets():
+    """Finds the tweets that haven't been sent to the chats, without claiming them."""
+    body = request.get_json(silent=True) or {}
+    pairs = body.get("pairs")
+
+    if not isinstance(pairs, list):
+        err = {"message": "The request body must contain a list of pairs."}
+        return format_response(error=err), 400
+
+    return format_response({"pairs": db.find_unsent_tweets(pairs)})
+
+
+@poller_routes.route("/sent-tweets/release", methods=["POST"])
+def release_sent_tweets():
+    """Forgets that the tweets were sent to the chats."""
+    body = request.get_json(silent=True) or {}
+    db.release_sent_tweets(body.get("pairs") or [])
+    return format_response()
+
+
+@poller_routes.route("/sent-tweets", methods=["DELETE"])
+def prune_sent_tweets():
+    """Forgets the tweets sent longer ago than the retention period."""
+    pruned = db.prune_sent_tweets(float(request.args.get("retentionHours") or 168))
+    return format_response({"pruned": pruned})
@@ -0,0 +1,12 @@
+from flask import Blueprint
+
+import db
+from routes.conditional import versioned_response
+
+subscription_routes = Blueprint("subscription_routes", __name__)
+
+
+@subscription_routes.route("/subscriptions")
+def get_subscriptions():
+    """Retrieve every watched Twitter handle along with the chats watching it."""
+    return versioned_response(lambda: {"subscriptions": db.fetch_subscriptions()})
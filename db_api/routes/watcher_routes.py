@@ -1,4 +1,5 @@
-from flask import Blueprint
+from typing import List, Optional
+from flask import Blueprint, request
 
 import db
 from db import (
@@ -12,6 +13,17 @@ from routes.format_response import format_response
 watcher_routes = Blueprint("watcher_routes", __name__)
 
 
+def _handles_from_body() -> Optional[List[str]]:
+    """Returns the list of handles in the JSON request body or None if it is malformed."""
+    body = request.get_json(silent=True) or {}
+    handles = body.get("handles")
+
+    if not isinstance(handles, list) or not all(isinstance(h, str) for h in handles):
+        return None
+
+    return handles
+
+
 @watcher_routes.route("/watcher/<chat_id>")
 def get_watcher(chat_id: str):
     """Fetches an object representing the watcher and the handles being watched."""
@@ -54,3 +66,60 @@ def unwatch_handle(handle: str, chat_id: str):
         return format_response(error={"message": f"{e}"}), 404
 
     return format_response()
+
+
+@watcher_routes.route("/watcher/<chat_id>/watch", methods=["POST"])
+def watch_handles(chat_id: str):
+    """Create relationships between the watcher and each of the handles in one transaction."""
+    handles = _handles_from_body()
+    if handles is None:
+        err = {"message": "The request body must contain a list of handles."}
+        return format_response(error=err), 400
+
+    created = db.create_watch_relationships(handles, chat_id)
+    results = {handle: 201 if success else 409 for handle, success in created.items()}
+
+    return format_response({"results": results})
+
+
+@watcher_routes.route("/watcher/<chat_id>/unwatch", methods=["DELETE"])
+def unwatch_handles(chat_id: str):
+    """Deletes the relationships between the watcher and each of the handles in one transaction."""
+    handles = _handles_from_body()
+    if handles is None:
+        err = {"message": "The request body must contain a list of handles."}
+        return format_response(error=err), 400
+
+    try:
+        deleted = db.delete_watch_relationships(handles, chat_id)
+    except WatcherNotFoundError as e:
+        return format_response(error={"message": f"{e}"}), 404
+
+    results = {handle: 200 if success else 404 for handle, success in deleted.items()}
+
+    return format_response({"results": results})
+
+
+@watcher_routes.route("/watcher/<chat_id>/digest", methods=["PUT"])
+def set_digest(chat_id: str):
+    """Turns digest mode on or off for the watcher."""
+    body = request.get_json(silent=True) or {}
+    digest = body.get("digest")
+    if not isinstance(digest, bool):
+        err = {"message": "The request body must contain a digest boolean."}
+        return format_response(error=err), 400
+
+    db.set_watcher_digest(chat_id, digest)
+
+    return format_response({"digest": digest})
+
+
+@watcher_routes.route("/watcher/<chat_id>/watching", methods=["DELETE"])
+def unwatch_all_handles(chat_id: str):
+    """Deletes every relationship between the watcher and the handles it watches."""
+    try:
+        handles = db.delete_all_watch_relationships(chat_id)
+    except WatcherNotFoundError as e:
+        return format_response(error={"message": f"{e}"}), 404
+
+    return format_response({"handles": handles})
@@ -16,9 +16,89 @@ CREATE TABLE IF NOT EXISTS watchers
     CONSTRAINT watchers_chat_id_key UNIQUE (chat_id)
 );
 
+-- Watchers in digest mode receive their new tweets grouped into as few messages as possible
+ALTER TABLE watchers ADD COLUMN IF NOT EXISTS digest boolean NOT NULL DEFAULT false;
+
 CREATE TABLE IF NOT EXISTS watcher_handle_join
 (
     _id  SERIAL PRIMARY KEY,
     watcher_id integer NOT NULL,
     handle_id integer NOT NULL
-);
\ No newline at end of file
+);
+
+-- Remove any duplicate relationships so the unique index below can be created
+DELETE FROM watcher_handle_join a
+USING watcher_handle_join b
+WHERE a._id > b._id AND a.watcher_id = b.watcher_id AND a.handle_id = b.handle_id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS watcher_handle_join_watcher_handle_key
+ON watcher_handle_join (watcher_id, handle_id);
+
+CREATE TABLE IF NOT EXISTS poller_workers
+(
+    worker_id text PRIMARY KEY,
+    started_at timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    heartbeat_at timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- The cursor of each handle polled by sharded poller workers, the newest tweet seen for it, and
+-- the worker holding it. A handle is only polled by the worker holding its cursor.
+CREATE TABLE IF NOT EXISTS poller_cursors
+(
+    handle text PRIMARY KEY,
+    since_id bigint,
+    worker_id text,
+    updated_at timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- The tweets sharded poller workers have sent to each chat, so none is sent twice
+CREATE TABLE IF NOT EXISTS sent_tweets
+(
+    tweet_id bigint NOT NULL,
+    chat_id text NOT NULL,
+    sent_at timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (tweet_id, chat_id)
+);
+
+CREATE INDEX IF NOT EXISTS sent_tweets_sent_at ON sent_tweets (sent_at);
+
+CREATE TABLE IF NOT EXISTS latest_tweets
+(
+    handle text PRIMARY KEY,
+    tweet_id bigint NOT NULL,
+    url text NOT NULL,
+    updated_at timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Replaced by the subscription_version row below, which starts from its last value so ETags
+-- handed out before the upgrade never match a later version
+CREATE SEQUENCE IF NOT EXISTS subscription_version_seq;
+
+-- Incremented in the same transaction as every write that changes the subscriptions, served
+-- as the ETag of the subscription listings
+CREATE TABLE IF NOT EXISTS subscription_version
+(
+    id boolean PRIMARY KEY DEFAULT true CHECK (id),
+    version bigint NOT NULL
+);
+
+INSERT INTO subscription_version (version)
+SELECT last_value FROM subscription_version_seq
+ON CONFLICT (id) DO NOTHING;
+
+-- Messages waiting to be delivered to Telegram, written by the poller and claimed by the
+-- delivery workers for the length of a lease
+CREATE TABLE IF NOT EXISTS outbox
+(
+    _id BIGSERIAL PRIMARY KEY,
+    chat_id text NOT NULL,
+    text text NOT NULL,
+    attempts integer NOT NULL DEFAULT 0,
+    created_at timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    available_at timestamp with time zone NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    claimed_by text,
+    failed_at timestamp with time zone
+);
+
+CREATE INDEX IF NOT EXISTS outbox_available_at
+ON outbox (available_at, _id) WHERE failed_at IS NULL;
@@ -1,16 +1,22 @@
 import twit
+import logging
 from typing import List
 from telegram import ParseMode
 from telegram.ext import Updater, CommandHandler, MessageHandler, Filters
 
 import db_api
-from constants import TELEGRAM_TOKEN
+from constants import TELEGRAM_TOKEN, TG_METRICS_HOST, TG_METRICS_PORT
 from db_api import Watcher, WatcherNotFoundError
+from executor import ChatExecutor
+from metrics import start_metrics_server
 
 
 updater = Updater(token=TELEGRAM_TOKEN, use_context=True)
 dispatcher = updater.dispatcher
 
+# Commands are handled off the dispatcher thread, concurrently across chats
+command_executor = ChatExecutor()
+
 
 def start(update, context):
     """The standard bot start command"""
@@ -37,6 +43,7 @@ See a list of my commands below:
 /watching \- show a list of Twitter handles being watched
 /unwatch \- stop watching a Twitter account 
 /latest \- gets the latest tweet for the given account
+/digest \- receive new tweets grouped into a digest, use /digest off to stop
 
 *Add me to a group chat\.\.\.*
 
@@ -61,20 +68,18 @@ def watch(update, context):
     """
     handles_to_watch: List[str] = sorted(list({h.lower().replace("@", "") for h in context.args}))
 
-    try:
-        watcher = db_api.get_watcher(update.effective_chat.id)
-    except WatcherNotFoundError:
-        watcher = None
     #
-    # Do the background stuff
+    # Do the background stuff, all handles are watched with a single request
     #
 
+    results = {}
+    if handles_to_watch:
+        results = db_api.watch_handles(handles_to_watch, update.effective_chat.id) or {}
+
     success_handles = []
     failure_handles = []
     for handle in handles_to_watch:
-        success: bool = watcher.watch(handle)
-
-        if success:
+        if results.get(handle):
             success_handles.append(handle)
         else:
             failure_handles.append(handle)
@@ -117,28 +122,32 @@ def unwatch(update, context):
         /unwatch @twitterhandle @someotherhandle
     """
     handles_to_del: List[str] = sorted(list({h.lower().replace("@", "") for h in context.args}))
-
-    try:
-        watcher: Watcher = db_api.get_watcher(update.effective_chat.id)
-    except WatcherNotFoundError:
-        watcher = None
-
     delete_all_handles: bool = len(handles_to_del) == 1 and handles_to_del[0] == "all"
-    if delete_all_handles:
-        handles_to_del = watcher.handles
 
     #
-    # Unwatch the handles
+    # Unwatch the handles, with a single request
     #
 
     unwatched_handles = []
     errored_handles = []
-    for handle in handles_to_del:
-        if handle in watcher.handles:
-            watcher.unwatch(handle)
-            unwatched_handles.append(handle)
-        else:
-            errored_handles.append(handle)
+    failed = False
+    try:
+        if delete_all_handles:
+            unwatched = db_api.unwatch_all_handles(update.effective_chat.id)
+            failed = unwatched is None
+            if not failed:
+                handles_to_del = unwatched
+                unwatched_handles = list(unwatched)
+        elif handles_to_del:
+            results = db_api.unwatch_handles(handles_to_del, update.effective_chat.id)
+            failed = results is None
+            unwatched_handles = [h for h in handles_to_del if results and results.get(h)]
+            errored_handles = [h for h in handles_to_del if results and not results.get(h)]
+    except WatcherNotFoundError:
+        # The chat has never watched anything
+        if delete_all_handles:
+            handles_to_del = []
+        errored_handles = list(handles_to_del)
 
     #
     # Build the reply message
@@ -146,6 +155,8 @@ def unwatch(update, context):
 
     if not handles_to_del:
         message = f"Ensure your command follows the pattern:\n\n/unwatch @twitterhandle\n\nYou can also add multiple Twitter handles seperated by a space."
+    elif failed:
+        message = "Something has gone wrong on our end, please try again later."
     elif delete_all_handles:
         message = (
             f"You have unwatched all Twitter handles 😥\n\nAdd some more using the /watch command!"
@@ -183,7 +194,36 @@ def latest(update, context):
     else:
         handle = context.args[0].lower().replace("@", "")
         tweet_url = twit.get_latest_tweet_url(handle)
-        message = f"Here's the latest tweet from @{handle}:\n\n{tweet_url}"
+        if tweet_url:
+            message = f"Here's the latest tweet from @{handle}:\n\n{tweet_url}"
+        else:
+            message = f"We can't fetch the latest tweet from @{handle} right now, please try again later."
+
+    context.bot.send_message(chat_id=update.effective_chat.id, text=message)
+
+
+def digest(update, context):
+    """
+    Turn digest mode on or off for the current chat.
+
+    Command format:
+        /digest
+        /digest on
+        /digest off
+    """
+    args = [arg.lower() for arg in context.args]
+
+    if len(args) > 1 or (args and args[0] not in ("on", "off")):
+        message = "Ensure your command follows the pattern:\n\n/digest on\n\nor\n\n/digest off"
+    else:
+        enabled = not args or args[0] == "on"
+
+        if not db_api.set_digest(update.effective_chat.id, enabled):
+            message = "Something has gone wrong on our end, please try again later."
+        elif enabled:
+            message = "New tweets will now be grouped together into a digest 📰"
+        else:
+            message = "You will now receive a message for each new tweet."
 
     context.bot.send_message(chat_id=update.effective_chat.id, text=message)
 
@@ -212,12 +252,16 @@ def watching(update, context):
 
 
 def main():
-    start_handler = CommandHandler("start", start)
-    help_handler = CommandHandler("help", help)
-    watch_handler = CommandHandler("watch", watch)
-    unwatch_handler = CommandHandler("unwatch", unwatch)
-    watching_handler = CommandHandler("watching", watching)
-    latest_handler = CommandHandler("latest", latest)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    start_metrics_server(TG_METRICS_HOST, TG_METRICS_PORT)
+
+    start_handler = CommandHandler("start", command_executor.wrap(start))
+    help_handler = CommandHandler("help", command_executor.wrap(help))
+    watch_handler = CommandHandler("watch", command_executor.wrap(watch))
+    unwatch_handler = CommandHandler("unwatch", command_executor.wrap(unwatch))
+    watching_handler = CommandHandler("watching", command_executor.wrap(watching))
+    latest_handler = CommandHandler("latest", command_executor.wrap(latest))
+    digest_handler = CommandHandler("digest", command_executor.wrap(digest))
 
     dispatcher.add_handler(start_handler)
     dispatcher.add_handler(help_handler)
@@ -225,6 +269,7 @@ def main():
     dispatcher.add_handler(unwatch_handler)
     dispatcher.add_handler(watching_handler)
     dispatcher.add_handler(latest_handler)
+    dispatcher.add_handler(digest_handler)
 
     updater.start_polling()
 
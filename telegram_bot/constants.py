@@ -5,11 +5,25 @@ load_dotenv()
 
 TELEGRAM_TOKEN: str = os.getenv("TELEGRAM_TOKEN")
 
+TG_COMMAND_WORKERS: int = int(os.getenv("TG_COMMAND_WORKERS") or 16)
+TG_LATENCY_SAMPLE_SIZE: int = int(os.getenv("TG_LATENCY_SAMPLE_SIZE") or 1000)
+TG_LATENCY_LOG_SECONDS: float = float(os.getenv("TG_LATENCY_LOG_SECONDS") or 300)
+TG_METRICS_HOST: str = os.getenv("TG_METRICS_HOST") or "0.0.0.0"
+TG_METRICS_PORT: int = int(os.getenv("TG_METRICS_PORT") or 9102)
+
 TW_API_KEY: str = os.getenv("TW_API_KEY")
 TW_API_KEY_SECRET: str = os.getenv("TW_API_KEY_SECRET")
 TW_BEARER_TOKEN: str = os.getenv("TW_BEARER_TOKEN")
 TW_ACCESS_TOKEN: str = os.getenv("TW_ACCESS_TOKEN")
 TW_ACCESS_TOKEN_SECRET: str = os.getenv("TW_ACCESS_TOKEN_SECRET")
+TW_RATE_LIMIT_RESERVE: float = float(os.getenv("TW_RATE_LIMIT_RESERVE") or 0.1)
 
 DB_API_HOST: str = os.getenv("DB_API_HOST") or "127.0.0.1"
 DB_API_PORT: int = int(os.getenv("DB_API_PORT") or 5000)
+DB_API_POOL_SIZE: int = int(os.getenv("DB_API_POOL_SIZE") or 10)
+DB_API_TIMEOUT_SECONDS: float = float(os.getenv("DB_API_TIMEOUT_SECONDS") or 10)
+DB_API_MAX_RETRIES: int = int(os.getenv("DB_API_MAX_RETRIES") or 3)
+DB_API_BACKOFF_SECONDS: float = float(os.getenv("DB_API_BACKOFF_SECONDS") or 0.25)
+
+TG_LATEST_CACHE_SIZE: int = int(os.getenv("TG_LATEST_CACHE_SIZE") or 1024)
+TG_LATEST_CACHE_TTL_SECONDS: float = float(os.getenv("TG_LATEST_CACHE_TTL_SECONDS") or 60)
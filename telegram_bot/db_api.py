@@ -1,11 +1,14 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 import requests
 
 from constants import DB_API_HOST, DB_API_PORT
+from db_api_client import DbApiClient
 
 
 DB_API_BASE = f"http://{DB_API_HOST}:{DB_API_PORT}"
 
+client = DbApiClient(DB_API_BASE)
+
 
 class HandleNotFoundError(Exception):
     pass
@@ -45,9 +48,9 @@ def watch_handle(handle: str, chat_id: str) -> bool:
         True if the watch was a success, otherwise False
     """
     try:
-        response = requests.post(f"{DB_API_BASE}/watcher/{chat_id}/watch/{handle}")
+        response = client.post(f"/watcher/{chat_id}/watch/{handle}")
         return response.json()["success"]
-    except requests.ConnectionError:
+    except requests.RequestException:
         return None
 
 
@@ -59,10 +62,100 @@ def unwatch_handle(handle: str, chat_id: str) -> dict:
         handle (str): the Twitter handle
         chat_id (str): the Telegram chat ID
     """
-    response = requests.delete(f"{DB_API_BASE}/watcher/{chat_id}/unwatch/{handle}")
+    response = client.delete(f"/watcher/{chat_id}/unwatch/{handle}")
     return response.json()
 
 
+def watch_handles(handles: List[str], chat_id: str) -> Optional[Dict[str, bool]]:
+    """
+    Assign the chat_id to watch each of the given handles in a single request.
+
+    Parameters:
+        handles (List[str]): the Twitter handles
+        chat_id (str): the chat_id to watch the handles
+
+    Returns:
+        a dict keyed by handle, True if the handle is now being watched or False if it already was,
+        or None if the request failed
+    """
+    try:
+        response = client.post(f"/watcher/{chat_id}/watch", json={"handles": handles}).json()
+    except requests.RequestException:
+        return None
+
+    if not response or not response["success"]:
+        return None
+
+    return {handle: status == 201 for handle, status in response["payload"]["results"].items()}
+
+
+def unwatch_handles(handles: List[str], chat_id: str) -> Optional[Dict[str, bool]]:
+    """
+    Remove the relationships between each of the Twitter handles and the Telegram chat ID.
+
+    Parameters:
+        handles (List[str]): the Twitter handles
+        chat_id (str): the Telegram chat ID
+
+    Returns:
+        a dict keyed by handle, True if the handle is no longer watched or False if it wasn't,
+        or None if the request failed
+    """
+    try:
+        response = client.delete(f"/watcher/{chat_id}/unwatch", json={"handles": handles}).json()
+    except requests.RequestException:
+        return None
+
+    if not response:
+        return None
+    if not response["success"]:
+        raise WatcherNotFoundError(response["error"]["message"])
+
+    return {handle: status == 200 for handle, status in response["payload"]["results"].items()}
+
+
+def unwatch_all_handles(chat_id: str) -> Optional[List[str]]:
+    """
+    Remove every relationship between the Telegram chat ID and the handles it watches.
+
+    Parameters:
+        chat_id (str): the Telegram chat ID
+
+    Returns:
+        the handles that are no longer being watched, or None if the request failed
+    """
+    try:
+        response = client.delete(f"/watcher/{chat_id}/watching").json()
+    except requests.RequestException:
+        return None
+
+    if not response:
+        return None
+    if not response["success"]:
+        raise WatcherNotFoundError(response["error"]["message"])
+
+    return response["payload"]["handles"]
+
+
+def set_digest(chat_id: str, digest: bool) -> bool:
+    """
+    Turn digest mode on or off for the chat_id.
+
+    Parameters:
+        chat_id (str): the Telegram chat ID
+        digest (bool): True to receive new tweets grouped into digests
+
+    Returns:
+        True if the setting was saved, otherwise False
+    """
+    try:
+        response = client.put(f"/watcher/{chat_id}/digest", json={"digest": digest}).json()
+    except requests.RequestException:
+        return False
+
+    return bool(response and response["success"])
+
+
 def get_watcher(chat_id: str) -> Optional[dict]:
     """
     Fetch watcher assoiated with the given chat_id.
@@ -71,8 +164,8 @@ def get_watcher(chat_id: str) -> Optional[dict]:
         chat_id (str): the chat_id of the watcher to be returned
     """
     try:
-        response = requests.get(f"{DB_API_BASE}/watcher/{chat_id}").json()
-    except requests.ConnectionError:
+        response = client.get(f"/watcher/{chat_id}").json()
+    except requests.RequestException:
         return None
 
     if not response or not response["success"]:
@@ -82,3 +175,41 @@ def get_watcher(chat_id: str) -> Optional[dict]:
     handles = [h["handle"] for h in payload["handles"]]
 
     return Watcher(payload["chatID"], handles)
+
+
+def get_latest_tweet(handle: str) -> Optional[dict]:
+    """
+    Fetch the newest tweet recorded for the given handle by the Twitter bot.
+
+    Parameters:
+        handle (str): the Twitter handle
+
+    Returns:
+        a dict with the tweetID, url and ageSeconds of the tweet or None if there isn't one
+    """
+    try:
+        response = client.get(f"/handle/{handle}/latest").json()
+    except requests.RequestException:
+        return None
+
+    if not response or not response["success"]:
+        return None
+
+    return response["payload"]
+
+
+def save_latest_tweet(handle: str, tweet_id: int, url: str) -> None:
+    """
+    Record the newest tweet for the given handle.
+
+    Parameters:
+        handle (str): the Twitter handle
+        tweet_id (int): the ID of the tweet
+        url (str): the URL linking to the tweet
+    """
+    body = {"tweets": [{"handle": handle, "tweetID": tweet_id, "url": url}]}
+
+    try:
+        client.put("/latest", json=body)
+    except requests.RequestException:
+        return None
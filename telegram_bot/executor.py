@@ -0,0 +1,161 @@
+import time
+import logging
+import functools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, List
+
+from constants import TG_COMMAND_WORKERS, TG_LATENCY_LOG_SECONDS, TG_LATENCY_SAMPLE_SIZE
+from metrics import registry
+
+
+logger = logging.getLogger(__name__)
+
+COMMAND_SECONDS = registry.histogram(
+    "telegram_bot_command_seconds",
+    "Time from a command being received to its handler returning, by command.",
+    ["command"],
+)
+COMMAND_ERRORS = registry.counter(
+    "telegram_bot_command_errors_total", "Commands whose handler raised an error.", ["command"]
+)
+
+
+class LatencyTracker:
+    """Keeps the most recent latencies of each command for percentile reporting."""
+
+    def __init__(self, sample_size: int = TG_LATENCY_SAMPLE_SIZE):
+        self.sample_size = sample_size
+
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = deque(maxlen=self.sample_size)
+            self._samples[name].append(seconds)
+
+    def percentile(self, name: str, q: float) -> float:
+        """
+        Returns the q-th percentile latency of the command in seconds, 0 if there are no samples.
+
+        Parameters:
+            name (str): the name of the command
+            q (float): the percentile, between 0 and 100
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(name, ()))
+
+        if not samples:
+            return 0.0
+
+        index = min(len(samples) - 1, int(round(q / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return sorted(self._samples)
+
+    def summary(self) -> str:
+        return ", ".join(
+            f"{name} p50={self.percentile(name, 50) * 1000:.0f}ms "
+            f"p99={self.percentile(name, 99) * 1000:.0f}ms"
+            for name in self.names()
+        )
+
+
+class ChatExecutor:
+    """
+    Runs command handlers on a bounded pool of threads.
+
+    Commands from different chats run concurrently, so one slow lookup doesn't hold up every
+    other chat, while commands from the same chat still run one at a time in the order they
+    were received.
+    """
+
+    def __init__(
+        self,
+        workers: int = TG_COMMAND_WORKERS,
+        latency: LatencyTracker = None,
+        log_seconds: float = TG_LATENCY_LOG_SECONDS,
+    ):
+        """
+        Parameters:
+            workers (int): the maximum number of commands handled at once
+            latency (LatencyTracker): where the time taken to handle each command is recorded
+            log_seconds (float): how often the latency percentiles are logged
+        """
+        self.latency = latency or LatencyTracker()
+        self.log_seconds = log_seconds
+
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="command")
+        self._queues: Dict[int, Deque[Callable[[], None]]] = {}
+        self._lock = threading.Lock()
+        self._last_logged_at = time.monotonic()
+
+    def submit(self, chat_id: int, task: Callable[[], None]) -> None:
+        """Runs the task once every task submitted earlier for the same chat has finished."""
+        with self._lock:
+            if chat_id in self._queues:
+                self._queues[chat_id].append(task)
+                return
+
+            self._queues[chat_id] = deque()
+
+        self._pool.submit(self._run, chat_id, task)
+
+    def _run(self, chat_id: int, task: Callable[[], None]) -> None:
+        while True:
+            try:
+                task()
+            except Exception:
+                logger.exception("Unhandled error while handling a command for chat %s", chat_id)
+
+            with self._lock:
+                queue = self._queues[chat_id]
+                if not queue:
+                    del self._queues[chat_id]
+                    return
+
+                task = queue.popleft()
+
+    def _log_latency(self) -> None:
+        now = time.monotonic()
+        if now - self._last_logged_at < self.log_seconds:
+            return
+
+        self._last_logged_at = now
+        logger.info("Command latency: %s", self.latency.summary())
+
+    def wrap(self, handler: Callable) -> Callable:
+        """
+        Wraps a command handler so it is run by the executor instead of the Telegram dispatcher.
+
+        The recorded latency runs from the command being received to the handler returning,
+        so it includes any time spent waiting behind earlier commands.
+        """
+
+        @functools.wraps(handler)
+        def callback(update, context):
+            received_at = time.monotonic()
+
+            def task():
+                try:
+                    handler(update, context)
+                except Exception:
+                    COMMAND_ERRORS.inc(command=handler.__name__)
+                    raise
+                finally:
+                    seconds = time.monotonic() - received_at
+                    self.latency.record(handler.__name__, seconds)
+                    COMMAND_SECONDS.observe(seconds, command=handler.__name__)
+                    self._log_latency()
+
+            self.submit(update.effective_chat.id, task)
+
+        return callback
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True)
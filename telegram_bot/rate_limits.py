@@ -0,0 +1,215 @@
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from metrics import registry
+from constants import TW_RATE_LIMIT_RESERVE
+
+
+logger = logging.getLogger(__name__)
+
+REQUEST_SECONDS = registry.histogram(
+    "twitter_api_request_seconds", "Time taken by requests to the Twitter API.", ["endpoint"]
+)
+REQUESTS = registry.counter(
+    "twitter_api_requests_total",
+    "Requests made to the Twitter API, by endpoint and response status.",
+    ["endpoint", "status"],
+)
+REFUSED = registry.counter(
+    "twitter_api_requests_refused_total",
+    "Requests refused before being sent because the rate limit budget was spent.",
+    ["endpoint"],
+)
+
+
+class RateLimitExhaustedError(Exception):
+    def __init__(self, endpoint: str, reset_in: float):
+        super().__init__(f"The rate limit for {endpoint} is exhausted for another {reset_in:.0f}s.")
+        self.endpoint = endpoint
+        self.reset_in = reset_in
+
+
+class PerThreadAPI:
+    """
+    Gives every thread its own tweepy API, created by the factory on first use.
+
+    tweepy keeps the response to the last request on the API, so threads sharing one would
+    read each other's responses. Attributes are looked up and set on the calling thread's API.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._local = threading.local()
+
+    def _api(self) -> Any:
+        api = getattr(self._local, "api", None)
+        if api is None:
+            api = self._local.api = self._factory()
+        return api
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._api(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name.startswith("_"):
+            super().__setattr__(name, value)
+        else:
+            setattr(self._api(), name, value)
+
+
+class _Budget:
+    def __init__(self, limit: int, remaining: int, reset_at: float):
+        self.limit: int = limit
+        self.remaining: int = remaining
+        self.reset_at: float = reset_at
+
+
+class RateLimitManager:
+    """
+    Keeps the remaining Twitter API budget of each endpoint, from the x-rate-limit-* headers.
+
+    The poller and the Telegram bot share the same quota, so a slice of each endpoint's limit
+    is reserved for interactive requests such as /latest. Background requests are refused
+    once only the reserve is left, and every request is refused once the budget is spent,
+    rather than sleeping until the window resets. An endpoint whose budget is unknown, or
+    whose window has reset, is always allowed.
+    """
+
+    def __init__(self, reserve_fraction: float = TW_RATE_LIMIT_RESERVE):
+        """
+        Parameters:
+            reserve_fraction (float): the fraction of each limit kept for interactive requests
+        """
+        self.reserve_fraction = reserve_fraction
+
+        self._budgets: Dict[str, _Budget] = {}
+        self._lock = threading.Lock()
+
+    def update(self, endpoint: str, headers: Any) -> None:
+        """
+        Records the budget reported in the headers of a response from the endpoint.
+
+        Responses to concurrent requests can arrive in any order, so the remaining budget is
+        never raised within the same window and a response from an earlier window is ignored.
+        """
+        try:
+            budget = _Budget(
+                int(headers["x-rate-limit-limit"]),
+                int(headers["x-rate-limit-remaining"]),
+                float(headers["x-rate-limit-reset"]),
+            )
+        except (KeyError, TypeError, ValueError):
+            return
+
+        with self._lock:
+            current = self._budgets.get(endpoint)
+            if current is not None and current.reset_at > time.time():
+                if budget.reset_at < current.reset_at:
+                    return
+                if budget.reset_at == current.reset_at:
+                    budget.remaining = min(budget.remaining, current.remaining)
+
+            self._budgets[endpoint] = budget
+
+    def exhaust(self, endpoint: str, reset_at: Optional[float] = None) -> None:
+        """Records that the endpoint has refused a request for exceeding its rate limit."""
+        with self._lock:
+            budget = self._budgets.get(endpoint)
+            if budget is None or budget.reset_at <= time.time():
+                # Without a current window from the headers, Twitter's 15 minute window is assumed
+                budget = _Budget(0, 0, time.time() + 15 * 60)
+                self._budgets[endpoint] = budget
+
+            budget.remaining = 0
+            if reset_at is not None:
+                budget.reset_at = reset_at
+
+    def available(self, endpoint: str, interactive: bool = False) -> Optional[int]:
+        """
+        The number of requests the endpoint can still be sent, or None if it isn't known.
+
+        Parameters:
+            endpoint (str): the endpoint, e.g. /statuses/user_timeline
+            interactive (bool): True if the reserve may be used
+        """
+        with self._lock:
+            return self._available(endpoint, interactive)
+
+    def _available(self, endpoint: str, interactive: bool) -> Optional[int]:
+        """See available, the lock must be held."""
+        budget = self._budgets.get(endpoint)
+        if budget is None or budget.reset_at <= time.time():
+            return None
+
+        reserve = 0 if interactive else int(budget.limit * self.reserve_fraction)
+        return max(0, budget.remaining - reserve)
+
+    def seconds_until_reset(self, endpoint: str) -> float:
+        with self._lock:
+            budget = self._budgets.get(endpoint)
+            return max(0.0, budget.reset_at - time.time()) if budget else 0.0
+
+    def try_acquire(self, endpoint: str, interactive: bool = False) -> bool:
+        """Takes a request from the endpoint's budget, returns False if there is none left."""
+        with self._lock:
+            available = self._available(endpoint, interactive)
+            if available is None:
+                return True
+            if available <= 0:
+                return False
+
+            self._budgets[endpoint].remaining -= 1
+            return True
+
+    def call(
+        self,
+        api: Any,
+        endpoint: str,
+        method: Callable[..., Any],
+        interactive: bool = False,
+        **params: Any,
+    ) -> Any:
+        """
+        Calls the tweepy API method if the endpoint has budget left, updating the budget from
+        the response. The api must be created with wait_on_rate_limit=False, and must not be
+        shared between threads, see PerThreadAPI.
+
+        Parameters:
+            api (tweepy.API | PerThreadAPI): the API the method belongs to, its last_response
+                is read
+            endpoint (str): the endpoint the method requests, e.g. /statuses/user_timeline
+            method (Callable): the API method
+            interactive (bool): True if the reserve may be used
+
+        Raises:
+            RateLimitExhaustedError if the endpoint has no budget left
+        """
+        if not self.try_acquire(endpoint, interactive):
+            REFUSED.inc(endpoint=endpoint)
+            raise RateLimitExhaustedError(endpoint, self.seconds_until_reset(endpoint))
+
+        # Cleared so a request that gets no response, such as one that couldn't connect,
+        # doesn't read the response to the previous one
+        api.last_response = None
+        response = None
+
+        started = time.monotonic()
+        try:
+            result = method(**params)
+            response = getattr(api, "last_response", None)
+            return result
+        except Exception as e:
+            response = getattr(e, "response", None) or getattr(api, "last_response", None)
+            raise
+        finally:
+            REQUEST_SECONDS.observe(time.monotonic() - started, endpoint=endpoint)
+            status = response.status_code if response is not None else "unknown"
+            REQUESTS.inc(endpoint=endpoint, status=status)
+
+            if response is not None:
+                self.update(endpoint, response.headers)
+                if response.status_code == 429:
+                    self.exhaust(endpoint)
+                    logger.warning("Twitter refused a request to %s, rate limit exceeded", endpoint)
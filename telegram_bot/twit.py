@@ -1,7 +1,13 @@
 import tweepy as tw
 from typing import Optional
 
+import db_api
+from metrics import registry
+from rate_limits import PerThreadAPI, RateLimitExhaustedError, RateLimitManager
+from tweet_cache import LRUCache
 from constants import (
+    TG_LATEST_CACHE_SIZE,
+    TG_LATEST_CACHE_TTL_SECONDS,
     TW_ACCESS_TOKEN,
     TW_ACCESS_TOKEN_SECRET,
     TW_API_KEY,
@@ -11,23 +17,65 @@ from constants import (
 
 auth = tw.OAuthHandler(TW_API_KEY, TW_API_KEY_SECRET)
 auth.set_access_token(TW_ACCESS_TOKEN, TW_ACCESS_TOKEN_SECRET)
-api = tw.API(auth, wait_on_rate_limit=True)
+# Requests are refused by the rate limit manager rather than sleeping until the limit resets
+api = PerThreadAPI(lambda: tw.API(auth, wait_on_rate_limit=False))
+rate_limits = RateLimitManager()
+
+TIMELINE_ENDPOINT = "/statuses/user_timeline"
+
+latest_tweet_cache = LRUCache(TG_LATEST_CACHE_SIZE, TG_LATEST_CACHE_TTL_SECONDS)
+
+LOOKUPS = registry.counter(
+    "telegram_bot_latest_lookups_total",
+    "Lookups of a handle's latest tweet, by where the tweet was found.",
+    ["source"],
+)
 
 
 def get_latest_tweet_url(handle: str) -> Optional[str]:
     """
     Returns a URL for the most recent tweet for the given handle.
 
+    The tweet is looked up in the in-process cache, then in the tweets recorded by the Twitter
+    bot, and only fetched from the Twitter API if neither has one from the last
+    TG_LATEST_CACHE_TTL_SECONDS. If the Twitter API can't be reached, for example because the
+    rate limit is exhausted, an older recorded tweet is returned rather than nothing.
+
     Parameters:
         handle (str): the Twitter handle to be searched for
 
     Returns:
         A URL relating linking to the latest tweet for the given handle
     """
+    url = latest_tweet_cache.get(handle)
+    if url is not None:
+        LOOKUPS.inc(source="cache")
+        return url
+
+    recorded = db_api.get_latest_tweet(handle)
+    if recorded is not None and recorded["ageSeconds"] < TG_LATEST_CACHE_TTL_SECONDS:
+        latest_tweet_cache.set(
+            handle, recorded["url"], TG_LATEST_CACHE_TTL_SECONDS - recorded["ageSeconds"]
+        )
+        LOOKUPS.inc(source="recorded")
+        return recorded["url"]
+
     try:
-        result = api.user_timeline(id=handle, count=1)
-    except tw.error.TweepError:
-        return None
+        result = rate_limits.call(
+            api, TIMELINE_ENDPOINT, api.user_timeline, interactive=True, id=handle, count=1
+        )
+    except (RateLimitExhaustedError, tw.error.TweepError):
+        result = None
+
+    if not result:
+        LOOKUPS.inc(source="stale" if recorded is not None else "none")
+        return recorded["url"] if recorded is not None else None
 
     tweet = result[0]
-    return f"https://twitter.com/{handle}/status/{tweet.id_str}"
+    url = f"https://twitter.com/{handle}/status/{tweet.id_str}"
+
+    latest_tweet_cache.set(handle, url)
+    db_api.save_latest_tweet(handle, tweet.id, url)
+    LOOKUPS.inc(source="twitter")
+
+    return url
@@ -1,44 +1,133 @@
-import requests
-from typing import List
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
-from api.handle import Handle, handle_factory
-from constants import DB_API_HOST, DB_API_PORT
+from api.handle import Handle
+from api.storage import StorageBackend
+from api.tweet import Tweet
+from constants import DB_API_HOST, DB_API_PORT, TW_DB_API_PATH, TW_STORAGE_BACKEND
 
 
 base_url = f"http://{DB_API_HOST}:{DB_API_PORT}"
 
 
+def create_backend(name: str) -> StorageBackend:
+    """
+    Creates the storage backend with the given name.
+
+    Parameters:
+        name (str): "http" to go through the db_api or "postgres" to query Postgres directly
+    """
+    if name == "http":
+        from api.http_storage import HttpStorageBackend
+
+        return HttpStorageBackend(base_url)
+    elif name == "postgres":
+        from api.postgres_storage import PostgresStorageBackend
+
+        db_api_path = TW_DB_API_PATH or Path(__file__).resolve().parents[2] / "db_api"
+        return PostgresStorageBackend(db_api_path)
+
+    raise ValueError(f"Unknown storage backend {name}, expected http or postgres.")
+
+
+backend: StorageBackend = create_backend(TW_STORAGE_BACKEND)
+
+
 def get_all_handle_names() -> List[str]:
     """Returns a list of all handle name strings."""
-    response = requests.get(f"{base_url}/handles").json()
+    return backend.get_all_handle_names()
+
 
-    if response and response["success"]:
-        return response["payload"]["handles"]
-    elif response and not response["success"]:
-        raise Exception(response["error"]["message"])
-    else:
-        raise Exception("Respons is None!")
+def get_subscriptions() -> List[Handle]:
+    """Returns every handle that has at least one watcher, with its watchers attached."""
+    return backend.get_subscriptions()
 
 
 def get_handle(handle: str) -> Handle:
     """Returns a dict representing a handle and the watchers associated with it."""
-    response = requests.get(f"{base_url}/handle/{handle}").json()
-
-    if response and response["success"]:
-        return handle_factory(response["payload"])
-    elif response and not response["success"]:
-        raise Exception(response["error"]["message"])
-    else:
-        raise Exception("There has been an issue retrieving the handle.")
+    return backend.get_handle(handle)
 
 
 def get_watcher(chat_id: str) -> dict:
     """Returns a dict representing a watcher and the handles they are following."""
-    response = requests.get(f"{base_url}/watcher/{chat_id}").json()
-
-    if response and response["success"]:
-        return response["payload"]
-    elif response and not response["success"]:
-        raise Exception(response["error"]["message"])
-    else:
-        raise Exception("There has been an issue retrieving the watcher.")
+    return backend.get_watcher(chat_id)
+
+
+def update_latest_tweets(tweets: List[Tweet]) -> None:
+    """Records the given tweets as the newest tweet of their handles, for /latest to read."""
+    backend.update_latest_tweets(tweets)
+
+
+def heartbeat_poller_worker(worker_id: str) -> List[str]:
+    """Registers a heartbeat for the poller worker and returns the IDs of every live worker."""
+    return backend.heartbeat_poller_worker(worker_id)
+
+
+def remove_poller_worker(worker_id: str) -> None:
+    """Removes the poller worker from the registry and releases its cursors."""
+    backend.remove_poller_worker(worker_id)
+
+
+def claim_poller_cursors(worker_id: str, handles: List[str]) -> Dict[str, Optional[int]]:
+    """Claims the cursors of the handles for the worker and returns those it now holds."""
+    return backend.claim_poller_cursors(worker_id, handles)
+
+
+def advance_poller_cursors(worker_id: str, cursors: Dict[str, int]) -> None:
+    """Moves the cursors held by the worker forward to the given tweet IDs."""
+    backend.advance_poller_cursors(worker_id, cursors)
+
+
+def release_poller_cursors(worker_id: str, handles: List[str]) -> None:
+    """Releases the worker's cursors of the handles, so another worker can claim them."""
+    backend.release_poller_cursors(worker_id, handles)
+
+
+def claim_sent_tweets(pairs: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+    """Records the (tweet ID, chat ID) pairs as sent and returns those that weren't already."""
+    return backend.claim_sent_tweets(pairs)
+
+
+def find_unsent_tweets(pairs: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+    """Returns the (tweet ID, chat ID) pairs that haven't been sent, without claiming them."""
+    return backend.find_unsent_tweets(pairs)
+
+
+def release_sent_tweets(pairs: List[Tuple[int, str]]) -> None:
+    """Forgets that the (tweet ID, chat ID) pairs were sent."""
+    backend.release_sent_tweets(pairs)
+
+
+def prune_sent_tweets(retention_hours: float) -> None:
+    """Forgets the tweets sent longer ago than the retention period."""
+    backend.prune_sent_tweets(retention_hours)
+
+
+def enqueue_outbox_messages(messages: List[dict]) -> None:
+    """Adds the messages, dicts with a chatID and text, to the outbox."""
+    backend.enqueue_outbox_messages(messages)
+
+
+def claim_outbox_messages(worker_id: str, limit: int, lease_seconds: float) -> List[dict]:
+    """Claims the oldest messages in the outbox that are ready to be delivered."""
+    return backend.claim_outbox_messages(worker_id, limit, lease_seconds)
+
+
+def extend_outbox_leases(worker_id: str, ids: List[int], lease_seconds: float) -> List[int]:
+    """Extends the lease of the claimed messages and returns the IDs that are still held."""
+    return backend.extend_outbox_leases(worker_id, ids, lease_seconds)
+
+
+def complete_outbox_messages(ids: List[int]) -> None:
+    """Removes the delivered messages from the outbox."""
+    backend.complete_outbox_messages(ids)
+
+
+def retry_outbox_messages(worker_id: str, delays: Dict[int, float]) -> None:
+    """Releases the claimed messages to be delivered again after the delay for each."""
+    backend.retry_outbox_messages(worker_id, delays)
+
+
+def fail_outbox_messages(worker_id: str, ids: List[int]) -> None:
+    """Marks the claimed messages as failed so they are never retried."""
+    backend.fail_outbox_messages(worker_id, ids)
@@ -0,0 +1,146 @@
+import time
+import random
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from metrics import registry
+from constants import (
+    DB_API_BACKOFF_SECONDS,
+    DB_API_MAX_RETRIES,
+    DB_API_POOL_SIZE,
+    DB_API_TIMEOUT_SECONDS,
+)
+
+REQUEST_SECONDS = registry.histogram(
+    "db_api_client_request_seconds",
+    "Time taken by requests to the db_api, including any retries.",
+    ["method"],
+)
+REQUESTS = registry.counter(
+    "db_api_client_requests_total",
+    "Requests made to the db_api, by the status of their final attempt.",
+    ["method", "status"],
+)
+RETRIES = registry.counter(
+    "db_api_client_retries_total", "Attempts that failed and were retried.", ["method"]
+)
+
+# Requests that can be repeated without changing the result, so any failure can be retried
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+# Responses from a proxy in front of the db_api, which never passed the request on
+UNPROCESSED_STATUSES = {502, 503}
+
+
+class DbApiClient:
+    """
+    A client for the db_api that keeps its connections alive between requests.
+
+    Every request has a timeout, and requests that fail to connect, time out or receive a 5xx
+    response are retried a bounded number of times with jittered exponential backoff.
+
+    A POST, PUT or DELETE that timed out waiting for its response, lost its connection, or
+    got a 500, may already have been applied, so it is only retried if it never reached the
+    db_api: it couldn't connect, or a proxy answered with a 502 or 503.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        pool_size: int = DB_API_POOL_SIZE,
+        timeout_seconds: float = DB_API_TIMEOUT_SECONDS,
+        max_retries: int = DB_API_MAX_RETRIES,
+        backoff_seconds: float = DB_API_BACKOFF_SECONDS,
+    ):
+        """
+        Parameters:
+            base_url (str): the URL of the db_api, e.g. http://127.0.0.1:5000
+            pool_size (int): the maximum number of connections kept alive
+            timeout_seconds (float): how long to wait to connect and for each response
+            max_retries (int): how many times a failed request is retried
+            backoff_seconds (float): the delay before the first retry, doubled for each retry
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout_seconds = timeout_seconds
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @staticmethod
+    def _never_sent(error: requests.ConnectionError) -> bool:
+        """
+        Returns True if the request failed while connecting, before any of it was sent. A
+        ConnectionError is also raised when the connection is lost after the request was sent,
+        e.g. "Connection aborted", which isn't.
+        """
+        if isinstance(error, requests.ConnectTimeout):
+            return True
+
+        # requests wraps urllib3's MaxRetryError, whose reason is the underlying error
+        cause = error.args[0] if error.args else None
+        return isinstance(getattr(cause, "reason", cause), NewConnectionError)
+
+    def _backoff(self, attempt: int) -> None:
+        time.sleep(self.backoff_seconds * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        Makes a request to the db_api, retrying connection errors, timeouts and 5xx responses
+        as described in the class docstring.
+
+        Parameters:
+            method (str): the HTTP method
+            path (str): the path of the endpoint, e.g. /handles
+            kwargs: keyword arguments passed to requests.Session.request
+
+        Returns:
+            the response, which may be a 5xx response if every retry failed
+
+        Raises:
+            requests.RequestException: if the final attempt could not connect or timed out
+        """
+        kwargs.setdefault("timeout", self.timeout_seconds)
+        url = f"{self.base_url}{path}"
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        started = time.monotonic()
+        status = "error"
+
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                except requests.ConnectionError as e:
+                    if attempt == self.max_retries or not (idempotent or self._never_sent(e)):
+                        raise
+                except requests.Timeout:
+                    if attempt == self.max_retries or not idempotent:
+                        raise
+                else:
+                    retryable = response.status_code >= 500 and (
+                        idempotent or response.status_code in UNPROCESSED_STATUSES
+                    )
+                    if not retryable or attempt == self.max_retries:
+                        status = response.status_code
+                        return response
+
+                RETRIES.inc(method=method)
+                self._backoff(attempt)
+        finally:
+            REQUEST_SECONDS.observe(time.monotonic() - started, method=method)
+            REQUESTS.inc(method=method, status=status)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path: str, **kwargs) -> requests.Response:
+        return self.request("PUT", path, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", path, **kwargs)
@@ -0,0 +1,113 @@
+import json
+from typing import Callable, Iterator, List, Optional
+
+import requests
+
+from api.tweet import Tweet
+from constants import TW_BEARER_TOKEN, TW_STREAM_BASE_URL, TW_STREAM_READ_TIMEOUT_SECONDS
+
+
+class FilteredStreamClient:
+    """
+    A client for the Twitter API v2 filtered stream and its rules.
+
+    The base_url can be pointed at a local fake, see fake_stream.py.
+    """
+
+    def __init__(
+        self,
+        base_url: str = TW_STREAM_BASE_URL,
+        bearer_token: Optional[str] = TW_BEARER_TOKEN,
+        read_timeout_seconds: float = TW_STREAM_READ_TIMEOUT_SECONDS,
+    ):
+        """
+        Parameters:
+            base_url (str): the URL of the Twitter API, e.g. https://api.twitter.com
+            bearer_token (str | None): the app's bearer token
+            read_timeout_seconds (float): how long the stream may be silent before reconnecting,
+                Twitter sends a keep-alive every 20 seconds
+        """
+        self.base_url = base_url.rstrip("/")
+        self.read_timeout_seconds = read_timeout_seconds
+
+        self.session = requests.Session()
+        if bearer_token:
+            self.session.headers["Authorization"] = f"Bearer {bearer_token}"
+
+    def get_rules(self) -> List[dict]:
+        """Returns the current rules, dicts with an id and value."""
+        response = self.session.get(f"{self.base_url}/2/tweets/search/stream/rules", timeout=10)
+        response.raise_for_status()
+        return response.json().get("data") or []
+
+    def add_rules(self, values: List[str]) -> None:
+        """Adds a rule for each of the values."""
+        if not values:
+            return
+
+        body = {"add": [{"value": value} for value in values]}
+        response = self.session.post(
+            f"{self.base_url}/2/tweets/search/stream/rules", json=body, timeout=10
+        )
+        response.raise_for_status()
+
+    def delete_rules(self, ids: List[str]) -> None:
+        """Deletes the rules with the given IDs."""
+        if not ids:
+            return
+
+        body = {"delete": {"ids": list(ids)}}
+        response = self.session.post(
+            f"{self.base_url}/2/tweets/search/stream/rules", json=body, timeout=10
+        )
+        response.raise_for_status()
+
+    def stream(self, on_connect: Optional[Callable[[], None]] = None) -> Iterator[Tweet]:
+        """
+        Connects to the stream and yields each tweet as it arrives.
+
+        The iterator only ends when the connection is lost, a requests.HTTPError is raised if
+        the connection is refused.
+
+        Parameters:
+            on_connect (Callable | None): called once the connection has been accepted
+        """
+        params = {"expansions": "author_id", "user.fields": "username"}
+
+        with self.session.get(
+            f"{self.base_url}/2/tweets/search/stream",
+            params=params,
+            stream=True,
+            timeout=(10, self.read_timeout_seconds),
+        ) as response:
+            response.raise_for_status()
+            if on_connect is not None:
+                on_connect()
+
+            for line in response.iter_lines():
+                # Empty lines are the keep-alive heartbeats
+                if not line:
+                    continue
+
+                tweet = parse_stream_line(line)
+                if tweet is not None:
+                    yield tweet
+
+
+def parse_stream_line(line: bytes) -> Optional[Tweet]:
+    """Returns the tweet in a line of the stream or None if the line doesn't contain one."""
+    try:
+        message = json.loads(line)
+    except ValueError:
+        return None
+
+    data = message.get("data")
+    if not data:
+        return None
+
+    users = {user["id"]: user["username"] for user in message.get("includes", {}).get("users", [])}
+    username = users.get(data.get("author_id"))
+    if username is None:
+        return None
+
+    return Tweet(int(data["id"]), username)
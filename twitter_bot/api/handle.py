@@ -1,16 +1,25 @@
-from typing import List
+from typing import List, Optional, Tuple
 from datetime import datetime
 
-from api.twitter_funcs import get_most_recent_tweet_urls
+from api.tweet import Tweet
+from api.twitter_funcs import get_tweets_since
 from constants import TW_MAX_FETCH_COUNT
 
 
 class Watcher:
-    def __init__(self, id: int, chat_id: str, created_at: datetime, updated_at: datetime):
+    def __init__(
+        self,
+        id: int,
+        chat_id: str,
+        created_at: Optional[datetime] = None,
+        updated_at: Optional[datetime] = None,
+        digest: bool = False,
+    ):
         self._id: int = id
         self.chat_id: str = chat_id
-        self.created_at: datetime = created_at
-        self.updated_at: datetime = updated_at
+        self.created_at: Optional[datetime] = created_at
+        self.updated_at: Optional[datetime] = updated_at
+        self.digest: bool = digest
 
 
 class Handle:
@@ -31,18 +40,22 @@ class Handle:
         """Returns True if the Handle has watchers, otherwise False"""
         return self.watchers
 
-    def recent_tweets(self, since: datetime, limit: int = TW_MAX_FETCH_COUNT):
+    def recent_tweets(
+        self, since_id: Optional[int], limit: int = TW_MAX_FETCH_COUNT, max_id: Optional[int] = None
+    ) -> Tuple[List[Tweet], Optional[int]]:
         """
-        Fetches the most recent tweets for the handle.
+        Fetches the tweets for the handle that are newer than since_id.
 
         Parameters:
-            since (datetime): the maximum age of tweets to be fetched
-            limit (int): the maximim number of tweets to be fetched prior to since filtering
+            since_id (int | None): the ID of the newest tweet already seen for the handle
+            limit (int): the number of tweets to be fetched per page
+            max_id (int | None): the ID of the newest tweet to fetch, to resume an earlier fetch
 
         Returns:
-            a list of URLs associated with recent tweets
+            a list of tweets, newest first, and the max_id to resume from or None if caught up,
+            see get_tweets_since
         """
-        return get_most_recent_tweet_urls(self.name, since, limit)
+        return get_tweets_since(self.name, since_id, limit, max_id=max_id)
 
 
 def handle_factory(handle: dict) -> Handle:
@@ -51,7 +64,13 @@ def handle_factory(handle: dict) -> Handle:
 
     for watcher in handle["watchers"]:
         __handle.add_watcher(
-            Watcher(watcher["id"], watcher["chatID"], watcher["createdAt"], watcher["updatedAt"])
+            Watcher(
+                watcher["id"],
+                watcher["chatID"],
+                watcher.get("createdAt"),
+                watcher.get("updatedAt"),
+                watcher.get("digest", False),
+            )
         )
 
     return __handle
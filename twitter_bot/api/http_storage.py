@@ -0,0 +1,201 @@
+from typing import Dict, List, Optional, Tuple
+
+from api.db_api_client import DbApiClient
+from api.handle import Handle, handle_factory
+from api.storage import StorageBackend
+from api.tweet import Tweet
+
+
+class HttpStorageBackend(StorageBackend):
+    """Reaches the bot's data through the db_api over HTTP."""
+
+    def __init__(self, base_url: str):
+        """
+        Parameters:
+            base_url (str): the URL of the db_api, e.g. http://127.0.0.1:5000
+        """
+        self.client = DbApiClient(base_url)
+
+        # The last subscriptions received and their ETag, reused while the subscriptions are unchanged
+        self._subscriptions_snapshot: Optional[List[Handle]] = None
+        self._subscriptions_etag: Optional[str] = None
+
+    def get_all_handle_names(self) -> List[str]:
+        response = self.client.get("/handles").json()
+
+        if response and response["success"]:
+            return response["payload"]["handles"]
+        elif response and not response["success"]:
+            raise Exception(response["error"]["message"])
+        else:
+            raise Exception("Respons is None!")
+
+    def get_subscriptions(self) -> List[Handle]:
+        """
+        Returns every handle that has at least one watcher, with its watchers attached.
+
+        The previous response is reused when the db_api reports the subscriptions are unchanged.
+        """
+        headers = {}
+        if self._subscriptions_snapshot is not None and self._subscriptions_etag:
+            headers["If-None-Match"] = self._subscriptions_etag
+
+        raw_response = self.client.get("/subscriptions", headers=headers)
+        if raw_response.status_code == 304:
+            return self._subscriptions_snapshot
+
+        response = raw_response.json()
+
+        if response and response["success"]:
+            self._subscriptions_snapshot = [
+                handle_factory(h) for h in response["payload"]["subscriptions"]
+            ]
+            self._subscriptions_etag = raw_response.headers.get("ETag")
+            return self._subscriptions_snapshot
+        elif response and not response["success"]:
+            raise Exception(response["error"]["message"])
+        else:
+            raise Exception("There has been an issue retrieving the subscriptions.")
+
+    def get_handle(self, handle: str) -> Handle:
+        response = self.client.get(f"/handle/{handle}").json()
+
+        if response and response["success"]:
+            return handle_factory(response["payload"])
+        elif response and not response["success"]:
+            raise Exception(response["error"]["message"])
+        else:
+            raise Exception("There has been an issue retrieving the handle.")
+
+    def get_watcher(self, chat_id: str) -> dict:
+        response = self.client.get(f"/watcher/{chat_id}").json()
+
+        if response and response["success"]:
+            return response["payload"]
+        elif response and not response["success"]:
+            raise Exception(response["error"]["message"])
+        else:
+            raise Exception("There has been an issue retrieving the watcher.")
+
+    def update_latest_tweets(self, tweets: List[Tweet]) -> None:
+        body = {"tweets": [{"handle": t.handle, "tweetID": t.id, "url": t.url} for t in tweets]}
+        response = self.client.put("/latest", json=body).json()
+
+        if response and not response["success"]:
+            raise Exception(response["error"]["message"])
+
+    def heartbeat_poller_worker(self, worker_id: str) -> List[str]:
+        response = self.client.post(f"/pollers/{worker_id}/heartbeat").json()
+
+        if response and response["success"]:
+            return response["payload"]["workers"]
+        elif response and not response["success"]:
+            raise Exception(response["error"]["message"])
+        else:
+            raise Exception("There has been an issue registering the poller worker.")
+
+    def remove_poller_worker(self, worker_id: str) -> None:
+        response = self.client.delete(f"/pollers/{worker_id}").json()
+
+        if not response or not response["success"]:
+            raise Exception("There has been an issue removing the poller worker.")
+
+    def claim_poller_cursors(self, worker_id: str, handles: List[str]) -> Dict[str, Optional[int]]:
+        body = {"handles": handles}
+        response = self.client.post(f"/pollers/{worker_id}/cursors/claim", json=body).json()
+
+        if response and response["success"]:
+            return {c["handle"]: c["sinceID"] for c in response["payload"]["cursors"]}
+        else:
+            raise Exception("There has been an issue claiming the poller cursors.")
+
+    def advance_poller_cursors(self, worker_id: str, cursors: Dict[str, int]) -> None:
+        body = {"cursors": [{"handle": h, "sinceID": since_id} for h, since_id in cursors.items()]}
+        response = self.client.put(f"/pollers/{worker_id}/cursors", json=body).json()
+
+        if not response or not response["success"]:
+            raise Exception("There has been an issue advancing the poller cursors.")
+
+    def release_poller_cursors(self, worker_id: str, handles: List[str]) -> None:
+        body = {"handles": handles}
+        response = self.client.post(f"/pollers/{worker_id}/cursors/release", json=body).json()
+
+        if not response or not response["success"]:
+            raise Exception("There has been an issue releasing the poller cursors.")
+
+    def claim_sent_tweets(self, pairs: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+        body = {"pairs": [{"tweetID": tweet_id, "chatID": chat_id} for tweet_id, chat_id in pairs]}
+        response = self.client.post("/sent-tweets/claim", json=body).json()
+
+        if response and response["success"]:
+            return [(p["tweetID"], p["chatID"]) for p in response["payload"]["pairs"]]
+        else:
+            raise Exception("There has been an issue claiming the sent tweets.")
+
+    def find_unsent_tweets(self, pairs: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+        body = {"pairs": [{"tweetID": tweet_id, "chatID": chat_id} for tweet_id, chat_id in pairs]}
+        response = self.client.post("/sent-tweets/unsent", json=body).json()
+
+        if response and response["success"]:
+            return [(p["tweetID"], p["chatID"]) for p in response["payload"]["pairs"]]
+        else:
+            raise Exception("There has been an issue finding the unsent tweets.")
+
+    def release_sent_tweets(self, pairs: List[Tuple[int, str]]) -> None:
+        body = {"pairs": [{"tweetID": tweet_id, "chatID": chat_id} for tweet_id, chat_id in pairs]}
+        response = self.client.post("/sent-tweets/release", json=body).json()
+
+        if not response or not response["success"]:
+            raise Exception("There has been an issue releasing the sent tweets.")
+
+    def prune_sent_tweets(self, retention_hours: float) -> None:
+        params = {"retentionHours": retention_hours}
+        response = self.client.delete("/sent-tweets", params=params).json()
+
+        if not response or not response["success"]:
+            raise Exception("There has been an issue pruning the sent tweets.")
+
+    def enqueue_outbox_messages(self, messages: List[dict]) -> None:
+        response = self.client.post("/outbox", json={"messages": messages}).json()
+
+        if not response or not response["success"]:
+            raise Exception("There has been an issue adding the messages to the outbox.")
+
+    def claim_outbox_messages(self, worker_id: str, limit: int, lease_seconds: float) -> List[dict]:
+        body = {"workerID": worker_id, "limit": limit, "leaseSeconds": lease_seconds}
+        response = self.client.post("/outbox/claim", json=body).json()
+
+        if response and response["success"]:
+            return response["payload"]["messages"]
+        else:
+            raise Exception("There has been an issue claiming messages from the outbox.")
+
+    def complete_outbox_messages(self, ids: List[int]) -> None:
+        response = self.client.post("/outbox/complete", json={"ids": ids}).json()
+
+        if not response or not response["success"]:
+            raise Exception("There has been an issue completing the outbox messages.")
+
+    def extend_outbox_leases(self, worker_id: str, ids: List[int], lease_seconds: float) -> List[int]:
+        body = {"workerID": worker_id, "ids": ids, "leaseSeconds": lease_seconds}
+        response = self.client.post("/outbox/extend", json=body).json()
+
+        if response and response["success"]:
+            return response["payload"]["ids"]
+        else:
+            raise Exception("There has been an issue extending the outbox leases.")
+
+    def retry_outbox_messages(self, worker_id: str, delays: Dict[int, float]) -> None:
+        retries = [{"id": id, "delaySeconds": delay} for id, delay in delays.items()]
+        body = {"workerID": worker_id, "retries": retries}
+        response = self.client.post("/outbox/retry", json=body).json()
+
+        if not response or not response["success"]:
+            raise Exception("There has been an issue releasing the outbox messages to be retried.")
+
+    def fail_outbox_messages(self, worker_id: str, ids: List[int]) -> None:
+        body = {"workerID": worker_id, "ids": ids}
+        response = self.client.post("/outbox/fail", json=body).json()
+
+        if not response or not response["success"]:
+            raise Exception("There has been an issue marking the outbox messages as failed.")
@@ -0,0 +1,136 @@
+import sys
+import importlib.util
+from pathlib import Path
+from types import ModuleType
+from typing import Dict, List, Optional, Tuple, Union
+
+from api.handle import Handle, handle_factory
+from api.storage import StorageBackend
+from api.tweet import Tweet
+import metrics
+
+
+def _load_module(name: str, path: Path) -> ModuleType:
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_db_module(db_api_path: Union[Path, str]) -> ModuleType:
+    """
+    Loads the db_api's db module, so its queries and connection pool can be used in process.
+
+    The db_api imports its own constants module by name, which is swapped in while db.py is
+    loaded so it doesn't pick up the Twitter bot's constants. Its metrics module is the same
+    file as the Twitter bot's, see check_shared.py, so the bot's is swapped in instead and
+    the db_api's query metrics are served with the bot's own.
+
+    Parameters:
+        db_api_path (pathlib.Path | str): the path to the db_api directory
+    """
+    db_api_path = Path(db_api_path).resolve()
+    saved = {name: sys.modules.get(name) for name in ("constants", "metrics")}
+
+    sys.path.append(str(db_api_path))
+    try:
+        sys.modules["constants"] = _load_module("db_api_constants", db_api_path / "constants.py")
+        sys.modules["metrics"] = metrics
+        return _load_module("db_api_db", db_api_path / "db.py")
+    finally:
+        sys.path.remove(str(db_api_path))
+        for name, module in saved.items():
+            if module is not None:
+                sys.modules[name] = module
+            else:
+                sys.modules.pop(name, None)
+
+
+class PostgresStorageBackend(StorageBackend):
+    """
+    Reads and writes the bot's data directly from Postgres, skipping the HTTP hop to the db_api.
+
+    The db_api's own queries are used, through its pooled connections, so both paths return
+    exactly the same data.
+    """
+
+    def __init__(self, db_api_path: Union[Path, str]):
+        """
+        Parameters:
+            db_api_path (pathlib.Path | str): the path to the db_api directory
+        """
+        self.db = load_db_module(db_api_path)
+
+    def get_all_handle_names(self) -> List[str]:
+        return self.db.fetch_all_handles()
+
+    def get_subscriptions(self) -> List[Handle]:
+        return [handle_factory(h) for h in self.db.fetch_subscriptions()]
+
+    def get_handle(self, handle: str) -> Handle:
+        return handle_factory(self.db.fetch_handle(handle))
+
+    def get_watcher(self, chat_id: str) -> dict:
+        return self.db.fetch_watcher(chat_id)
+
+    def update_latest_tweets(self, tweets: List[Tweet]) -> None:
+        self.db.upsert_latest_tweets(
+            [{"handle": t.handle, "tweetID": t.id, "url": t.url} for t in tweets]
+        )
+
+    def heartbeat_poller_worker(self, worker_id: str) -> List[str]:
+        return self.db.heartbeat_poller_worker(worker_id)
+
+    def remove_poller_worker(self, worker_id: str) -> None:
+        self.db.remove_poller_worker(worker_id)
+
+    def claim_poller_cursors(self, worker_id: str, handles: List[str]) -> Dict[str, Optional[int]]:
+        return self.db.claim_poller_cursors(worker_id, handles)
+
+    def advance_poller_cursors(self, worker_id: str, cursors: Dict[str, int]) -> None:
+        self.db.advance_poller_cursors(
+            worker_id, [{"handle": h, "sinceID": since_id} for h, since_id in cursors.items()]
+        )
+
+    def release_poller_cursors(self, worker_id: str, handles: List[str]) -> None:
+        self.db.release_poller_cursors(worker_id, handles)
+
+    def claim_sent_tweets(self, pairs: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+        claimed = self.db.claim_sent_tweets(
+            [{"tweetID": tweet_id, "chatID": chat_id} for tweet_id, chat_id in pairs]
+        )
+        return [(p["tweetID"], p["chatID"]) for p in claimed]
+
+    def find_unsent_tweets(self, pairs: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+        unsent = self.db.find_unsent_tweets(
+            [{"tweetID": tweet_id, "chatID": chat_id} for tweet_id, chat_id in pairs]
+        )
+        return [(p["tweetID"], p["chatID"]) for p in unsent]
+
+    def release_sent_tweets(self, pairs: List[Tuple[int, str]]) -> None:
+        self.db.release_sent_tweets(
+            [{"tweetID": tweet_id, "chatID": chat_id} for tweet_id, chat_id in pairs]
+        )
+
+    def prune_sent_tweets(self, retention_hours: float) -> None:
+        self.db.prune_sent_tweets(retention_hours)
+
+    def enqueue_outbox_messages(self, messages: List[dict]) -> None:
+        self.db.enqueue_outbox_messages(messages)
+
+    def claim_outbox_messages(self, worker_id: str, limit: int, lease_seconds: float) -> List[dict]:
+        return self.db.claim_outbox_messages(worker_id, limit, lease_seconds)
+
+    def complete_outbox_messages(self, ids: List[int]) -> None:
+        self.db.complete_outbox_messages(ids)
+
+    def extend_outbox_leases(self, worker_id: str, ids: List[int], lease_seconds: float) -> List[int]:
+        return self.db.extend_outbox_leases(worker_id, ids, lease_seconds)
+
+    def retry_outbox_messages(self, worker_id: str, delays: Dict[int, float]) -> None:
+        self.db.retry_outbox_messages(
+            worker_id, [{"id": id, "delaySeconds": delay} for id, delay in delays.items()]
+        )
+
+    def fail_outbox_messages(self, worker_id: str, ids: List[int]) -> None:
+        self.db.fail_outbox_messages(worker_id, ids)
@@ -0,0 +1,88 @@
+from typing import Dict, List, Optional, Tuple
+
+from api.handle import Handle
+from api.tweet import Tweet
+
+
+class StorageBackend:
+    """The interface through which the Twitter bot reads and writes the bot's data."""
+
+    def get_all_handle_names(self) -> List[str]:
+        """Returns a list of all handle name strings."""
+        raise NotImplementedError
+
+    def get_subscriptions(self) -> List[Handle]:
+        """Returns every handle that has at least one watcher, with its watchers attached."""
+        raise NotImplementedError
+
+    def get_handle(self, handle: str) -> Handle:
+        """Returns a Handle and the watchers associated with it."""
+        raise NotImplementedError
+
+    def get_watcher(self, chat_id: str) -> dict:
+        """Returns a dict representing a watcher and the handles they are following."""
+        raise NotImplementedError
+
+    def update_latest_tweets(self, tweets: List[Tweet]) -> None:
+        """Records the given tweets as the newest tweet of their handles, for /latest to read."""
+        raise NotImplementedError
+
+    def heartbeat_poller_worker(self, worker_id: str) -> List[str]:
+        """Registers a heartbeat for the poller worker and returns the IDs of every live worker."""
+        raise NotImplementedError
+
+    def remove_poller_worker(self, worker_id: str) -> None:
+        """Removes the poller worker from the registry and releases its cursors."""
+        raise NotImplementedError
+
+    def claim_poller_cursors(self, worker_id: str, handles: List[str]) -> Dict[str, Optional[int]]:
+        """Claims the cursors of the handles for the worker and returns those it now holds."""
+        raise NotImplementedError
+
+    def advance_poller_cursors(self, worker_id: str, cursors: Dict[str, int]) -> None:
+        """Moves the cursors held by the worker forward to the given tweet IDs."""
+        raise NotImplementedError
+
+    def release_poller_cursors(self, worker_id: str, handles: List[str]) -> None:
+        """Releases the worker's cursors of the handles, so another worker can claim them."""
+        raise NotImplementedError
+
+    def claim_sent_tweets(self, pairs: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+        """Records the (tweet ID, chat ID) pairs as sent and returns those that weren't already."""
+        raise NotImplementedError
+
+    def find_unsent_tweets(self, pairs: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+        """Returns the (tweet ID, chat ID) pairs that haven't been sent, without claiming them."""
+        raise NotImplementedError
+
+    def release_sent_tweets(self, pairs: List[Tuple[int, str]]) -> None:
+        """Forgets that the (tweet ID, chat ID) pairs were sent."""
+        raise NotImplementedError
+
+    def prune_sent_tweets(self, retention_hours: float) -> None:
+        """Forgets the tweets sent longer ago than the retention period."""
+        raise NotImplementedError
+
+    def enqueue_outbox_messages(self, messages: List[dict]) -> None:
+        """Adds the messages, dicts with a chatID and text, to the outbox."""
+        raise NotImplementedError
+
+    def claim_outbox_messages(self, worker_id: str, limit: int, lease_seconds: float) -> List[dict]:
+        """Claims the oldest messages in the outbox that are ready to be delivered."""
+        raise NotImplementedError
+
+    def extend_outbox_leases(self, worker_id: str, ids: List[int], lease_seconds: float) -> List[int]:
+        """Extends the lease of the claimed messages and returns the IDs that are still held."""
+        raise NotImplementedError
+
+    def complete_outbox_messages(self, ids: List[int]) -> None:
+        """Removes the delivered messages from the outbox."""
+        raise NotImplementedError
+
+    def retry_outbox_messages(self, worker_id: str, delays: Dict[int, float]) -> None:
+        """Releases the claimed messages to be delivered again after the delay for each."""
+        raise NotImplementedError
+
+    def fail_outbox_messages(self, worker_id: str, ids: List[int]) -> None:
+        """Marks the claimed messages as failed so they are never retried."""
+        raise NotImplementedError
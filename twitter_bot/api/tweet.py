@@ -0,0 +1,22 @@
+from typing import Optional
+from datetime import datetime, timezone
+
+# Tweet IDs are snowflakes, the milliseconds since this epoch shifted left by 22 bits
+TWITTER_EPOCH_MS = 1288834974657
+
+
+def tweet_id_posted_at(tweet_id: int) -> datetime:
+    """Returns when the tweet with the given ID was posted, read from the ID itself."""
+    return datetime.fromtimestamp(((tweet_id >> 22) + TWITTER_EPOCH_MS) / 1000, timezone.utc)
+
+
+class Tweet:
+    def __init__(self, id: int, handle: str, created_at: Optional[datetime] = None):
+        self.id: int = id
+        self.handle: str = handle
+        self.created_at: Optional[datetime] = created_at
+
+    @property
+    def url(self) -> str:
+        """The URL linking to the tweet."""
+        return f"https://twitter.com/{self.handle}/status/{self.id}"
@@ -1,45 +1,202 @@
+import logging
 import tweepy as tw
-from datetime import datetime
-from typing import List
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
 
+from api.rate_limits import PerThreadAPI, RateLimitManager
+from api.tweet import Tweet, tweet_id_posted_at
 from constants import (
     TW_ACCESS_TOKEN,
     TW_ACCESS_TOKEN_SECRET,
     TW_API_KEY,
     TW_API_KEY_SECRET,
+    TW_MAX_FETCH_PAGES,
+    TW_SEARCH_MAX_CURSOR_AGE_HOURS,
+    TW_SEARCH_PAGE_SIZE,
+    TW_SEARCH_QUERY_MAX_LENGTH,
 )
 
 
 auth = tw.OAuthHandler(TW_API_KEY, TW_API_KEY_SECRET)
 auth.set_access_token(TW_ACCESS_TOKEN, TW_ACCESS_TOKEN_SECRET)
-api = tw.API(auth, wait_on_rate_limit=True)
+# Requests are refused by the rate limit manager rather than sleeping until the limit resets
+api = PerThreadAPI(lambda: tw.API(auth, wait_on_rate_limit=False))
+rate_limits = RateLimitManager()
+logger = logging.getLogger(__name__)
 
+TIMELINE_ENDPOINT = "/statuses/user_timeline"
+SEARCH_ENDPOINT = "/search/tweets"
 
-def stndardise_datetime(ts: datetime) -> datetime:
-    """Ensures datetime timestamps are standardised for comparison, preventing issues comparing naive and aware datetimes"""
-    fmt: str = "%Y %d %m %H %M %S"
-    return datetime.strptime(ts.strftime(fmt), fmt)
 
+def _caught_up(results: list, since_id: int) -> bool:
+    """
+    Returns True if a page shows that every tweet after since_id has been fetched.
 
-def get_most_recent_tweet_urls(handle: str, since: datetime, limit: int) -> List[str]:
+    A page can come back with fewer tweets than were asked for while older ones remain, as
+    Twitter removes deleted, withheld and suspended tweets after applying count, so only an
+    empty page or one reaching the tweet after since_id shows the timeline is caught up.
     """
-    Returns a list of recent tweets; max fetched is limit and then filtered on since
+    return not results or min(tweet.id for tweet in results) <= since_id + 1
+
+
+def get_tweets_since(
+    handle: str,
+    since_id: Optional[int],
+    limit: int,
+    max_pages: int = TW_MAX_FETCH_PAGES,
+    max_id: Optional[int] = None,
+) -> Tuple[List[Tweet], Optional[int]]:
+    """
+    Returns the tweets newer than since_id, paging through the timeline until caught up.
+
+    Paging stops at an empty page, or one reaching the tweet after since_id. If max_pages are
+    fetched without catching up, the max_id the next fetch should resume from is returned
+    along with the tweets, so the tweets between since_id and the oldest tweet fetched can be
+    fetched next time rather than being skipped.
+
+    When since_id is None only the most recent tweet is fetched, so a cursor can be established
+    for a newly watched handle without fetching its whole timeline.
 
     Parameters:
         handle (str): the Twitter handle to be searched for
-        since (datetime.datetime): the maximum age of tweets to be fetched
-        limit (int): the maximum number of tweets to be fetched prior to since filtering
+        since_id (int | None): the ID of the newest tweet already seen for the handle
+        limit (int): the number of tweets to be fetched per page
+        max_pages (int): the maximum number of pages to be fetched
+        max_id (int | None): the ID of the newest tweet to fetch, to resume an earlier fetch
+
+    Returns:
+        a list of tweets, newest first, and the max_id to resume from or None if caught up
+
+    Raises:
+        RateLimitExhaustedError if the timeline endpoint has no budget left
+    """
+    if since_id is None:
+        results = rate_limits.call(
+            api, TIMELINE_ENDPOINT, api.user_timeline, screen_name=handle, count=1
+        )
+        return [Tweet(tweet.id, handle, tweet.created_at) for tweet in results], None
+
+    tweets: List[Tweet] = []
+
+    for _ in range(max(1, max_pages)):
+        params = {"screen_name": handle, "count": limit, "since_id": since_id}
+        if max_id is not None:
+            params["max_id"] = max_id
+
+        results = rate_limits.call(api, TIMELINE_ENDPOINT, api.user_timeline, **params)
+        tweets.extend(Tweet(tweet.id, handle, tweet.created_at) for tweet in results)
+        if _caught_up(results, since_id):
+            return tweets, None
+
+        max_id = min(tweet.id for tweet in results) - 1
+
+    logger.warning(
+        "@%s has more than %s new tweets, those between %s and %s are fetched next time",
+        handle,
+        len(tweets),
+        since_id,
+        max_id + 1,
+    )
+    return tweets, max_id
+
+
+def build_search_queries(
+    handles: List[str], max_length: int = TW_SEARCH_QUERY_MAX_LENGTH
+) -> List[List[str]]:
+    """
+    Packs the handles into groups whose "from:a OR from:b" query fits within max_length.
+
+    Parameters:
+        handles (List[str]): the Twitter handles to be searched for
+        max_length (int): the maximum length of a search query
 
     Returns:
-        a list of URLs associated with recent tweets
+        a list of groups of handles, one group per query
     """
-    since = stndardise_datetime(since)
+    groups: List[List[str]] = []
+    length = 0
+
+    for handle in handles:
+        term_length = len(f"from:{handle}")
+
+        if groups and length + len(" OR ") + term_length <= max_length:
+            groups[-1].append(handle)
+            length += len(" OR ") + term_length
+        else:
+            groups.append([handle])
+            length = term_length
+
+    return groups
+
+
+def within_search_window(
+    since_id: int, max_age_hours: float = TW_SEARCH_MAX_CURSOR_AGE_HOURS
+) -> bool:
+    """
+    Returns True if the tweets after since_id can all be found by recent search, which only
+    covers about the last week, so the cursor must be younger than max_age_hours.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=max_age_hours)
+    return tweet_id_posted_at(since_id) >= cutoff
+
+
+def get_tweets_by_search(
+    handles: List[str],
+    since_ids: Dict[str, int],
+    limit: int = TW_SEARCH_PAGE_SIZE,
+    max_pages: int = TW_MAX_FETCH_PAGES,
+) -> Dict[str, Tuple[List[Tweet], Optional[int]]]:
+    """
+    Returns the tweets newer than each handle's since_id using a single recent search query.
+
+    The handles must fit within one query, see build_search_queries, and their cursors must be
+    within_search_window, as search can't reach older tweets. The query is bounded by the
+    oldest of the cursors and the results are split back out and filtered per handle. Paging
+    stops as for get_tweets_since, and if max_pages run out the handles whose tweets weren't
+    all fetched are given the max_id to resume from, with their timeline, next time.
+
+    Parameters:
+        handles (List[str]): the Twitter handles to be searched for
+        since_ids (Dict[str, int]): the ID of the newest tweet already seen, keyed by handle
+        limit (int): the number of tweets to be fetched per page
+        max_pages (int): the maximum number of pages to be fetched
+
+    Returns:
+        a dict keyed by handle of its tweets, newest first, and the max_id to resume from or
+        None if caught up
+    """
+    names = {handle.lower(): handle for handle in handles}
+    query = " OR ".join(f"from:{handle}" for handle in handles)
+    since_id = min(since_ids[handle] for handle in handles)
+
+    tweets: Dict[str, List[Tweet]] = {handle: [] for handle in handles}
+    max_id: Optional[int] = None
+
+    for _ in range(max(1, max_pages)):
+        params = {"q": query, "count": limit, "since_id": since_id, "result_type": "recent"}
+        if max_id is not None:
+            params["max_id"] = max_id
+
+        results = rate_limits.call(api, SEARCH_ENDPOINT, api.search_tweets, **params)
+        for tweet in results:
+            handle = names.get(tweet.user.screen_name.lower())
+            if handle is not None and tweet.id > since_ids[handle]:
+                tweets[handle].append(Tweet(tweet.id, handle, tweet.created_at))
+
+        if _caught_up(results, since_id):
+            return {handle: (tweets[handle], None) for handle in handles}
 
-    try:
-        results = api.user_timeline(screen_name=handle, count=limit)
-    except tw.error.TweepError:
-        results = []
+        max_id = min(tweet.id for tweet in results) - 1
 
-    # Ensure tweets are recent enough and return list of URL strings
-    tweets = filter(lambda tweet: stndardise_datetime(tweet.created_at) > since, results)
-    return [f"https://twitter.com/{handle}/status/{tweet.id_str}" for tweet in tweets]
+    logger.warning(
+        "The search for %s has more than %s pages of new tweets, those before %s are fetched "
+        "next time",
+        ", ".join(f"@{handle}" for handle in handles),
+        max_pages,
+        max_id + 1,
+    )
+    # A handle whose cursor is at or past max_id has had every new tweet fetched
+    return {
+        handle: (tweets[handle], max_id if since_ids[handle] < max_id else None)
+        for handle in handles
+    }
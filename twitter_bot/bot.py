@@ -1,72 +1,436 @@
 import time
-from typing import List
-from datetime import datetime
+import logging
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
 from telegram.ext import Updater
-from telegram.error import BadRequest
 
 from api import db as dbapi
 from api.handle import Handle
+from api.tweet import Tweet
+from dedup import SentTweets, SharedSentTweets
+from dispatcher import DROPPED, FAILED, SENT, DigestBuffer, MessageDispatcher
+from fetcher import Backfills, fetch_recent_tweets
+from metrics import registry, start_metrics_server
+from outbox import OutboxWriter
 from properties import Properties
-from constants import TELEGRAM_TOKEN, TW_SLEEP_TIMEOUT_SECONDS
+from scheduler import PollScheduler
+from sharding import Shard, SharedCursors
+from stream import TweetStream
+from subscriptions import SubscriptionMap
+from constants import (
+    TELEGRAM_TOKEN,
+    TW_DELIVERY_MODE,
+    TW_INGESTION_MODE,
+    TW_METRICS_HOST,
+    TW_METRICS_PORT,
+    TW_SHARDING_ENABLED,
+    TW_SLEEP_TIMEOUT_SECONDS,
+    TW_SUBSCRIPTION_SOURCE,
+    TW_WORKER_ID,
+)
 
 
-def send_telegram_message(updater: Updater, chat_id: str, message: str) -> None:
+logger = logging.getLogger(__name__)
+
+PROCESS_SECONDS = registry.histogram(
+    "twitter_bot_process_tweets_seconds",
+    "Time taken by process_tweets to fetch, dispatch and record a batch of handles.",
+)
+TWEETS = registry.counter("twitter_bot_tweets_total", "New tweets dispatched to their watchers.")
+ERRORS = registry.counter(
+    "twitter_bot_errors_total", "Errors handled by the main loop, by operation.", ["operation"]
+)
+
+
+_failed_lock = threading.Lock()
+
+
+def release_unsent(
+    sent: Union[SentTweets, SharedSentTweets], tweet_id: int, chat_id: str, failed: Set[int]
+) -> Callable[[str], None]:
+    """
+    Returns an on_result callback releasing the tweet's claim for the chat if its message
+    wasn't sent. The IDs of tweets whose messages failed are added to failed, to be fetched
+    and sent again, while rejected messages are dropped.
+    """
+
+    def on_result(result: str) -> None:
+        if result == SENT:
+            return
+
+        sent.release([(tweet_id, chat_id)])
+        if result == FAILED:
+            with _failed_lock:
+                failed.add(tweet_id)
+        else:
+            DROPPED.inc(reason=result)
+
+    return on_result
+
+
+def dispatch_telegram_messages(
+    dispatcher: Union[MessageDispatcher, OutboxWriter],
+    digests: DigestBuffer,
+    sent: Union[SentTweets, SharedSentTweets],
+    handle: Handle,
+    tweets: List[Tweet],
+    failed: Optional[Set[int]] = None,
+) -> int:
     """
-    Sends a message to the designated chat_id, nothing happens if the chat_id cannot be found
+    Queues the given tweets to be sent to the appropriate chat_id.
+
+    Tweets that have already been sent to a chat are skipped for that chat, the tweets are
+    claimed for every chat at once before any is queued. A claim is released again if its
+    message isn't sent. Tweets for chats in digest mode are held by the digest buffer to be
+    sent together, they are only claimed once their digest is queued.
 
     Parameters:
-        updater (telegram.ext.Updater): updater for sending messages using the Telegram API
-        chat_id (str): the chat identifier
-        message (str): the text body of the message
+        dispatcher (MessageDispatcher | OutboxWriter): sends the messages or adds them to the outbox
+        digests (DigestBuffer): the buffer grouping tweets for chats in digest mode
+        sent (SentTweets | SharedSentTweets): the tweets already sent to each chat
+        handle (Handle): a dict representing the handle
+        tweets (List[Tweet]): the tweets to be sent, in the order they are sent
+        failed (Set[int] | None): collects the IDs of the tweets whose messages failed
+
+    Returns:
+        the number of tweets queued or held for at least one chat, tweets fetched again while
+        they are held or after they've been sent aren't counted
     """
-    try:
-        updater.bot.send_message(chat_id=chat_id, text=message)
-    except BadRequest:
-        # The chat_id cannot be found
-        return None
+    failed = set() if failed is None else failed
+    digest_chats = [str(watcher.chat_id) for watcher in handle.watchers if watcher.digest]
+    instant = [str(watcher.chat_id) for watcher in handle.watchers if not watcher.digest]
+    chat_ids = {str(watcher.chat_id): watcher.chat_id for watcher in handle.watchers}
+    urls = {tweet.id: tweet.url for tweet in tweets}
+    dispatched: Set[int] = set()
 
+    for tweet_id, chat_id in sent.claim([(tweet.id, c) for tweet in tweets for c in instant]):
+        text = f"@{handle.name} has tweeted:\n\n{urls[tweet_id]}"
+        dispatcher.enqueue(chat_ids[chat_id], text, release_unsent(sent, tweet_id, chat_id, failed))
+        dispatched.add(tweet_id)
 
-def dispatch_telegram_messages(updater: Updater, handle: Handle, tweet_urls: List[str]) -> None:
+    for tweet_id, chat_id in sent.unsent([(tweet.id, c) for tweet in tweets for c in digest_chats]):
+        line = f"@{handle.name}: {urls[tweet_id]}"
+        if digests.add(chat_ids[chat_id], handle.name, tweet_id, line):
+            dispatched.add(tweet_id)
+
+    return len(dispatched)
+
+
+@PROCESS_SECONDS.time()
+def process_tweets(
+    dispatcher: Union[MessageDispatcher, OutboxWriter],
+    digests: DigestBuffer,
+    props: Union[Properties, SharedCursors],
+    sent: Union[SentTweets, SharedSentTweets],
+    backfills: Backfills,
+    handles: List[Handle],
+    results: Optional[Iterable[Tuple[Handle, List[Tweet], Optional[int]]]] = None,
+) -> Dict[str, int]:
     """
-    Dispatches given tweet_url messages to the appropriate chat_id.
+    Determines if the given handles have any new tweets and dispatches the Telegram messages
+
+    Timelines are fetched concurrently and queued for dispatch as each fetch completes, unless
+    the tweets have already been received from the stream. Tweets older than a handle's
+    cursor are ignored. The cursors are only advanced once the dispatcher has sent every
+    queued message, and are held before the oldest tweet whose message failed, or that is
+    held for a digest, so it's fetched again if it isn't sent. A handle whose new tweets
+    couldn't all be fetched keeps its cursor until the rest have been, see Backfills. A handle
+    without a cursor has it set to the newest tweet, without anything being dispatched. A
+    handle whose tweets couldn't be claimed is treated as failed and keeps its cursor. The
+    digests whose window has closed are queued once every handle has been fetched.
 
     Parameters:
-        updater (telegram.ext.Updater): updater for sending messages using the Telegram API
-        handle (Handle): a dict representing the handle
+        dispatcher (MessageDispatcher | OutboxWriter): sends the messages or adds them to the outbox
+        digests (DigestBuffer): the buffer grouping tweets for chats in digest mode
+        props (Properties | SharedCursors): holds the newest tweet ID seen for each handle
+        sent (SentTweets | SharedSentTweets): the tweets already sent to each chat
+        backfills (Backfills): the handles whose new tweets haven't all been fetched yet
+        handles (List[Handle]): the handles to be checked for new tweets
+        results (Iterable | None): (handle, tweets, max_id) tuples to use instead of fetching
+            the tweets, see fetch_recent_tweets
+
+    Returns:
+        the number of new tweets dispatched for each handle that was fetched successfully
     """
-    for url in tweet_urls:
-        for watcher in handle.watchers:
-            send_telegram_message(updater, watcher.chat_id, f"@{handle.name} has tweeted:\n\n{url}")
+    since_ids = {handle.name: props.since_id(handle.name) for handle in handles}
+    # Handles resuming a backfill are fetched from below their newest tweets
+    behind = {handle.name for handle in handles if backfills.max_id(handle.name) is not None}
+    newest: Dict[str, Tweet] = {}
+    tweet_ids: Dict[str, List[int]] = {}
+    new_tweet_counts: Dict[str, int] = {}
+    resume: Dict[str, int] = {}
+    failed: Set[int] = set()
 
+    if results is None:
+        results = fetch_recent_tweets(handles, since_ids, backfills=backfills)
 
-def process_tweets(updater: Updater, since: datetime) -> None:
+    for handle, tweets, max_id in results:
+        since_id = since_ids[handle.name]
+        tweets = [tweet for tweet in tweets if since_id is None or tweet.id > since_id]
+
+        new_tweet_counts[handle.name] = 0
+        if max_id is not None:
+            resume[handle.name] = max_id
+        if not tweets:
+            continue
+
+        if since_id is not None:
+            try:
+                new_tweet_counts[handle.name] = dispatch_telegram_messages(
+                    dispatcher,
+                    digests,
+                    sent,
+                    handle,
+                    sorted(tweets, key=lambda tweet: tweet.id),
+                    failed,
+                )
+            except Exception:
+                # Whatever was claimed has been queued, the rest is claimed on the next poll
+                ERRORS.inc(operation="claim_sent")
+                logger.exception("Unable to claim the tweets of %s", handle.name)
+                del new_tweet_counts[handle.name]
+                continue
+
+        newest[handle.name] = max(tweets, key=lambda tweet: tweet.id)
+        tweet_ids[handle.name] = [tweet.id for tweet in tweets]
+
+    digests.flush()
+    try:
+        dispatcher.join()
+    except Exception:
+        # The messages' claims have been released and the cursors stay put, so the tweets are
+        # fetched and queued again next cycle
+        ERRORS.inc(operation="outbox_write")
+        logger.exception("Unable to write the messages to the outbox")
+        return {}
+
+    TWEETS.inc(sum(new_tweet_counts.values()))
+
+    held = digests.oldest_held()
+    for handle_name in new_tweet_counts:
+        # A handle that is catching up moves to where its newest tweets left it
+        since_id = backfills.since_id(handle_name)
+        if since_id is None and handle_name in newest:
+            since_id = newest[handle_name].id
+        if since_id is None:
+            continue
+
+        retry = [tweet_id for tweet_id in tweet_ids.get(handle_name, []) if tweet_id in failed]
+        if retry:
+            since_id = min(since_id, min(retry) - 1)
+        if handle_name.lower() in held:
+            since_id = min(since_id, held[handle_name.lower()] - 1)
+
+        if handle_name in resume:
+            backfills.resume(handle_name, resume[handle_name], since_id)
+        else:
+            backfills.finish(handle_name)
+            props.update_since_id(handle_name, since_id)
+
+    # The newest tweets are shared with the Telegram bot so /latest doesn't need the Twitter API.
+    # The tweets of a handle catching up are older than its newest, so they aren't recorded
+    latest = [tweet for name, tweet in newest.items() if name not in behind]
+    if latest:
+        try:
+            dbapi.update_latest_tweets(latest)
+        except Exception:
+            ERRORS.inc(operation="record_latest")
+            logger.exception("Unable to record the latest tweets")
+
+    return new_tweet_counts
+
+
+def process_stream(
+    dispatcher: Union[MessageDispatcher, OutboxWriter],
+    digests: DigestBuffer,
+    props: Properties,
+    sent: SentTweets,
+    backfills: Backfills,
+    stream: TweetStream,
+    subscriptions: List[Handle],
+    resync: bool,
+) -> None:
     """
-    Determines if there are any new tweets and dispatches the Telegram messages
+    Dispatches the tweets received from the stream, keeping the stream's rules in sync. A
+    failed sync of the rules is retried every cycle until it succeeds.
+
+    Handles without a cursor are seeded from their timelines when they are first watched, so
+    their streamed tweets can be sent. Every handle is backfilled from its timeline after the
+    stream (re)connects, so tweets posted while disconnected aren't missed, and a handle whose
+    backfill couldn't be fetched at once carries on fetching it every cycle.
 
     Parameters:
-        updater (telegram.ext.Updater): updater for sending messages using the Telegram API
-        since (datetime.datetime): tweets cannot be older than this
+        dispatcher (MessageDispatcher | OutboxWriter): sends the messages or adds them to the outbox
+        digests (DigestBuffer): the buffer grouping tweets for chats in digest mode
+        props (Properties): the properties holding the newest tweet ID seen for each handle
+        sent (SentTweets): the tweets already sent to each chat
+        backfills (Backfills): the handles whose new tweets haven't all been fetched yet
+        stream (TweetStream): the stream receiving the tweets
+        subscriptions (List[Handle]): the watched handles
+        resync (bool): True if the watched handles may have changed
     """
-    stored_handles: List[str] = dbapi.get_all_handle_names()
-    for handle_name in stored_handles:
+    by_name = {handle.name.lower(): handle for handle in subscriptions}
+
+    if resync or stream.rules_dirty:
         try:
-            handle: Handle = dbapi.get_handle(handle_name)
+            stream.sync_rules(list(by_name))
         except Exception:
-            continue
+            ERRORS.inc(operation="sync_rules")
+            logger.exception("Unable to sync the stream rules")
+
+    if resync:
+        unseeded = [handle for handle in subscriptions if props.since_id(handle.name) is None]
+        if unseeded:
+            process_tweets(dispatcher, digests, props, sent, backfills, unseeded)
 
-        if handle.has_watchers:
-            tweet_urls = handle.recent_tweets(since)
-            dispatch_telegram_messages(updater, handle, tweet_urls)
+    if stream.take_connected():
+        process_tweets(dispatcher, digests, props, sent, backfills, subscriptions)
+    else:
+        behind = [handle for handle in subscriptions if backfills.max_id(handle.name) is not None]
+        if behind:
+            process_tweets(dispatcher, digests, props, sent, backfills, behind)
+
+    received: Dict[str, List[Tweet]] = {}
+    for tweet in stream.drain():
+        handle = by_name.get(tweet.handle.lower())
+        if handle is not None:
+            received.setdefault(handle.name, []).append(Tweet(tweet.id, handle.name))
+
+    if received:
+        handles = [by_name[name.lower()] for name in received]
+        # A handle catching up keeps its backfill, its streamed tweets are newer than the gap
+        results = [
+            (handle, received[handle.name], backfills.max_id(handle.name)) for handle in handles
+        ]
+        process_tweets(dispatcher, digests, props, sent, backfills, handles, results)
 
 
 def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    start_metrics_server(TW_METRICS_HOST, TW_METRICS_PORT)
+
     props = Properties()
-    updater = Updater(TELEGRAM_TOKEN)
+    # In outbox mode the messages are sent by the delivery workers, see delivery.py
+    if TW_DELIVERY_MODE == "inline":
+        dispatcher = MessageDispatcher(Updater(TELEGRAM_TOKEN).bot)
+    elif TW_DELIVERY_MODE == "outbox":
+        dispatcher = OutboxWriter()
+    else:
+        raise ValueError(f"Unknown delivery mode {TW_DELIVERY_MODE}.")
+    scheduler = PollScheduler(props=props)
 
-    while True:
-        props.update_last_request(datetime.utcnow())
-        process_tweets(updater, since=props.last_request)
-        time.sleep(TW_SLEEP_TIMEOUT_SECONDS)
+    # Sharded workers keep the cursors and sent tweets in Postgres, so they move with the handles
+    shard = None
+    if TW_SHARDING_ENABLED:
+        shard = Shard(TW_WORKER_ID)
+        cursors = SharedCursors(TW_WORKER_ID)
+        sent = SharedSentTweets()
+    else:
+        cursors = props
+        sent = SentTweets()
+    digests = DigestBuffer(dispatcher, sent)
+    backfills = Backfills()
+
+    # Set to wake the loop early, when the subscriptions change
+    wake = threading.Event()
+    listener = None
+    if TW_SUBSCRIPTION_SOURCE == "listen":
+        listener = SubscriptionMap(on_change=wake.set)
+        listener.start()
+    elif TW_SUBSCRIPTION_SOURCE != "poll":
+        raise ValueError(f"Unknown subscription source {TW_SUBSCRIPTION_SOURCE}.")
+
+    # In stream mode tweets arrive over a single connection, which can't be shared by shards
+    stream = None
+    if TW_INGESTION_MODE == "stream":
+        if shard is not None:
+            raise ValueError("Sharding isn't supported in stream mode.")
+        stream = TweetStream(on_change=wake.set)
+        stream.start()
+    elif TW_INGESTION_MODE != "poll":
+        raise ValueError(f"Unknown ingestion mode {TW_INGESTION_MODE}.")
+
+    subscriptions: Optional[List[Handle]] = None
+    synced_version = None
+    last_synced_at = None
+
+    try:
+        while True:
+            wake.clear()
+            resync = False
+
+            # In sharded mode a change in the live workers rebalances the handles straight away
+            if shard is not None and shard.heartbeat_due:
+                resync = shard.heartbeat()
+
+            if listener is not None:
+                # The map is kept up to date by notifications, so it's only copied when it changes
+                if listener.ready and listener.version != synced_version:
+                    synced_version = listener.version
+                    subscriptions = listener.handles()
+                    resync = True
+
+            # Otherwise the subscriptions are refreshed at most once every TW_SLEEP_TIMEOUT_SECONDS
+            elif last_synced_at is None or time.monotonic() - last_synced_at >= TW_SLEEP_TIMEOUT_SECONDS:
+                try:
+                    subscriptions = dbapi.get_subscriptions()
+                    last_synced_at = time.monotonic()
+                    resync = True
+                except Exception:
+                    ERRORS.inc(operation="refresh_subscriptions")
+                    logger.exception("Unable to refresh the subscriptions")
+
+            if stream is not None:
+                if subscriptions is not None:
+                    process_stream(
+                        dispatcher, digests, props, sent, backfills, stream, subscriptions, resync
+                    )
+            else:
+                if resync and subscriptions is not None:
+                    scheduler.sync(shard.filter(subscriptions) if shard else subscriptions)
+
+                due = scheduler.pop_due()
+                polled = due
+                if shard is not None:
+                    # A worker without a live heartbeat may have had its handles taken over
+                    cursors.release_unowned(shard.owns)
+                    polled = cursors.claim(due) if shard.is_live else []
+
+                results = process_tweets(dispatcher, digests, cursors, sent, backfills, polled)
+                for handle in due:
+                    scheduler.record(handle.name, results.get(handle.name))
+
+            # Everything learnt during the cycle is written in a single transaction
+            props.commit()
+            cursors.commit()
+            sent.commit()
+
+            wait = scheduler.seconds_until_next_due()
+            wait = TW_SLEEP_TIMEOUT_SECONDS if wait is None else min(wait, TW_SLEEP_TIMEOUT_SECONDS)
+            if shard is not None:
+                wait = min(wait, shard.heartbeat_seconds)
+            next_flush = digests.seconds_until_next_flush()
+            if next_flush is not None:
+                wait = min(wait, next_flush)
+            wake.wait(max(1.0, wait))
+    finally:
+        # Held digests are sent rather than lost, the claims of any that aren't are released
+        digests.flush(force=True)
+        try:
+            dispatcher.join(timeout=TW_SLEEP_TIMEOUT_SECONDS)
+        except Exception:
+            ERRORS.inc(operation="outbox_write")
+            logger.exception("Unable to write the messages to the outbox")
+        if cursors is not props:
+            cursors.close()
+        props.close()
+        sent.close()
+        if listener is not None:
+            listener.stop()
+        if stream is not None:
+            stream.stop()
+        if shard is not None:
+            shard.leave()
 
 
 if __name__ == "__main__":
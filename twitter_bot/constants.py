@@ -1,10 +1,27 @@
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
 
 TELEGRAM_TOKEN: str = os.getenv("TELEGRAM_TOKEN")
 
+TG_DISPATCH_WORKERS: int = int(os.getenv("TG_DISPATCH_WORKERS") or 8)
+TG_GLOBAL_RATE: float = float(os.getenv("TG_GLOBAL_RATE") or 30)
+TG_CHAT_RATE: float = float(os.getenv("TG_CHAT_RATE") or 1)
+TG_GROUP_RATE_PER_MINUTE: float = float(os.getenv("TG_GROUP_RATE_PER_MINUTE") or 20)
+TG_MAX_RETRIES: int = int(os.getenv("TG_MAX_RETRIES") or 3)
+TG_DIGEST_WINDOW_SECONDS: float = float(os.getenv("TG_DIGEST_WINDOW_SECONDS") or 0)
+
+TW_DELIVERY_MODE: str = os.getenv("TW_DELIVERY_MODE") or "inline"
+TW_OUTBOX_BATCH_SIZE: int = int(os.getenv("TW_OUTBOX_BATCH_SIZE") or 100)
+TW_OUTBOX_LEASE_SECONDS: float = float(os.getenv("TW_OUTBOX_LEASE_SECONDS") or 120)
+TW_OUTBOX_MAX_ATTEMPTS: int = int(os.getenv("TW_OUTBOX_MAX_ATTEMPTS") or 8)
+TW_OUTBOX_BACKOFF_SECONDS: float = float(os.getenv("TW_OUTBOX_BACKOFF_SECONDS") or 5)
+TW_OUTBOX_POLL_SECONDS: float = float(os.getenv("TW_OUTBOX_POLL_SECONDS") or 1)
+TW_DEDUP_CACHE_SIZE: int = int(os.getenv("TW_DEDUP_CACHE_SIZE") or 100000)
+TW_DEDUP_RETENTION_HOURS: float = float(os.getenv("TW_DEDUP_RETENTION_HOURS") or 72)
+
 TW_API_KEY: str = os.getenv("TW_API_KEY")
 TW_API_KEY_SECRET: str = os.getenv("TW_API_KEY_SECRET")
 TW_BEARER_TOKEN: str = os.getenv("TW_BEARER_TOKEN")
@@ -12,7 +29,47 @@ TW_ACCESS_TOKEN: str = os.getenv("TW_ACCESS_TOKEN")
 TW_ACCESS_TOKEN_SECRET: str = os.getenv("TW_ACCESS_TOKEN_SECRET")
 
 TW_SLEEP_TIMEOUT_SECONDS: int = int(os.getenv("TW_SLEEP_TIMEOUT_SECONDS") or 60)
-TW_MAX_FETCH_COUNT: int = int(os.getenv("TW_MAX_FETCH_COUNT") or 10)
+TW_MIN_POLL_SECONDS: float = float(os.getenv("TW_MIN_POLL_SECONDS") or 30)
+TW_MAX_POLL_SECONDS: float = float(os.getenv("TW_MAX_POLL_SECONDS") or 900)
+TW_POLL_JITTER: float = float(os.getenv("TW_POLL_JITTER") or 0.1)
+TW_POLL_RATE_SMOOTHING: float = float(os.getenv("TW_POLL_RATE_SMOOTHING") or 0.3)
+
+TW_SHARDING_ENABLED: bool = (os.getenv("TW_SHARDING_ENABLED") or "false").lower() == "true"
+TW_WORKER_ID: str = os.getenv("TW_WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+TW_WORKER_HEARTBEAT_SECONDS: float = float(os.getenv("TW_WORKER_HEARTBEAT_SECONDS") or 15)
+TW_WORKER_HEARTBEAT_TTL_SECONDS: float = float(os.getenv("TW_WORKER_HEARTBEAT_TTL_SECONDS") or 45)
+TW_SHARD_VIRTUAL_NODES: int = int(os.getenv("TW_SHARD_VIRTUAL_NODES") or 64)
+TW_MAX_FETCH_COUNT: int = int(os.getenv("TW_MAX_FETCH_COUNT") or 200)
+TW_MAX_FETCH_PAGES: int = int(os.getenv("TW_MAX_FETCH_PAGES") or 16)
+TW_FETCH_WORKERS: int = int(os.getenv("TW_FETCH_WORKERS") or 8)
+TW_FETCH_BACKEND: str = os.getenv("TW_FETCH_BACKEND") or "timeline"
+TW_SEARCH_PAGE_SIZE: int = int(os.getenv("TW_SEARCH_PAGE_SIZE") or 100)
+TW_SEARCH_QUERY_MAX_LENGTH: int = int(os.getenv("TW_SEARCH_QUERY_MAX_LENGTH") or 500)
+TW_SEARCH_MAX_CURSOR_AGE_HOURS: float = float(os.getenv("TW_SEARCH_MAX_CURSOR_AGE_HOURS") or 144)
+TW_RATE_LIMIT_RESERVE: float = float(os.getenv("TW_RATE_LIMIT_RESERVE") or 0.1)
+
+TW_INGESTION_MODE: str = os.getenv("TW_INGESTION_MODE") or "poll"
+TW_STREAM_BASE_URL: str = os.getenv("TW_STREAM_BASE_URL") or "https://api.twitter.com"
+TW_STREAM_RULE_MAX_LENGTH: int = int(os.getenv("TW_STREAM_RULE_MAX_LENGTH") or 512)
+TW_STREAM_READ_TIMEOUT_SECONDS: float = float(os.getenv("TW_STREAM_READ_TIMEOUT_SECONDS") or 30)
+
+TW_METRICS_HOST: str = os.getenv("TW_METRICS_HOST") or "0.0.0.0"
+TW_METRICS_PORT: int = int(os.getenv("TW_METRICS_PORT") or 9101)
 
 DB_API_HOST: str = os.getenv("DB_API_HOST") or "127.0.0.1"
-DB_API_PORT: int = int(os.getenv("DB_API_PORT") or 5000)
\ No newline at end of file
+DB_API_PORT: int = int(os.getenv("DB_API_PORT") or 5000)
+TW_STORAGE_BACKEND: str = os.getenv("TW_STORAGE_BACKEND") or "http"
+TW_DB_API_PATH: str = os.getenv("TW_DB_API_PATH")
+DB_API_POOL_SIZE: int = int(os.getenv("DB_API_POOL_SIZE") or 10)
+DB_API_TIMEOUT_SECONDS: float = float(os.getenv("DB_API_TIMEOUT_SECONDS") or 10)
+DB_API_MAX_RETRIES: int = int(os.getenv("DB_API_MAX_RETRIES") or 3)
+DB_API_BACKOFF_SECONDS: float = float(os.getenv("DB_API_BACKOFF_SECONDS") or 0.25)
+
+DB_HOST: str = os.getenv("DB_HOST")
+DB_NAME: str = os.getenv("DB_NAME")
+DB_USER: str = os.getenv("DB_USER")
+DB_PASSWORD: str = os.getenv("DB_PASSWORD")
+
+TW_SUBSCRIPTION_SOURCE: str = os.getenv("TW_SUBSCRIPTION_SOURCE") or "poll"
+SUBSCRIPTION_CHANNEL: str = os.getenv("SUBSCRIPTION_CHANNEL") or "subscription_changes"
+TW_LISTEN_KEEPALIVE_SECONDS: float = float(os.getenv("TW_LISTEN_KEEPALIVE_SECONDS") or 30)
@@ -0,0 +1,246 @@
+import time
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Tuple, Union
+
+from api import db as dbapi
+from constants import TW_DEDUP_CACHE_SIZE, TW_DEDUP_RETENTION_HOURS
+
+
+logger = logging.getLogger(__name__)
+
+
+class SentTweets:
+    """
+    Remembers which tweets have been sent to which chats, so a tweet is never sent twice.
+
+    The most recently sent (tweet_id, chat_id) pairs are kept in a bounded in-memory LRU and
+    every pair is kept in an SQLite table, which is only read when the LRU misses. Pairs are
+    written as soon as they are claimed, before their messages are queued, so a crash never
+    forgets a queued message. Pairs whose messages weren't sent are released again. Pairs
+    older than the retention period are pruned, by which time the cursors will have long
+    moved past their tweets.
+    """
+
+    def __init__(
+        self,
+        file_path: Union[Path, str] = "./sent_tweets.db",
+        cache_size: int = TW_DEDUP_CACHE_SIZE,
+        retention_hours: float = TW_DEDUP_RETENTION_HOURS,
+    ):
+        """
+        Parameters:
+            file_path (pathlib.Path | str): the path to the database - default = './sent_tweets.db'
+            cache_size (int): the maximum number of pairs kept in memory
+            retention_hours (float): how long a pair is remembered for
+        """
+        self.cache_size = cache_size
+        self.retention_seconds = retention_hours * 3600
+
+        self._cache: "OrderedDict[Tuple[int, str], None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_pruned_at = 0.0
+
+        self._conn = sqlite3.connect(str(file_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("PRAGMA synchronous=NORMAL;")
+        with self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS sent_tweets (
+                       tweet_id INTEGER NOT NULL,
+                       chat_id TEXT NOT NULL,
+                       sent_at REAL NOT NULL,
+                       PRIMARY KEY (tweet_id, chat_id)
+                   ) WITHOUT ROWID;"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS sent_tweets_sent_at ON sent_tweets (sent_at);"
+            )
+
+    def _remember(self, key: Tuple[int, str]) -> None:
+        self._cache[key] = None
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _find_unsent(
+        self, pairs: List[Tuple[int, str]]
+    ) -> Tuple[List[Tuple[int, str]], List[Tuple[int, str]]]:
+        """
+        Looks the pairs up in the LRU and then the database, the lock must be held.
+
+        Returns:
+            the distinct pairs that haven't been sent and those that missed the LRU
+        """
+        misses = []
+        for tweet_id, chat_id in pairs:
+            key = (tweet_id, str(chat_id))
+            if key in self._cache:
+                self._cache.move_to_end(key)
+            else:
+                misses.append(key)
+        misses = list(dict.fromkeys(misses))
+
+        # Looked up in chunks, to stay within SQLite's limit on bound parameters
+        stored = set()
+        for start in range(0, len(misses), 450):
+            chunk = misses[start : start + 450]
+            placeholders = ", ".join("(?, ?)" for _ in chunk)
+            stored.update(
+                self._conn.execute(
+                    f"""SELECT tweet_id, chat_id FROM sent_tweets
+                        WHERE (tweet_id, chat_id) IN (VALUES {placeholders});""",
+                    [value for key in chunk for value in key],
+                )
+            )
+
+        return [key for key in misses if key not in stored], misses
+
+    def unsent(self, pairs: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+        """
+        Returns the (tweet_id, chat_id) pairs that haven't been sent, without claiming them.
+
+        Parameters:
+            pairs (List[Tuple[int, str]]): the tweets and the chats they may be sent to
+        """
+        with self._lock:
+            return self._find_unsent(pairs)[0]
+
+    def claim(self, pairs: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+        """
+        Returns the (tweet_id, chat_id) pairs that haven't been sent and records them as sent,
+        in a single transaction.
+
+        Parameters:
+            pairs (List[Tuple[int, str]]): the tweets about to be sent and the chats they are for
+        """
+        with self._lock:
+            unsent, misses = self._find_unsent(pairs)
+            if unsent:
+                now = time.time()
+                with self._conn:
+                    self._conn.executemany(
+                        """INSERT OR IGNORE INTO sent_tweets (tweet_id, chat_id, sent_at)
+                           VALUES (?, ?, ?);""",
+                        [(tweet_id, chat_id, now) for tweet_id, chat_id in unsent],
+                    )
+
+            for key in misses:
+                self._remember(key)
+
+        return unsent
+
+    def release(self, pairs: List[Tuple[int, str]]) -> None:
+        """
+        Forgets that the (tweet_id, chat_id) pairs were sent, for messages that weren't.
+
+        Parameters:
+            pairs (List[Tuple[int, str]]): the tweets and the chats they weren't sent to
+        """
+        keys = [(tweet_id, str(chat_id)) for tweet_id, chat_id in pairs]
+
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "DELETE FROM sent_tweets WHERE tweet_id = ? AND chat_id = ?;", keys
+                )
+            for key in keys:
+                self._cache.pop(key, None)
+
+    def commit(self) -> None:
+        """Prunes expired pairs, at most hourly, the sent_at index keeps it cheap."""
+        with self._lock:
+            now = time.time()
+            if now - self._last_pruned_at < 3600:
+                return
+
+            with self._conn:
+                cutoff = now - self.retention_seconds
+                self._conn.execute("DELETE FROM sent_tweets WHERE sent_at < ?;", (cutoff,))
+            self._last_pruned_at = now
+
+    def close(self) -> None:
+        """Prunes expired pairs if due and closes the database."""
+        self.commit()
+        self._conn.close()
+
+
+class SharedSentTweets:
+    """
+    Remembers which tweets have been sent to which chats in Postgres, through the db_api, so
+    poller workers sharing the handles never send a tweet twice, even when a handle moves
+    between them. Pairs are claimed before their messages are queued, in a single request per
+    batch, and released again if their messages aren't sent. Pairs older than the retention
+    period are pruned.
+    """
+
+    def __init__(self, retention_hours: float = TW_DEDUP_RETENTION_HOURS):
+        """
+        Parameters:
+            retention_hours (float): how long a pair is remembered for
+        """
+        self.retention_hours = retention_hours
+
+        self._last_pruned_at = 0.0
+
+    def claim(self, pairs: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+        """
+        Returns the (tweet_id, chat_id) pairs that haven't been sent and records them as sent.
+
+        Parameters:
+            pairs (List[Tuple[int, str]]): the tweets about to be sent and the chats they are for
+        """
+        if not pairs:
+            return []
+
+        return [
+            (tweet_id, str(chat_id))
+            for tweet_id, chat_id in dbapi.claim_sent_tweets(
+                [(tweet_id, str(chat_id)) for tweet_id, chat_id in pairs]
+            )
+        ]
+
+    def unsent(self, pairs: List[Tuple[int, str]]) -> List[Tuple[int, str]]:
+        """
+        Returns the (tweet_id, chat_id) pairs that haven't been sent, without claiming them.
+
+        Parameters:
+            pairs (List[Tuple[int, str]]): the tweets and the chats they may be sent to
+        """
+        if not pairs:
+            return []
+
+        return [
+            (tweet_id, str(chat_id))
+            for tweet_id, chat_id in dbapi.find_unsent_tweets(
+                [(tweet_id, str(chat_id)) for tweet_id, chat_id in pairs]
+            )
+        ]
+
+    def release(self, pairs: List[Tuple[int, str]]) -> None:
+        """
+        Forgets that the (tweet_id, chat_id) pairs were sent, for messages that weren't.
+
+        Parameters:
+            pairs (List[Tuple[int, str]]): the tweets and the chats they weren't sent to
+        """
+        dbapi.release_sent_tweets([(tweet_id, str(chat_id)) for tweet_id, chat_id in pairs])
+
+    def commit(self) -> None:
+        """Prunes expired pairs, at most hourly."""
+        now = time.time()
+        if now - self._last_pruned_at < 3600:
+            return
+
+        try:
+            dbapi.prune_sent_tweets(self.retention_hours)
+            self._last_pruned_at = now
+        except Exception:
+            logger.exception("Unable to prune the sent tweets")
+
+    def close(self) -> None:
+        """Prunes expired pairs if due, the pairs themselves are already written."""
+        self.commit()
@@ -0,0 +1,24 @@
+import logging
+from telegram.ext import Updater
+
+from dispatcher import MessageDispatcher
+from metrics import start_metrics_server
+from outbox import DeliveryWorker
+from constants import TELEGRAM_TOKEN, TW_METRICS_HOST, TW_METRICS_PORT, TW_WORKER_ID
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    start_metrics_server(TW_METRICS_HOST, TW_METRICS_PORT)
+
+    dispatcher = MessageDispatcher(Updater(TELEGRAM_TOKEN).bot)
+    worker = DeliveryWorker(dispatcher, TW_WORKER_ID)
+
+    try:
+        worker.run()
+    finally:
+        dispatcher.stop()
+
+
+if __name__ == "__main__":
+    main()
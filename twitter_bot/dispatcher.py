@@ -0,0 +1,554 @@
+import time
+import heapq
+import logging
+import itertools
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple, Union
+from telegram import Bot
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut, Unauthorized
+
+from dedup import SentTweets, SharedSentTweets
+from metrics import registry
+from constants import (
+    TG_CHAT_RATE,
+    TG_DIGEST_WINDOW_SECONDS,
+    TG_DISPATCH_WORKERS,
+    TG_GLOBAL_RATE,
+    TG_GROUP_RATE_PER_MINUTE,
+    TG_MAX_RETRIES,
+)
+
+# Telegram rejects messages longer than this many characters
+MAX_MESSAGE_LENGTH = 4096
+
+# The outcomes of sending a message, passed to its on_result callback
+SENT = "sent"
+REJECTED = "rejected"
+FAILED = "failed"
+EXPIRED = "expired"
+
+logger = logging.getLogger(__name__)
+
+SEND_SECONDS = registry.histogram(
+    "telegram_send_seconds", "Time taken by each call to Telegram's sendMessage."
+)
+DISPATCH_SECONDS = registry.histogram(
+    "telegram_dispatch_seconds",
+    "Time from a message being queued to it being sent or dropped, including rate limiting.",
+)
+MESSAGES = registry.counter(
+    "telegram_messages_total", "Messages handled by the dispatcher, by result.", ["result"]
+)
+SEND_ERRORS = registry.counter(
+    "telegram_send_errors_total", "Calls to sendMessage that raised an error, by error.", ["error"]
+)
+DROPPED = registry.counter(
+    "telegram_messages_dropped_total",
+    "Messages that will never be delivered, by reason.",
+    ["reason"],
+)
+
+
+class TokenBucket:
+    """A thread-safe token bucket allowing rate tokens per second, with bursts of up to capacity."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def try_acquire(self) -> float:
+        """
+        Takes a token if one is available.
+
+        Returns:
+            0 if a token was taken, otherwise the number of seconds until one will be available
+        """
+        with self._lock:
+            self._refill()
+
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self) -> None:
+        """Blocks until a token has been taken."""
+        wait = self.try_acquire()
+        while wait > 0:
+            time.sleep(wait)
+            wait = self.try_acquire()
+
+    @property
+    def is_full(self) -> bool:
+        """Returns True if the bucket has refilled to capacity."""
+        with self._lock:
+            self._refill()
+            return self._tokens >= self.capacity
+
+
+class _Message:
+    def __init__(
+        self,
+        chat_id: str,
+        text: str,
+        on_result: Optional[Callable[[str], None]] = None,
+        is_expired: Optional[Callable[[], bool]] = None,
+    ):
+        self.chat_id: str = chat_id
+        self.text: str = text
+        self.on_result: Optional[Callable[[str], None]] = on_result
+        self.is_expired: Optional[Callable[[], bool]] = is_expired
+        self.result: Optional[str] = None
+        self.attempts: int = 0
+        self.enqueued_at: float = time.monotonic()
+
+
+def is_group_chat(chat_id: str) -> bool:
+    """Group, supergroup and channel chat IDs are negative, or a @username for public channels."""
+    try:
+        return int(chat_id) < 0
+    except ValueError:
+        return True
+
+
+class MessageDispatcher:
+    """
+    Sends Telegram messages from a pool of worker threads within Telegram's rate limits.
+
+    Every send takes a token from a global bucket and from a bucket for the chat. Messages to
+    the same chat are sent one at a time in the order they were enqueued. A chat that isn't
+    allowed to send yet, or that was told to RetryAfter, is rescheduled rather than blocking
+    a worker.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        workers: int = TG_DISPATCH_WORKERS,
+        global_rate: float = TG_GLOBAL_RATE,
+        chat_rate: float = TG_CHAT_RATE,
+        group_rate_per_minute: float = TG_GROUP_RATE_PER_MINUTE,
+        max_retries: int = TG_MAX_RETRIES,
+    ):
+        """
+        Parameters:
+            bot (telegram.Bot): the bot used to send the messages
+            workers (int): the number of messages that can be in flight at once
+            global_rate (float): the maximum messages per second across all chats
+            chat_rate (float): the maximum messages per second to a private chat
+            group_rate_per_minute (float): the maximum messages per minute to a group chat
+            max_retries (int): how many times a message is retried after a network error
+        """
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.group_rate_per_minute = group_rate_per_minute
+        self.max_retries = max_retries
+
+        self._global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self._chat_buckets: Dict[str, TokenBucket] = {}
+
+        # Pending messages per chat and a heap of (ready_at, seq, chat_id) for the chats
+        # waiting to send; a chat is in the heap at most once and never while it's in flight
+        self._chats: Dict[str, Deque[_Message]] = {}
+        self._ready: List[Tuple[float, int, str]] = []
+        self._seq = itertools.count()
+        self._pending = 0
+        self._stopping = False
+        self._cond = threading.Condition()
+
+        self._workers = [
+            threading.Thread(target=self._work, name=f"dispatcher-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def enqueue(
+        self,
+        chat_id: str,
+        text: str,
+        on_result: Optional[Callable[[str], None]] = None,
+        is_expired: Optional[Callable[[], bool]] = None,
+    ) -> None:
+        """
+        Queues a message to be sent to the chat.
+
+        Parameters:
+            chat_id (str): the chat identifier
+            text (str): the text body of the message
+            on_result (Callable | None): called from a worker with SENT, REJECTED, FAILED or
+                EXPIRED once the message has been sent or dropped
+            is_expired (Callable | None): checked before each attempt, a message for which it
+                returns True is dropped as EXPIRED instead of being sent
+        """
+        chat_id = str(chat_id)
+
+        with self._cond:
+            if chat_id not in self._chats:
+                self._chats[chat_id] = deque()
+                self._schedule(chat_id, time.monotonic())
+
+            self._chats[chat_id].append(_Message(chat_id, text, on_result, is_expired))
+            self._pending += 1
+            self._cond.notify()
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until every queued message has been sent or dropped.
+
+        Returns:
+            True if the queue drained, False if the timeout expired first
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self._cond:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+
+            self._prune_buckets()
+
+        return True
+
+    def stop(self) -> None:
+        """Stops the workers once they finish their current message; queued messages are dropped."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            queued = sum(len(messages) for messages in self._chats.values())
+
+        if queued:
+            DROPPED.inc(queued, reason="stopped")
+
+        for worker in self._workers:
+            worker.join()
+
+    def _schedule(self, chat_id: str, ready_at: float) -> None:
+        """Adds the chat to the ready heap; the lock must be held."""
+        heapq.heappush(self._ready, (ready_at, next(self._seq), chat_id))
+        self._cond.notify()
+
+    def _chat_bucket(self, chat_id: str) -> TokenBucket:
+        """Returns the bucket for the chat, the lock must be held."""
+        bucket = self._chat_buckets.get(chat_id)
+
+        if bucket is None:
+            if is_group_chat(chat_id):
+                bucket = TokenBucket(self.group_rate_per_minute / 60, capacity=1)
+            else:
+                bucket = TokenBucket(self.chat_rate, capacity=1)
+            self._chat_buckets[chat_id] = bucket
+
+        return bucket
+
+    def _prune_buckets(self) -> None:
+        """Forgets full buckets for idle chats, a new bucket would behave identically."""
+        for chat_id in [c for c in self._chat_buckets if c not in self._chats]:
+            if self._chat_buckets[chat_id].is_full:
+                del self._chat_buckets[chat_id]
+
+    def _next_message(self) -> Optional[_Message]:
+        """Waits for a chat that is allowed to send and takes its next message."""
+        with self._cond:
+            while not self._stopping:
+                now = time.monotonic()
+
+                if not self._ready:
+                    self._cond.wait()
+                    continue
+
+                ready_at, _, chat_id = self._ready[0]
+                if ready_at > now:
+                    self._cond.wait(ready_at - now)
+                    continue
+
+                heapq.heappop(self._ready)
+
+                wait = self._chat_bucket(chat_id).try_acquire()
+                if wait > 0:
+                    self._schedule(chat_id, now + wait)
+                    continue
+
+                return self._chats[chat_id].popleft()
+
+        return None
+
+    def _finish(self, message: _Message, retry_in: Optional[float]) -> None:
+        """Reschedules the message's chat, or requeues the message if it is to be retried."""
+        # The result is reported before the message stops counting as pending, so it has
+        # been reported by the time join returns
+        if retry_in is None:
+            MESSAGES.inc(result=message.result)
+            DISPATCH_SECONDS.observe(time.monotonic() - message.enqueued_at)
+
+            # A message with a callback may still be retried by its sender, see outbox.py and
+            # bot.py, so its sender counts it as dropped
+            if message.on_result is None and message.result != SENT:
+                DROPPED.inc(reason=message.result)
+
+        if retry_in is None and message.on_result is not None:
+            try:
+                message.on_result(message.result)
+            except Exception:
+                logger.exception("Error reporting the result of a message to %s", message.chat_id)
+
+        with self._cond:
+            messages = self._chats[message.chat_id]
+
+            if retry_in is not None:
+                messages.appendleft(message)
+                self._schedule(message.chat_id, time.monotonic() + retry_in)
+                return
+
+            self._pending -= 1
+            if messages:
+                self._schedule(message.chat_id, time.monotonic())
+            else:
+                del self._chats[message.chat_id]
+
+            self._cond.notify_all()
+
+    def _send(self, message: _Message) -> Optional[float]:
+        """
+        Sends the message.
+
+        Returns:
+            None if the message was sent or dropped, otherwise the seconds to wait before a retry
+        """
+        message.attempts += 1
+
+        try:
+            with SEND_SECONDS.time():
+                self.bot.send_message(chat_id=message.chat_id, text=message.text)
+            message.result = SENT
+        except RetryAfter as e:
+            # Flood control doesn't count towards the retries, the message has to be delivered
+            SEND_ERRORS.inc(error="retry_after")
+            message.attempts -= 1
+            return float(e.retry_after)
+        except (BadRequest, Unauthorized):
+            # The chat_id cannot be found or the bot has been removed from the chat
+            SEND_ERRORS.inc(error="rejected")
+            message.result = REJECTED
+            return None
+        except (TimedOut, NetworkError):
+            SEND_ERRORS.inc(error="network")
+            if message.attempts <= self.max_retries:
+                return float(2 ** message.attempts)
+            logger.warning("Dropping a message to %s after %s attempts", message.chat_id, message.attempts)
+            message.result = FAILED
+        except Exception:
+            SEND_ERRORS.inc(error="unexpected")
+            logger.exception("Dropping a message to %s", message.chat_id)
+            message.result = FAILED
+
+        return None
+
+    def _work(self) -> None:
+        while True:
+            message = self._next_message()
+            if message is None:
+                return
+
+            # An expired message is dropped before it takes a token from the global bucket
+            if message.is_expired is not None and message.is_expired():
+                message.result = EXPIRED
+                self._finish(message, None)
+                continue
+
+            self._global_bucket.acquire()
+            self._finish(message, self._send(message))
+
+
+def pack_message_groups(
+    lines: List[str], header: str = "", max_length: int = MAX_MESSAGE_LENGTH
+) -> List[Tuple[str, List[int]]]:
+    """
+    Packs the lines into as few messages as possible, each starting with the header and no
+    longer than max_length. Lines are kept in order and are never split across messages.
+
+    Returns:
+        each message with the indexes of the lines it holds
+    """
+    messages = []
+    current = header
+    indexes: List[int] = []
+
+    for index, line in enumerate(lines):
+        # A line that can never fit is truncated rather than dropped
+        line = line[: max_length - len(header)]
+
+        if current != header and len(current) + 1 + len(line) > max_length:
+            messages.append((current, indexes))
+            current = header
+            indexes = []
+
+        current = current + line if current == header else f"{current}\n{line}"
+        indexes.append(index)
+
+    if current != header:
+        messages.append((current, indexes))
+
+    return messages
+
+
+def pack_messages(
+    lines: List[str], header: str = "", max_length: int = MAX_MESSAGE_LENGTH
+) -> List[str]:
+    """Packs the lines into as few messages as possible, see pack_message_groups."""
+    return [text for text, _ in pack_message_groups(lines, header, max_length)]
+
+
+class DigestBuffer:
+    """
+    Collects the tweets for chats in digest mode and sends them grouped into digests.
+
+    A chat's lines are held until window_seconds after the first of them was added, so every
+    line added in the meantime, from any handle, is sent in as few messages as possible.
+    Held tweets are only claimed as sent when their digest is queued and the poller keeps each
+    handle's cursor before its oldest held tweet, so tweets still held when the bot stops are
+    fetched again rather than lost. A digest that fails is held again and the claims of a
+    digest Telegram rejects are released.
+    """
+
+    def __init__(
+        self,
+        dispatcher: MessageDispatcher,
+        sent: Union[SentTweets, SharedSentTweets],
+        window_seconds: float = TG_DIGEST_WINDOW_SECONDS,
+    ):
+        """
+        Parameters:
+            dispatcher (MessageDispatcher): the dispatcher the digests are queued with
+            sent (SentTweets | SharedSentTweets): the tweets already sent to each chat
+            window_seconds (float): how long lines are held for, 0 to send them every cycle
+        """
+        self.dispatcher = dispatcher
+        self.sent = sent
+        self.window_seconds = window_seconds
+
+        # The (handle, line) of each tweet held for a chat and the time the first was added
+        self._lines: Dict[str, Dict[int, Tuple[str, str]]] = {}
+        self._started_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, chat_id: str, handle: str, tweet_id: int, line: str) -> bool:
+        """
+        Holds the tweet's line for the chat's next digest.
+
+        Parameters:
+            chat_id (str): the chat identifier
+            handle (str): the handle that posted the tweet
+            tweet_id (int): the ID of the tweet
+            line (str): the line of the digest
+
+        Returns:
+            True if the tweet wasn't already held for the chat
+        """
+        chat_id = str(chat_id)
+
+        with self._lock:
+            if chat_id not in self._lines:
+                self._lines[chat_id] = {}
+                self._started_at[chat_id] = time.monotonic()
+
+            if tweet_id in self._lines[chat_id]:
+                return False
+
+            self._lines[chat_id][tweet_id] = (handle, line)
+            return True
+
+    def oldest_held(self) -> Dict[str, int]:
+        """The ID of the oldest tweet held for each handle, keyed by the lowercase handle name."""
+        oldest: Dict[str, int] = {}
+
+        with self._lock:
+            for lines in self._lines.values():
+                for tweet_id, (handle, _) in lines.items():
+                    key = handle.lower()
+                    if key not in oldest or tweet_id < oldest[key]:
+                        oldest[key] = tweet_id
+
+        return oldest
+
+    def flush(self, force: bool = False) -> int:
+        """
+        Claims and queues the digests of the chats whose window has closed, or of every chat if
+        forced. Tweets already sent to a chat are left out of its digest and a chat whose
+        tweets couldn't be claimed is held until the next flush.
+
+        Returns:
+            the number of messages queued
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            closed = [
+                chat_id
+                for chat_id, started_at in self._started_at.items()
+                if force or now - started_at >= self.window_seconds
+            ]
+            digests = {
+                chat_id: (self._lines.pop(chat_id), self._started_at.pop(chat_id))
+                for chat_id in closed
+            }
+
+        queued = 0
+        for chat_id, (lines, started_at) in digests.items():
+            try:
+                unsent = set(self.sent.claim([(tweet_id, chat_id) for tweet_id in lines]))
+            except Exception:
+                logger.exception("Unable to claim the digest for %s", chat_id)
+                self._hold(chat_id, lines, started_at)
+                continue
+
+            items = [item for item in lines.items() if (item[0], chat_id) in unsent]
+            header = "New tweets:\n\n" if len(items) > 1 else ""
+            for text, indexes in pack_message_groups([line for _, (_, line) in items], header):
+                digest = dict(items[i] for i in indexes)
+                self.dispatcher.enqueue(chat_id, text, self._on_result(chat_id, digest))
+                queued += 1
+
+        return queued
+
+    def _hold(self, chat_id: str, lines: Dict[int, Tuple[str, str]], started_at: float) -> None:
+        """Holds the lines for the chat again, ahead of any added since they were taken."""
+        with self._lock:
+            self._lines[chat_id] = {**lines, **self._lines.get(chat_id, {})}
+            self._started_at[chat_id] = min(started_at, self._started_at.get(chat_id, started_at))
+
+    def _on_result(self, chat_id: str, lines: Dict[int, Tuple[str, str]]) -> Callable[[str], None]:
+        def on_result(result: str) -> None:
+            if result == SENT:
+                return
+
+            self.sent.release([(tweet_id, chat_id) for tweet_id in lines])
+            if result == FAILED:
+                self._hold(chat_id, lines, time.monotonic())
+            else:
+                DROPPED.inc(reason=result)
+
+        return on_result
+
+    def seconds_until_next_flush(self) -> Optional[float]:
+        """The number of seconds until a chat's window closes or None if nothing is held."""
+        with self._lock:
+            if not self._started_at:
+                return None
+
+            oldest = min(self._started_at.values())
+
+        return max(0.0, oldest + self.window_seconds - time.monotonic())
@@ -0,0 +1,215 @@
+"""
+A local fake of the Twitter API v2 filtered stream, for trying stream mode without Twitter.
+
+Run it with `python fake_stream.py --port 8089` and set TW_STREAM_BASE_URL=http://127.0.0.1:8089.
+Tweets are published with `POST /fake/tweets {"username": "someone"}` and every connected
+stream is dropped with `POST /fake/disconnect`. It can also be started in process, see
+FakeStreamServer.
+"""
+import json
+import queue
+import argparse
+import itertools
+import threading
+from typing import Dict, List, Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RULES_PATH = "/2/tweets/search/stream/rules"
+STREAM_PATH = "/2/tweets/search/stream"
+
+# Put on a connection's queue to end its stream
+_DISCONNECT = object()
+
+
+class FakeStreamServer:
+    """An in-process fake filtered stream server with publish and disconnect controls."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, heartbeat_seconds: float = 20):
+        """
+        Parameters:
+            host (str): the address to listen on
+            port (int): the port to listen on, 0 picks a free port
+            heartbeat_seconds (float): how often an idle stream is sent a keep-alive
+        """
+        self.heartbeat_seconds = heartbeat_seconds
+
+        self.rules: Dict[str, str] = {}
+        self._connections: List["queue.Queue"] = []
+        self._failures: List[int] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def connection_count(self) -> int:
+        with self._lock:
+            return len(self._connections)
+
+    def start(self) -> "FakeStreamServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.disconnect()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def fail_next_connection(self, status: int) -> None:
+        """Refuses the next attempt to connect to the stream with the given status, e.g. 429."""
+        with self._lock:
+            self._failures.append(status)
+
+    def disconnect(self) -> None:
+        """Ends every open stream, as Twitter does when a connection is dropped."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+
+        for connection in connections:
+            connection.put(_DISCONNECT)
+
+    def matches(self, username: str) -> List[str]:
+        """Returns the IDs of the rules matching tweets from the user."""
+        term = f"from:{username.lower()}"
+        with self._lock:
+            return [
+                rule_id
+                for rule_id, value in self.rules.items()
+                if term in (t.strip().lower() for t in value.split(" OR "))
+            ]
+
+    def publish(self, username: str, tweet_id: Optional[int] = None, text: str = "") -> int:
+        """
+        Sends a tweet from the user to every open stream, if it matches one of the rules.
+
+        Returns:
+            the ID of the tweet
+        """
+        tweet_id = tweet_id or next(self._ids) + 10 ** 18
+        rule_ids = self.matches(username)
+        if not rule_ids:
+            return tweet_id
+
+        author_id = str(abs(hash(username.lower())))
+        message = {
+            "data": {"id": str(tweet_id), "text": text, "author_id": author_id},
+            "includes": {"users": [{"id": author_id, "username": username}]},
+            "matching_rules": [{"id": rule_id} for rule_id in rule_ids],
+        }
+
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            connection.put(json.dumps(message))
+
+        return tweet_id
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, body: dict) -> None:
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _read_json(self) -> dict:
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+
+                if path == RULES_PATH:
+                    with fake._lock:
+                        data = [{"id": i, "value": v} for i, v in fake.rules.items()]
+                    self._send_json(200, {"data": data, "meta": {"result_count": len(data)}})
+                elif path == STREAM_PATH:
+                    self._stream()
+                else:
+                    self._send_json(404, {"title": "Not Found"})
+
+            def do_POST(self):
+                body = self._read_json()
+
+                if self.path == RULES_PATH:
+                    with fake._lock:
+                        for rule in body.get("add", []):
+                            fake.rules[str(next(fake._ids))] = rule["value"]
+                        for rule_id in body.get("delete", {}).get("ids", []):
+                            fake.rules.pop(rule_id, None)
+                    self._send_json(200, {"meta": {"summary": {}}})
+                elif self.path == "/fake/tweets":
+                    tweet_id = fake.publish(body["username"], body.get("id"), body.get("text", ""))
+                    self._send_json(201, {"id": str(tweet_id)})
+                elif self.path == "/fake/disconnect":
+                    fake.disconnect()
+                    self._send_json(200, {})
+                else:
+                    self._send_json(404, {"title": "Not Found"})
+
+            def _stream(self):
+                with fake._lock:
+                    failure = fake._failures.pop(0) if fake._failures else None
+                    connection: "queue.Queue" = queue.Queue()
+                    if failure is None:
+                        fake._connections.append(connection)
+
+                if failure is not None:
+                    self._send_json(failure, {"title": "Connection refused"})
+                    return
+
+                # The response has no length, so the stream lasts until the connection closes
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+
+                try:
+                    while True:
+                        try:
+                            line = connection.get(timeout=fake.heartbeat_seconds)
+                        except queue.Empty:
+                            line = ""
+
+                        if line is _DISCONNECT:
+                            return
+
+                        self.wfile.write(f"{line}\r\n".encode())
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with fake._lock:
+                        if connection in fake._connections:
+                            fake._connections.remove(connection)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs a fake Twitter filtered stream server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--heartbeat-seconds", type=float, default=20)
+    args = parser.parse_args()
+
+    server = FakeStreamServer(args.host, args.port, args.heartbeat_seconds)
+    print(f"Fake filtered stream listening on {server.url}")
+    server._server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
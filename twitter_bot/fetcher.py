@@ -0,0 +1,214 @@
+import time
+import logging
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+
+from api.handle import Handle
+from api.rate_limits import RateLimitExhaustedError
+from api.tweet import Tweet
+from api.twitter_funcs import (
+    SEARCH_ENDPOINT,
+    TIMELINE_ENDPOINT,
+    build_search_queries,
+    get_tweets_by_search,
+    rate_limits,
+    within_search_window,
+)
+from metrics import registry
+from constants import TW_FETCH_BACKEND, TW_FETCH_WORKERS
+
+
+logger = logging.getLogger(__name__)
+
+FETCH_SECONDS = registry.histogram(
+    "twitter_bot_fetch_seconds",
+    "Time taken by each successful fetch of a handle's timeline, or of a search of many handles.",
+    ["endpoint"],
+)
+FETCH_ERRORS = registry.counter(
+    "twitter_bot_fetch_errors_total",
+    "Fetches that failed, by endpoint and reason.",
+    ["endpoint", "reason"],
+)
+DEFERRED = registry.counter(
+    "twitter_bot_handles_deferred_total", "Handles skipped until the rate limit resets."
+)
+
+FETCH_BACKENDS = ("timeline", "search")
+
+# The tweets fetched for each handle, keyed by name, with the max_id to resume from if the
+# handle's new tweets weren't all fetched
+Fetched = Dict[str, Tuple[List[Tweet], Optional[int]]]
+
+
+class Backfills:
+    """
+    The handles whose new tweets couldn't all be fetched at once, and where to resume.
+
+    A busy handle's timeline may have more new tweets than can be fetched in one go. Its
+    tweets are fetched newest first, so until the rest are fetched its cursor can't move past
+    the gap, and the cursor it should be moved to once the gap is closed is kept here. Each
+    fetch resumes from the oldest tweet fetched by the one before. Backfills are only kept in
+    memory, if one is lost the handle's cursor hasn't moved, so its new tweets are fetched
+    again from the newest and the tweets already sent are skipped.
+    """
+
+    def __init__(self):
+        # (max_id to resume from, cursor to move to once caught up), keyed by lower handle
+        self._backfills: Dict[str, Tuple[int, int]] = {}
+
+    def max_id(self, handle: str) -> Optional[int]:
+        """The ID of the newest tweet left to fetch for the handle or None if it's caught up."""
+        backfill = self._backfills.get(handle.lower())
+        return backfill[0] if backfill else None
+
+    def since_id(self, handle: str) -> Optional[int]:
+        """The cursor the handle should be moved to once it has caught up, if it's behind."""
+        backfill = self._backfills.get(handle.lower())
+        return backfill[1] if backfill else None
+
+    def resume(self, handle: str, max_id: int, since_id: int) -> None:
+        """Records that the handle's tweets up to max_id are still to be fetched."""
+        self._backfills[handle.lower()] = (max_id, since_id)
+
+    def finish(self, handle: str) -> None:
+        """Records that the handle has caught up."""
+        self._backfills.pop(handle.lower(), None)
+
+
+def _timeline_task(
+    handle: Handle, since_id: Optional[int], max_id: Optional[int]
+) -> Callable[[], Fetched]:
+    return lambda: {handle.name: handle.recent_tweets(since_id, max_id=max_id)}
+
+
+def _search_task(
+    names: List[str], since_ids: Dict[str, Optional[int]]
+) -> Callable[[], Fetched]:
+    return lambda: get_tweets_by_search(names, {name: since_ids[name] for name in names})
+
+
+def _timed(task: Callable[[], Fetched], endpoint: str) -> Callable[[], Fetched]:
+    """Wraps the task so the time taken by a successful fetch is recorded."""
+
+    def run() -> Fetched:
+        started = time.monotonic()
+        results = task()
+        FETCH_SECONDS.observe(time.monotonic() - started, endpoint=endpoint)
+        return results
+
+    return run
+
+
+def _within_budget(
+    tasks: List[Tuple[Callable[[], Fetched], List[str], str]]
+) -> List[Tuple[Callable[[], Fetched], List[str], str]]:
+    """Returns the tasks, in order, that the rate limit budget of their endpoint can cover."""
+    budgets = {endpoint: rate_limits.available(endpoint) for _, _, endpoint in tasks}
+    covered, deferred = [], 0
+
+    for task in tasks:
+        endpoint = task[2]
+        if budgets[endpoint] is None:
+            covered.append(task)
+        elif budgets[endpoint] > 0:
+            budgets[endpoint] -= 1
+            covered.append(task)
+        else:
+            deferred += len(task[1])
+
+    if deferred:
+        DEFERRED.inc(deferred)
+        logger.info("Deferring %s handles until the rate limit resets", deferred)
+
+    return covered
+
+
+def fetch_recent_tweets(
+    handles: List[Handle],
+    since_ids: Dict[str, Optional[int]],
+    workers: int = TW_FETCH_WORKERS,
+    backend: str = TW_FETCH_BACKEND,
+    backfills: Optional[Backfills] = None,
+) -> Iterator[Tuple[Handle, List[Tweet], Optional[int]]]:
+    """
+    Fetches the recent tweets for each handle concurrently, yielding results as they complete.
+
+    With the "timeline" backend each handle's timeline is fetched separately. With the "search"
+    backend handles are packed into "from:a OR from:b" search queries, so one request covers
+    many handles; handles without a cursor, or with a cursor older than search can reach, are
+    still fetched from their timeline, as are handles resuming a backfill.
+
+    A fetch that fails is logged and its handles are skipped, so it doesn't affect the others.
+    Handles with more watchers are fetched first. When the rate limit budget can't cover every
+    request, the handles with the fewest watchers are skipped, and so deferred to their next
+    poll, rather than waiting for the limit to reset.
+
+    Parameters:
+        handles (List[Handle]): the handles to be fetched
+        since_ids (Dict[str, int | None]): the newest tweet ID already seen, keyed by handle name
+        workers (int): the maximum number of requests made at once
+        backend (str): either "timeline" or "search"
+        backfills (Backfills | None): where to resume the handles that are behind
+
+    Returns:
+        an iterator of (handle, tweets, max_id) tuples in the order the fetches complete, the
+        max_id to resume from being None if the handle has caught up
+    """
+    if backend not in FETCH_BACKENDS:
+        raise ValueError(f"Unknown fetch backend {backend}, expected one of {FETCH_BACKENDS}.")
+
+    if not handles:
+        return
+
+    backfills = backfills or Backfills()
+    handles = sorted(handles, key=lambda handle: len(handle.watchers), reverse=True)
+    by_name = {handle.name: handle for handle in handles}
+    tasks: List[Tuple[Callable[[], Fetched], List[str], str]] = []
+
+    searchable = set()
+    if backend == "search":
+        searchable = {
+            handle.name
+            for handle in handles
+            if since_ids.get(handle.name) is not None
+            and within_search_window(since_ids[handle.name])
+            and backfills.max_id(handle.name) is None
+        }
+        ordered = [handle.name for handle in handles if handle.name in searchable]
+        for names in build_search_queries(ordered):
+            tasks.append((_search_task(names, since_ids), names, SEARCH_ENDPOINT))
+
+    for handle in handles:
+        if handle.name not in searchable:
+            task = _timeline_task(
+                handle, since_ids.get(handle.name), backfills.max_id(handle.name)
+            )
+            tasks.append((task, [handle.name], TIMELINE_ENDPOINT))
+
+    tasks = _within_budget(tasks)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures: Dict[Future, Tuple[List[str], str]] = {
+            executor.submit(_timed(task, endpoint)): (names, endpoint)
+            for task, names, endpoint in tasks
+        }
+
+        for future in as_completed(futures):
+            names, endpoint = futures[future]
+
+            try:
+                results = future.result()
+            except RateLimitExhaustedError as e:
+                FETCH_ERRORS.inc(endpoint=endpoint, reason="rate_limited")
+                logger.info("Deferring %s: %s", ", ".join(f"@{name}" for name in names), e)
+                continue
+            except Exception:
+                FETCH_ERRORS.inc(endpoint=endpoint, reason="error")
+                handle_list = ", ".join(f"@{name}" for name in names)
+                logger.exception("Unable to fetch the recent tweets for %s", handle_list)
+                continue
+
+            for name in names:
+                tweets, max_id = results.get(name, ([], None))
+                yield by_name[name], tweets, max_id
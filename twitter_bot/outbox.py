@@ -0,0 +1,264 @@
+import time
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from api import db as dbapi
+from dispatcher import DROPPED, FAILED, REJECTED, SENT, MessageDispatcher
+from constants import (
+    TW_OUTBOX_BACKOFF_SECONDS,
+    TW_OUTBOX_BATCH_SIZE,
+    TW_OUTBOX_LEASE_SECONDS,
+    TW_OUTBOX_MAX_ATTEMPTS,
+    TW_OUTBOX_POLL_SECONDS,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxWriter:
+    """
+    Writes messages to the outbox instead of sending them.
+
+    It has the same enqueue and join as the MessageDispatcher, so the poller can use either.
+    Messages are buffered and written in a single request when join is called, which is when
+    the poller would otherwise wait for them to be sent. A message counts as SENT once it's
+    in the outbox.
+    """
+
+    def __init__(self):
+        self._messages: List[Tuple[dict, Optional[Callable[[str], None]]]] = []
+        self._lock = threading.Lock()
+
+    def enqueue(
+        self, chat_id: str, text: str, on_result: Optional[Callable[[str], None]] = None
+    ) -> None:
+        """
+        Buffers a message to be written to the outbox.
+
+        Parameters:
+            chat_id (str): the chat identifier
+            text (str): the text body of the message
+            on_result (Callable | None): called with SENT once the message is in the outbox, or
+                with FAILED if it couldn't be written
+        """
+        with self._lock:
+            self._messages.append(({"chatID": str(chat_id), "text": text}, on_result))
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """
+        Writes the buffered messages to the outbox.
+
+        Messages that can't be written are reported as FAILED and dropped, so their sender can
+        queue them again, while messages without a callback are kept for the next join.
+
+        Returns:
+            True once the messages are in the outbox, an error is raised if they can't be written
+        """
+        with self._lock:
+            messages, self._messages = self._messages, []
+
+        if not messages:
+            return True
+
+        try:
+            dbapi.enqueue_outbox_messages([message for message, _ in messages])
+        except Exception:
+            with self._lock:
+                self._messages = [m for m in messages if m[1] is None] + self._messages
+            self._report(messages, FAILED)
+            raise
+
+        self._report(messages, SENT)
+        return True
+
+    @staticmethod
+    def _report(messages: List[Tuple[dict, Optional[Callable[[str], None]]]], result: str) -> None:
+        for message, on_result in messages:
+            if on_result is None:
+                continue
+            try:
+                on_result(result)
+            except Exception:
+                logger.exception("Error reporting the result of a message to %s", message["chatID"])
+
+
+class DeliveryWorker:
+    """
+    Delivers the messages in the outbox through a MessageDispatcher.
+
+    Messages are claimed in batches for the length of a lease. Delivered messages are removed,
+    messages that couldn't be delivered are retried with exponential backoff and messages
+    Telegram rejected, or that have run out of attempts, are marked as failed. A message
+    whose worker dies is claimed again once its lease runs out, so any number of workers can
+    share the outbox.
+
+    The next batch isn't claimed until the dispatcher has drained. While it drains the lease
+    of every message still in flight is extended, and a message whose lease ran out anyway,
+    so it may have been claimed by another worker, is dropped instead of being sent.
+    """
+
+    def __init__(
+        self,
+        dispatcher: MessageDispatcher,
+        worker_id: str,
+        batch_size: int = TW_OUTBOX_BATCH_SIZE,
+        lease_seconds: float = TW_OUTBOX_LEASE_SECONDS,
+        max_attempts: int = TW_OUTBOX_MAX_ATTEMPTS,
+        backoff_seconds: float = TW_OUTBOX_BACKOFF_SECONDS,
+        poll_seconds: float = TW_OUTBOX_POLL_SECONDS,
+    ):
+        """
+        Parameters:
+            dispatcher (MessageDispatcher): the dispatcher sending messages using the Telegram API
+            worker_id (str): the unique ID of the delivery worker
+            batch_size (int): the maximum number of messages claimed at once
+            lease_seconds (float): how long claimed messages are held for
+            max_attempts (int): how many times a message is claimed before it is marked as failed
+            backoff_seconds (float): the delay before the first retry, doubled for each retry
+            poll_seconds (float): how long to wait before checking an empty outbox again
+        """
+        self.dispatcher = dispatcher
+        self.worker_id = worker_id
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.poll_seconds = poll_seconds
+
+        self._stopping = threading.Event()
+
+    def _backoff(self, attempts: int) -> float:
+        return min(self.backoff_seconds * 2 ** (attempts - 1), self.lease_seconds * 10)
+
+    def deliver_batch(self) -> int:
+        """
+        Claims and delivers a single batch of messages.
+
+        Returns:
+            the number of messages claimed
+        """
+        # The lease is timed from before the claim, so it never outlives the one in the outbox
+        claimed_at = time.monotonic()
+        messages = dbapi.claim_outbox_messages(self.worker_id, self.batch_size, self.lease_seconds)
+        if not messages:
+            return 0
+
+        results: Dict[int, str] = {}
+        expires_at = {message["id"]: claimed_at + self.lease_seconds for message in messages}
+        lock = threading.Lock()
+
+        def record(id: int):
+            def on_result(result: str) -> None:
+                with lock:
+                    results[id] = result
+
+            return on_result
+
+        def expired(id: int):
+            def is_expired() -> bool:
+                with lock:
+                    return time.monotonic() >= expires_at[id]
+
+            return is_expired
+
+        for message in messages:
+            self.dispatcher.enqueue(
+                message["chatID"], message["text"], record(message["id"]), expired(message["id"])
+            )
+
+        while not self.dispatcher.join(timeout=self.lease_seconds / 4):
+            self._extend_leases(results, expires_at, lock)
+
+        with lock:
+            results = dict(results)
+
+        attempts = {message["id"]: message["attempts"] for message in messages}
+        sent = [id for id, result in results.items() if result == SENT]
+        failed = [id for id, result in results.items() if result == REJECTED]
+        rejected = len(failed)
+        retries = {}
+
+        # Expired messages are neither completed nor retried, they can already be claimed again
+        for id, result in results.items():
+            if result != FAILED:
+                continue
+            if attempts[id] >= self.max_attempts:
+                failed.append(id)
+            else:
+                retries[id] = self._backoff(attempts[id])
+
+        self._settle(sent, retries, failed)
+
+        if failed:
+            DROPPED.inc(rejected, reason=REJECTED)
+            DROPPED.inc(len(failed) - rejected, reason="max_attempts")
+            logger.warning("Marked %s outbox messages as failed", len(failed))
+
+        return len(messages)
+
+    def _settle(self, sent: List[int], retries: Dict[int, float], failed: List[int]) -> None:
+        """
+        Records the outcome of the delivered messages, trying again every poll_seconds until
+        the outbox has taken it. Meanwhile their leases are extended, so a delivered message
+        isn't claimed and delivered again. Gives up if the worker is stopped.
+        """
+        updates: List[Tuple[Callable[[], None], List[int]]] = [
+            (lambda: dbapi.complete_outbox_messages(sent), sent),
+            (lambda: dbapi.retry_outbox_messages(self.worker_id, retries), list(retries)),
+            (lambda: dbapi.fail_outbox_messages(self.worker_id, failed), failed),
+        ]
+        updates = [(update, ids) for update, ids in updates if ids]
+
+        while updates:
+            update, ids = updates[0]
+            try:
+                update()
+                updates.pop(0)
+                continue
+            except Exception:
+                logger.exception("Unable to record the outcome of %s outbox messages", len(ids))
+
+            if self._stopping.wait(self.poll_seconds):
+                return
+
+            unsettled = [id for _, ids in updates for id in ids]
+            try:
+                dbapi.extend_outbox_leases(self.worker_id, unsettled, self.lease_seconds)
+            except Exception:
+                logger.exception("Unable to extend the lease of %s outbox messages", len(unsettled))
+
+    def _extend_leases(
+        self, results: Dict[int, str], expires_at: Dict[int, float], lock: threading.Lock
+    ) -> None:
+        """Extends the lease of the messages that are still in flight."""
+        with lock:
+            pending = [id for id in expires_at if id not in results]
+
+        extended_at = time.monotonic()
+        try:
+            extended = dbapi.extend_outbox_leases(self.worker_id, pending, self.lease_seconds)
+        except Exception:
+            logger.exception("Unable to extend the lease of %s outbox messages", len(pending))
+            return
+
+        with lock:
+            for id in extended:
+                expires_at[id] = extended_at + self.lease_seconds
+
+    def run(self) -> None:
+        """Delivers batches of messages until stopped."""
+        while not self._stopping.is_set():
+            try:
+                claimed = self.deliver_batch()
+            except Exception:
+                logger.exception("Unable to deliver messages from the outbox")
+                claimed = 0
+
+            # A full batch suggests more are waiting, so the next is claimed straight away
+            if claimed < self.batch_size:
+                self._stopping.wait(self.poll_seconds)
+
+    def stop(self) -> None:
+        self._stopping.set()
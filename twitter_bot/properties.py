@@ -1,44 +1,139 @@
 import json
-from typing import Union
+import sqlite3
+import threading
+from typing import Dict, Optional, Union
 from datetime import datetime
 from pathlib import Path
 
 
 class Properties:
-    """A class for handling the properties."""
+    """
+    A class for handling the properties.
 
-    def __init__(self, file_path: Union[Path, str] = "./properties.json") -> None:
+    The properties are stored in an SQLite database in WAL mode. Reads are served from memory
+    and updates are buffered until commit is called, which writes them in a single transaction,
+    so a crash leaves the properties as they were at the end of the last committed cycle.
+    """
+
+    def __init__(self, file_path: Union[Path, str] = "./properties.db") -> None:
         """
         Parameters:
-            file_path (pathlib.Path | str): the path to the properties file - default = './properties.json'
+            file_path (pathlib.Path | str): the path to the properties database - default = './properties.db'
         """
         self.file_path = Path(file_path)
 
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.file_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("PRAGMA synchronous=NORMAL;")
+
         self._create_if_not_exist()
         self._load()
 
-    def _create_if_not_exist(self):
-        """Creates the properties JSON file if it does not already exist."""
-        if not self.file_path.exists():
-            with open(self.file_path, "w", encoding="utf8") as prop_f:
-                prop_f.write(json.dumps({"last_request": datetime.utcnow().isoformat()}, indent=2))
+        self._dirty_values: Dict[str, str] = {}
+        self._dirty_handles: Dict[str, dict] = {}
+
+        self._import_legacy_file()
+
+    def _create_if_not_exist(self) -> None:
+        """Creates the properties tables if they do not already exist."""
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS properties (key TEXT PRIMARY KEY, value TEXT);"
+            )
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS handle_state (
+                       handle TEXT PRIMARY KEY,
+                       since_id INTEGER,
+                       tweet_rate REAL,
+                       poll_interval REAL,
+                       last_polled_at REAL
+                   );"""
+            )
 
     def _load(self) -> None:
-        """Loads the data from the properties file."""
-        with open("./properties.json", "r", encoding="utf8") as prop_f:
-            self._data = json.load(prop_f)
+        """Loads the data from the properties database."""
+        self._data: Dict[str, str] = dict(self._conn.execute("SELECT key, value FROM properties;"))
+        self._handles: Dict[str, dict] = {
+            row[0]: {
+                "since_id": row[1],
+                "tweet_rate": row[2],
+                "poll_interval": row[3],
+                "last_polled_at": row[4],
+            }
+            for row in self._conn.execute(
+                "SELECT handle, since_id, tweet_rate, poll_interval, last_polled_at FROM handle_state;"
+            )
+        }
 
-    def _save(self) -> None:
-        """Saves the new version of the properties file."""
-        with open("./properties.json", "w", encoding="utf8") as prop_f:
-            prop_f.write(json.dumps(self._data, indent=2))
+    def _import_legacy_file(self) -> None:
+        """Imports the properties.json file used by earlier versions, if there is one."""
+        legacy_path = self.file_path.with_name("properties.json")
+        if self._data or self._handles or not legacy_path.exists():
+            return
 
-        self._load()
+        with open(legacy_path, "r", encoding="utf8") as prop_f:
+            legacy = json.load(prop_f)
+
+        if legacy.get("last_request"):
+            self._set_value("last_request", legacy["last_request"])
+        for handle, since_id in legacy.get("since_ids", {}).items():
+            self._set_handle(handle, since_id=since_id)
+
+        self.commit()
+
+    def _set_value(self, key: str, value: str) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._dirty_values[key] = value
+
+    def _set_handle(self, handle: str, **values) -> None:
+        with self._lock:
+            state = self._handles.setdefault(
+                handle.lower(),
+                {"since_id": None, "tweet_rate": None, "poll_interval": None, "last_polled_at": None},
+            )
+            state.update(values)
+            self._dirty_handles[handle.lower()] = dict(state)
+
+    def commit(self) -> None:
+        """Writes every buffered update in a single transaction."""
+        with self._lock:
+            values, self._dirty_values = self._dirty_values, {}
+            handles, self._dirty_handles = self._dirty_handles, {}
+
+        if not values and not handles:
+            return
+
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO properties (key, value) VALUES (?, ?);", values.items()
+            )
+            self._conn.executemany(
+                """INSERT OR REPLACE INTO handle_state
+                   (handle, since_id, tweet_rate, poll_interval, last_polled_at)
+                   VALUES (?, ?, ?, ?, ?);""",
+                [
+                    (
+                        handle,
+                        state["since_id"],
+                        state["tweet_rate"],
+                        state["poll_interval"],
+                        state["last_polled_at"],
+                    )
+                    for handle, state in handles.items()
+                ],
+            )
+
+    def close(self) -> None:
+        """Commits any buffered updates and closes the database."""
+        self.commit()
+        self._conn.close()
 
     @property
     def last_request(self) -> Union[datetime, None]:
         """The date the last request for tweets was made or None if a timestamp isn't present."""
-        iso_datetime = self._data["last_request"]
+        iso_datetime = self._data.get("last_request")
         return datetime.fromisoformat(iso_datetime) if iso_datetime else None
 
     def update_last_request(self, date: datetime) -> None:
@@ -48,5 +143,64 @@ class Properties:
         Parameters:
             date (datetime.datetime): the new date to be stored
         """
-        self._data["last_request"] = date.isoformat()
-        self._save()
+        self._set_value("last_request", date.isoformat())
+
+    def since_id(self, handle: str) -> Optional[int]:
+        """
+        The ID of the newest tweet seen for the handle or None if the handle hasn't been polled.
+
+        Parameters:
+            handle (str): the Twitter handle
+        """
+        state = self._handles.get(handle.lower())
+        return state["since_id"] if state else None
+
+    def update_since_id(self, handle: str, since_id: int) -> None:
+        """
+        Update the newest tweet ID seen for the handle, cursors are never moved backwards.
+
+        Parameters:
+            handle (str): the Twitter handle
+            since_id (int): the ID of the newest tweet seen
+        """
+        current = self.since_id(handle)
+        if current is not None and current >= since_id:
+            return
+
+        self._set_handle(handle, since_id=since_id)
+
+    def poll_state(self, handle: str) -> Optional[dict]:
+        """
+        The polling state of the handle or None if it has never been polled.
+
+        Parameters:
+            handle (str): the Twitter handle
+
+        Returns:
+            a dict with the tweet_rate, poll_interval and last_polled_at (a UNIX timestamp)
+        """
+        state = self._handles.get(handle.lower())
+        if not state or state["last_polled_at"] is None:
+            return None
+
+        return {
+            "tweet_rate": state["tweet_rate"],
+            "poll_interval": state["poll_interval"],
+            "last_polled_at": state["last_polled_at"],
+        }
+
+    def update_poll_state(
+        self, handle: str, tweet_rate: Optional[float], poll_interval: float, last_polled_at: float
+    ) -> None:
+        """
+        Update the polling state of the handle.
+
+        Parameters:
+            handle (str): the Twitter handle
+            tweet_rate (float | None): the handle's average tweets per second
+            poll_interval (float): the seconds between polls of the handle
+            last_polled_at (float): the UNIX timestamp of the last poll
+        """
+        self._set_handle(
+            handle, tweet_rate=tweet_rate, poll_interval=poll_interval, last_polled_at=last_polled_at
+        )
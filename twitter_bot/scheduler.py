@@ -0,0 +1,198 @@
+import math
+import time
+import heapq
+import random
+from typing import Dict, List, Optional, Tuple
+
+from api.handle import Handle
+from properties import Properties
+from constants import (
+    TW_MAX_POLL_SECONDS,
+    TW_MIN_POLL_SECONDS,
+    TW_POLL_JITTER,
+    TW_POLL_RATE_SMOOTHING,
+)
+
+
+class HandleSchedule:
+    """The polling state of a single handle."""
+
+    def __init__(self, handle: Handle, next_due: float, interval: float):
+        self.handle: Handle = handle
+        self.next_due: float = next_due
+        self.interval: float = interval
+        self.tweet_rate: Optional[float] = None
+        self.last_polled_at: Optional[float] = None
+
+    @property
+    def watcher_count(self) -> int:
+        return len(self.handle.watchers)
+
+
+class PollScheduler:
+    """
+    Decides when each handle is next polled.
+
+    Handles are kept in a heap keyed by the time they are next due. After each poll a handle's
+    interval is set from a moving average of its tweet rate, so that a poll is expected to find
+    about one new tweet, and is shortened for handles with more watchers. Intervals are bounded
+    by min_interval and max_interval and jittered so polls don't bunch together.
+
+    When given properties, each handle's polling state is saved after every poll and restored
+    when the handle is first scheduled, so a restart carries on with the same schedule.
+    """
+
+    def __init__(
+        self,
+        min_interval: float = TW_MIN_POLL_SECONDS,
+        max_interval: float = TW_MAX_POLL_SECONDS,
+        jitter: float = TW_POLL_JITTER,
+        smoothing: float = TW_POLL_RATE_SMOOTHING,
+        props: Optional[Properties] = None,
+    ):
+        """
+        Parameters:
+            min_interval (float): the shortest time between polls of a handle, in seconds
+            max_interval (float): the longest time between polls of a handle, in seconds
+            jitter (float): the fraction an interval is randomly lengthened or shortened by
+            smoothing (float): the weight given to the latest observation of a tweet rate
+            props (Properties | None): where the polling state of each handle is kept
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.smoothing = smoothing
+        self.props = props
+
+        self._schedules: Dict[str, HandleSchedule] = {}
+        self._heap: List[Tuple[float, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._schedules)
+
+    def _push(self, schedule: HandleSchedule) -> None:
+        heapq.heappush(self._heap, (schedule.next_due, schedule.handle.name))
+
+    def sync(self, handles: List[Handle], now: Optional[float] = None) -> None:
+        """
+        Brings the scheduled handles in line with the given subscriptions.
+
+        New handles are due immediately, handles that are no longer given are dropped and the
+        watchers of existing handles are replaced.
+
+        Parameters:
+            handles (List[Handle]): every handle that should be polled
+        """
+        now = time.monotonic() if now is None else now
+        current = {handle.name: handle for handle in handles}
+
+        for name in [name for name in self._schedules if name not in current]:
+            del self._schedules[name]
+
+        for name, handle in current.items():
+            schedule = self._schedules.get(name)
+
+            if schedule is None:
+                schedule = HandleSchedule(handle, next_due=now, interval=self.min_interval)
+                self._restore(schedule, now)
+                self._schedules[name] = schedule
+                self._push(schedule)
+            else:
+                schedule.handle = handle
+
+    def _restore(self, schedule: HandleSchedule, now: float) -> None:
+        """Restores the saved polling state of the handle, converting from wall clock time."""
+        state = self.props.poll_state(schedule.handle.name) if self.props else None
+        if state is None:
+            return
+
+        since_polled = max(0.0, time.time() - state["last_polled_at"])
+        schedule.tweet_rate = state["tweet_rate"]
+        schedule.interval = state["poll_interval"] or self.min_interval
+        schedule.last_polled_at = now - since_polled
+        schedule.next_due = now + max(0.0, schedule.interval - since_polled)
+
+    def _save(self, schedule: HandleSchedule, now: float) -> None:
+        """Saves the polling state of the handle, converting to wall clock time."""
+        if self.props is None or schedule.last_polled_at is None:
+            return
+
+        self.props.update_poll_state(
+            schedule.handle.name,
+            tweet_rate=schedule.tweet_rate,
+            poll_interval=schedule.interval,
+            last_polled_at=time.time() - (now - schedule.last_polled_at),
+        )
+
+    def pop_due(self, now: Optional[float] = None) -> List[Handle]:
+        """Removes and returns the handles that are due to be polled."""
+        now = time.monotonic() if now is None else now
+        due = []
+
+        while self._heap and self._heap[0][0] <= now:
+            next_due, name = heapq.heappop(self._heap)
+            schedule = self._schedules.get(name)
+
+            # Entries for dropped or rescheduled handles are left in the heap and skipped here
+            if schedule is None or schedule.next_due != next_due:
+                continue
+
+            due.append(schedule.handle)
+
+        return due
+
+    def seconds_until_next_due(self, now: Optional[float] = None) -> Optional[float]:
+        """The number of seconds until the next handle is due or None if nothing is scheduled."""
+        now = time.monotonic() if now is None else now
+
+        while self._heap:
+            next_due, name = self._heap[0]
+            schedule = self._schedules.get(name)
+
+            if schedule is not None and schedule.next_due == next_due:
+                return max(0.0, next_due - now)
+
+            heapq.heappop(self._heap)
+
+        return None
+
+    def _interval(self, schedule: HandleSchedule) -> float:
+        if not schedule.tweet_rate:
+            interval = self.max_interval
+        else:
+            # Popular handles are polled more often so their watchers hear about tweets sooner
+            interval = 1 / schedule.tweet_rate / (1 + math.log2(max(1, schedule.watcher_count)))
+
+        interval = min(self.max_interval, max(self.min_interval, interval))
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def record(self, name: str, new_tweets: Optional[int], now: Optional[float] = None) -> None:
+        """
+        Records the outcome of polling a handle and schedules its next poll.
+
+        Parameters:
+            name (str): the name of the handle that was polled
+            new_tweets (int | None): the number of new tweets found or None if the poll failed
+        """
+        now = time.monotonic() if now is None else now
+        schedule = self._schedules.get(name)
+        if schedule is None:
+            return
+
+        if new_tweets is not None:
+            if schedule.last_polled_at is not None:
+                elapsed = max(1.0, now - schedule.last_polled_at)
+                observed = new_tweets / elapsed
+
+                if schedule.tweet_rate is None:
+                    schedule.tweet_rate = observed
+                else:
+                    schedule.tweet_rate += self.smoothing * (observed - schedule.tweet_rate)
+
+                schedule.interval = self._interval(schedule)
+
+            schedule.last_polled_at = now
+
+        schedule.next_due = now + schedule.interval
+        self._push(schedule)
+        self._save(schedule, now)
@@ -0,0 +1,253 @@
+import time
+import bisect
+import hashlib
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+from api import db as dbapi
+from api.handle import Handle
+from constants import (
+    TW_SHARD_VIRTUAL_NODES,
+    TW_WORKER_HEARTBEAT_SECONDS,
+    TW_WORKER_HEARTBEAT_TTL_SECONDS,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+def _hash(key: str) -> int:
+    return int(hashlib.md5(key.encode("utf8")).hexdigest()[:16], 16)
+
+
+class HashRing:
+    """
+    A consistent hash ring mapping keys to workers.
+
+    Each worker is placed on the ring at several virtual nodes, so when a worker joins or leaves
+    only the keys next to its nodes move and the load stays evenly spread.
+    """
+
+    def __init__(self, workers: List[str], virtual_nodes: int = TW_SHARD_VIRTUAL_NODES):
+        self.workers: List[str] = sorted(set(workers))
+        self._ring: List[Tuple[int, str]] = sorted(
+            (_hash(f"{worker}#{i}"), worker) for worker in self.workers for i in range(virtual_nodes)
+        )
+        self._keys: List[int] = [key for key, _ in self._ring]
+
+    def owner(self, key: str) -> Optional[str]:
+        """Returns the worker that owns the key or None if there are no workers."""
+        if not self._ring:
+            return None
+
+        index = bisect.bisect(self._keys, _hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+
+class Shard:
+    """
+    The subset of handles polled by this worker when the poller runs as several workers.
+
+    Workers register themselves through heartbeats to the db_api. Every worker sees the same
+    list of live workers, so each builds the same ring and the handles are split between them
+    without any further coordination. When a worker joins or stops sending heartbeats the ring
+    is rebuilt and its handles move to the other workers.
+
+    The ring only decides which handles a worker tries to poll, a handle is polled by the worker
+    holding its cursor, see SharedCursors.
+    """
+
+    def __init__(
+        self,
+        worker_id: str,
+        heartbeat_seconds: float = TW_WORKER_HEARTBEAT_SECONDS,
+        heartbeat_ttl_seconds: float = TW_WORKER_HEARTBEAT_TTL_SECONDS,
+    ):
+        """
+        Parameters:
+            worker_id (str): the unique ID of this worker
+            heartbeat_seconds (float): how often a heartbeat is sent
+            heartbeat_ttl_seconds (float): how long the db_api keeps a worker without a heartbeat,
+                this must match the db_api's POLLER_HEARTBEAT_TTL_SECONDS
+        """
+        self.worker_id = worker_id
+        self.heartbeat_seconds = heartbeat_seconds
+        self.heartbeat_ttl_seconds = heartbeat_ttl_seconds
+
+        self._ring = HashRing([worker_id])
+        self._last_heartbeat_at: Optional[float] = None
+
+    @property
+    def heartbeat_due(self) -> bool:
+        return (
+            self._last_heartbeat_at is None
+            or time.monotonic() - self._last_heartbeat_at >= self.heartbeat_seconds
+        )
+
+    @property
+    def is_live(self) -> bool:
+        """
+        True while this worker's last successful heartbeat is recent enough for the db_api to
+        still count it as live. The heartbeat is timed from when it was sent and a heartbeat
+        interval is left spare, so a cycle in progress can finish before the worker's handles
+        can be claimed by another worker.
+        """
+        return (
+            self._last_heartbeat_at is not None
+            and time.monotonic() - self._last_heartbeat_at
+            < self.heartbeat_ttl_seconds - self.heartbeat_seconds
+        )
+
+    def heartbeat(self) -> bool:
+        """
+        Sends a heartbeat and rebuilds the ring if the live workers have changed.
+
+        If the heartbeat fails the last known ring is kept, but the worker must stop polling once
+        it's no longer live, see is_live.
+
+        Returns:
+            True if the handles have been rebalanced between the workers
+        """
+        sent_at = time.monotonic()
+        try:
+            workers = dbapi.heartbeat_poller_worker(self.worker_id)
+        except Exception:
+            logger.exception("Unable to send a heartbeat for poller worker %s", self.worker_id)
+            return False
+
+        self._last_heartbeat_at = sent_at
+
+        if self.worker_id not in workers:
+            workers.append(self.worker_id)
+
+        if sorted(set(workers)) == self._ring.workers:
+            return False
+
+        logger.info("Rebalancing handles across poller workers: %s", ", ".join(sorted(workers)))
+        self._ring = HashRing(workers)
+        return True
+
+    def owns(self, handle_name: str) -> bool:
+        return self._ring.owner(handle_name.lower()) == self.worker_id
+
+    def filter(self, handles: List[Handle]) -> List[Handle]:
+        """Returns the handles owned by this worker."""
+        return [handle for handle in handles if self.owns(handle.name)]
+
+    def leave(self) -> None:
+        """Removes this worker from the registry so its handles move to the other workers."""
+        try:
+            dbapi.remove_poller_worker(self.worker_id)
+        except Exception:
+            logger.exception("Unable to remove poller worker %s", self.worker_id)
+
+
+class SharedCursors:
+    """
+    The cursors of the handles polled by this worker, kept in Postgres through the db_api so
+    they move with their handles between workers.
+
+    A handle's cursor is claimed before the handle is polled and a cursor held by another live
+    worker can't be claimed, so a handle is never polled by two workers at once, even while
+    the workers disagree on the ring. Cursors of handles the ring has moved elsewhere are
+    released, so their new worker can claim them without waiting for this one to die. Cursor
+    updates are buffered until commit is called, like the local Properties.
+    """
+
+    def __init__(self, worker_id: str):
+        """
+        Parameters:
+            worker_id (str): the unique ID of this worker
+        """
+        self.worker_id = worker_id
+
+        self._since_ids: Dict[str, Optional[int]] = {}
+        self._dirty: Dict[str, int] = {}
+
+    def claim(self, handles: List[Handle]) -> List[Handle]:
+        """
+        Claims the cursors of the handles about to be polled.
+
+        Returns:
+            the handles whose cursors are now held by this worker, which may be polled
+        """
+        if not handles:
+            return []
+
+        try:
+            names = [handle.name for handle in handles]
+            claimed = dbapi.claim_poller_cursors(self.worker_id, names)
+        except Exception:
+            logger.exception("Unable to claim the cursors for poller worker %s", self.worker_id)
+            return []
+
+        claimed = {name.lower(): since_id for name, since_id in claimed.items()}
+        for handle in handles:
+            key = handle.name.lower()
+            if key in claimed:
+                # Updates that couldn't be written yet are newer than the stored cursor
+                since_id = claimed[key]
+                if key in self._dirty and (since_id is None or since_id < self._dirty[key]):
+                    since_id = self._dirty[key]
+                self._since_ids[key] = since_id
+            else:
+                # Held by another worker, its cursor may have moved on since it was last held here
+                self._since_ids.pop(key, None)
+                self._dirty.pop(key, None)
+
+        return [handle for handle in handles if handle.name.lower() in claimed]
+
+    def release_unowned(self, owns: Callable[[str], bool]) -> None:
+        """
+        Releases the held cursors of the handles this worker no longer owns. Cursors that
+        couldn't be released are tried again on the next call.
+
+        Parameters:
+            owns (Callable): returns True if the handle is owned by this worker
+        """
+        unowned = [handle for handle in self._since_ids if not owns(handle)]
+        if not unowned:
+            return
+
+        self.commit()
+        if any(handle in self._dirty for handle in unowned):
+            return
+
+        try:
+            dbapi.release_poller_cursors(self.worker_id, unowned)
+        except Exception:
+            logger.exception("Unable to release the cursors for poller worker %s", self.worker_id)
+            return
+
+        for handle in unowned:
+            del self._since_ids[handle]
+
+    def since_id(self, handle: str) -> Optional[int]:
+        """The ID of the newest tweet seen for the handle or None if it hasn't been polled."""
+        return self._since_ids.get(handle.lower())
+
+    def update_since_id(self, handle: str, since_id: int) -> None:
+        """Update the newest tweet ID seen for the handle, cursors are never moved backwards."""
+        current = self.since_id(handle)
+        if current is not None and current >= since_id:
+            return
+
+        self._since_ids[handle.lower()] = since_id
+        self._dirty[handle.lower()] = since_id
+
+    def commit(self) -> None:
+        """Writes every buffered cursor update, they are kept to be tried again on failure."""
+        if not self._dirty:
+            return
+
+        try:
+            dbapi.advance_poller_cursors(self.worker_id, self._dirty)
+        except Exception:
+            logger.exception("Unable to advance the cursors for poller worker %s", self.worker_id)
+            return
+
+        self._dirty = {}
+
+    def close(self) -> None:
+        """Writes any buffered cursor updates, the cursors are released when the worker leaves."""
+        self.commit()
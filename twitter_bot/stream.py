@@ -0,0 +1,165 @@
+import re
+import queue
+import logging
+import threading
+from typing import Callable, List, Optional, Set
+
+import requests
+
+from api.filtered_stream import FilteredStreamClient
+from api.tweet import Tweet
+from api.twitter_funcs import build_search_queries
+from constants import TW_STREAM_RULE_MAX_LENGTH
+
+
+logger = logging.getLogger(__name__)
+
+RULE_TERM = re.compile(r"^from:(\w+)$")
+
+
+def rule_handles(value: str) -> Optional[Set[str]]:
+    """Returns the handles in a "from:a OR from:b" rule or None if the rule isn't one of ours."""
+    handles = set()
+
+    for term in value.split(" OR "):
+        match = RULE_TERM.match(term.strip())
+        if match is None:
+            return None
+        handles.add(match.group(1).lower())
+
+    return handles
+
+
+class TweetStream:
+    """
+    Receives the tweets of the watched handles from a single filtered stream connection.
+
+    A background thread holds the connection, reconnecting with Twitter's recommended backoff
+    whenever it is lost, and queues each tweet as it arrives. The stream's rules are kept in
+    line with the watched handles, rules are only changed for the handles that were added or
+    removed. Tweets posted while disconnected are not replayed by the stream, so the caller
+    should backfill every handle after each connection, see take_connected.
+    """
+
+    def __init__(
+        self,
+        client: Optional[FilteredStreamClient] = None,
+        on_change: Optional[Callable[[], None]] = None,
+        rule_max_length: int = TW_STREAM_RULE_MAX_LENGTH,
+    ):
+        """
+        Parameters:
+            client (FilteredStreamClient | None): the client used to reach the stream
+            on_change (Callable | None): called from the stream thread when a tweet is queued or
+                the stream connects
+            rule_max_length (int): the maximum length of a single rule
+        """
+        self.client = client or FilteredStreamClient()
+        self.on_change = on_change
+        self.rule_max_length = rule_max_length
+
+        self._tweets: "queue.Queue[Tweet]" = queue.Queue()
+        self._connected = threading.Event()
+        self._stopping = threading.Event()
+        self._synced_handles: Optional[Set[str]] = None
+        # Set while the rules may not match the last handles they were synced with
+        self.rules_dirty = False
+        self._network_backoff = 0.0
+        self._http_backoff = 0.0
+        self._thread = threading.Thread(target=self._listen, name="stream", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        # Closing the session interrupts a read that is blocked waiting for the next tweet
+        self.client.session.close()
+        self._thread.join(timeout=5)
+
+    def sync_rules(self, handles: List[str]) -> None:
+        """
+        Brings the stream's rules in line with the given handles.
+
+        Rules whose handles are all still watched are kept, the rest are deleted and the
+        handles that are no longer covered are packed into new rules. If the sync fails
+        rules_dirty stays set, so the caller knows to try again.
+        """
+        desired = {handle.lower() for handle in handles}
+        if desired == self._synced_handles and not self.rules_dirty:
+            return
+
+        self.rules_dirty = True
+
+        keep, delete = [], []
+        for rule in self.client.get_rules():
+            names = rule_handles(rule["value"])
+            if names and names <= desired:
+                keep.append(names)
+            else:
+                delete.append(rule["id"])
+
+        covered = set().union(*keep)
+        added = [
+            " OR ".join(f"from:{name}" for name in names)
+            for names in build_search_queries(sorted(desired - covered), self.rule_max_length)
+        ]
+
+        self.client.delete_rules(delete)
+        self.client.add_rules(added)
+        self._synced_handles = desired
+        self.rules_dirty = False
+
+        logger.info("Stream rules synced, %s added and %s deleted", len(added), len(delete))
+
+    def take_connected(self) -> bool:
+        """Returns True, once, after each time the stream (re)connects."""
+        if self._connected.is_set():
+            self._connected.clear()
+            return True
+
+        return False
+
+    def drain(self) -> List[Tweet]:
+        """Removes and returns every queued tweet."""
+        tweets = []
+
+        while True:
+            try:
+                tweets.append(self._tweets.get_nowait())
+            except queue.Empty:
+                return tweets
+
+    def _on_connect(self) -> None:
+        logger.info("Connected to the filtered stream")
+        self._network_backoff = self._http_backoff = 0.0
+        self._connected.set()
+        if self.on_change is not None:
+            self.on_change()
+
+    def _listen(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                for tweet in self.client.stream(on_connect=self._on_connect):
+                    self._tweets.put(tweet)
+                    if self.on_change is not None:
+                        self.on_change()
+
+                wait = 0.0
+            except requests.HTTPError as e:
+                # 429s back off from a minute, other errors from 5 seconds, doubling each time
+                too_many = e.response is not None and e.response.status_code == 429
+                initial = 60.0 if too_many else 5.0
+                self._http_backoff = min(max(self._http_backoff * 2, initial), 320.0)
+                wait = self._http_backoff
+            except requests.RequestException:
+                # Network errors back off linearly, by a quarter second at a time up to 16 seconds
+                self._network_backoff = min(self._network_backoff + 0.25, 16.0)
+                wait = self._network_backoff
+            except Exception:
+                logger.exception("Unexpected error reading the filtered stream")
+                wait = 5.0
+
+            if not self._stopping.is_set():
+                logger.warning("Lost the filtered stream connection, reconnecting in %.2fs", wait)
+                self._stopping.wait(wait)
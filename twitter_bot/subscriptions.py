@@ -0,0 +1,196 @@
+import json
+import time
+import select
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Set
+
+import psycopg2
+
+from api import db as dbapi
+from api.handle import Handle, Watcher
+from constants import (
+    DB_HOST,
+    DB_NAME,
+    DB_PASSWORD,
+    DB_USER,
+    SUBSCRIPTION_CHANNEL,
+    TW_LISTEN_KEEPALIVE_SECONDS,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class SubscriptionMap:
+    """
+    An in-memory map of the watched handles, kept up to date from Postgres notifications.
+
+    A background thread LISTENs for the notifications sent by the db_api whenever a handle is
+    watched or unwatched and applies each change to the map. The whole map is only reloaded
+    from the db_api when the listening connection is (re)established. Notifications received
+    while reloading are applied afterwards, in commit order, so none are lost.
+    """
+
+    def __init__(
+        self,
+        on_change: Optional[Callable[[], None]] = None,
+        channel: str = SUBSCRIPTION_CHANNEL,
+        keepalive_seconds: float = TW_LISTEN_KEEPALIVE_SECONDS,
+    ):
+        """
+        Parameters:
+            on_change (Callable | None): called from the listening thread after every change
+            channel (str): the notification channel written to by the db_api
+            keepalive_seconds (float): how often an idle connection is checked
+        """
+        self.on_change = on_change
+        self.channel = channel
+        self.keepalive_seconds = keepalive_seconds
+
+        # Chat IDs keyed by handle, only handles with at least one watcher are kept
+        self._watchers: Dict[str, Dict[str, Optional[int]]] = {}
+        # The chats in digest mode
+        self._digests: Set[str] = set()
+        self._version = 0
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._listen, name="subscriptions", daemon=True)
+
+    @property
+    def version(self) -> int:
+        """Increases whenever the map changes."""
+        with self._lock:
+            return self._version
+
+    @property
+    def ready(self) -> bool:
+        """True once the map has been loaded."""
+        return self._ready.is_set()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._thread.join()
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def handles(self) -> List[Handle]:
+        """Returns a copy of the watched handles, which is safe to use while the map changes."""
+        with self._lock:
+            snapshot = {name: dict(watchers) for name, watchers in self._watchers.items()}
+            digests = set(self._digests)
+
+        handles = []
+        for name in sorted(snapshot):
+            handle = Handle(None, name, None, None)
+            for chat_id, watcher_id in snapshot[name].items():
+                handle.add_watcher(Watcher(watcher_id, chat_id, digest=chat_id in digests))
+            handles.append(handle)
+
+        return handles
+
+    def _changed(self) -> None:
+        """Records a change; the lock must not be held."""
+        with self._lock:
+            self._version += 1
+
+        if self.on_change is not None:
+            self.on_change()
+
+    def _resync(self) -> None:
+        """Replaces the whole map with the subscriptions from the db_api."""
+        subscriptions = dbapi.get_subscriptions()
+        watchers = {
+            handle.name: {watcher.chat_id: watcher._id for watcher in handle.watchers}
+            for handle in subscriptions
+        }
+        digests = {
+            watcher.chat_id
+            for handle in subscriptions
+            for watcher in handle.watchers
+            if watcher.digest
+        }
+
+        with self._lock:
+            self._watchers = watchers
+            self._digests = digests
+
+        self._changed()
+
+    def _apply(self, payload: str) -> None:
+        """Applies a single change notification to the map."""
+        try:
+            change = json.loads(payload)
+        except ValueError:
+            logger.warning("Ignoring a malformed subscription notification: %s", payload)
+            return
+
+        event, handle, chat_id = change.get("event"), change.get("handle"), change.get("chatID")
+
+        with self._lock:
+            if event == "watch" and handle and chat_id:
+                self._watchers.setdefault(handle, {}).setdefault(chat_id, None)
+            elif event == "unwatch" and handle and chat_id:
+                watchers = self._watchers.get(handle, {})
+                watchers.pop(chat_id, None)
+                if not watchers:
+                    self._watchers.pop(handle, None)
+            elif event == "digest" and chat_id:
+                if change.get("digest"):
+                    self._digests.add(chat_id)
+                else:
+                    self._digests.discard(chat_id)
+            else:
+                # A handle without watchers isn't polled, so there's nothing to do
+                return
+
+        self._changed()
+
+    def _listen_once(self) -> None:
+        """Listens on a single connection until it fails or the map is stopped."""
+        conn = psycopg2.connect(host=DB_HOST, database=DB_NAME, user=DB_USER, password=DB_PASSWORD)
+
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f'LISTEN "{self.channel}";')
+
+                # The map is loaded after LISTEN so changes made while loading are still heard
+                self._resync()
+                self._ready.set()
+
+                while not self._stopping.is_set():
+                    readable, _, _ = select.select([conn], [], [], self.keepalive_seconds)
+
+                    if not readable:
+                        # Detects a connection that has silently gone away
+                        cur.execute("SELECT 1;")
+                        continue
+
+                    conn.poll()
+                    while conn.notifies:
+                        self._apply(conn.notifies.pop(0).payload)
+        finally:
+            conn.close()
+
+    def _listen(self) -> None:
+        backoff = 1.0
+
+        while not self._stopping.is_set():
+            started_at = time.monotonic()
+
+            try:
+                self._listen_once()
+            except Exception:
+                logger.exception("Lost the subscription notification connection, reconnecting")
+
+            if time.monotonic() - started_at > 60:
+                backoff = 1.0
+
+            self._stopping.wait(backoff)
+            backoff = min(backoff * 2, 60.0)